@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the temporal aggregation in aggHier.py on multi-year hourly data (m = 8760)
+
+Compares the old aggregation loop, which copied and reshaped the whole series once per level and built every date
+column with list indexing, with aggHier, which block sums each level from a finer one and slices the dates.
+
+Run from the top of the repository:  python -m benchmarks.benchAggHier
+
+"""
+import numpy as np
+import pandas as pd
+from lastprophet.aggHier import aggHier, aggLevels
+from benchmarks.benchReconcile import timeIt
+
+#%% The old aggregation loop
+def loopAggregate(y, m):
+    """
+    How aggHier used to aggregate, without the column naming that follows it
+    """
+    n = len(y.iloc[:,0])
+    mList = aggLevels(m, n)
+    aggs = {}
+    aggs[m] = y
+    for i in range(len(mList)):
+        start = n%m
+        fullPeriods = int(n/m)
+        temp = np.array(y.iloc[start:n, 1])
+        temp.shape = (fullPeriods*mList[i], int(m/mList[i]))
+        temporary = pd.DataFrame(y.iloc[list(range(start+int(m/mList[i] - 1), n, int(m/mList[i]))), 0])
+        temporary['y'] = temp.sum(axis = 1)
+        aggs[mList[i]] = temporary
+    return aggs
+
+def hourly(years, seed = 0):
+    n = 8760*years + 17
+    rng = np.random.RandomState(seed)
+    y = pd.DataFrame({"hour" : pd.date_range("2000-01-01", periods = n, freq = "H")})
+    y["load"] = rng.randint(100, 40000, size = n)
+    return y
+
+#%% Run
+if __name__ == "__main__":
+    print("%6s %9s %12s %12s %10s %6s" % ("years", "rows", "loop (s)", "aggHier (s)", "speedup", "same"))
+    for years in [2, 5, 10, 20]:
+        y = hourly(years)
+        loopTime, loopOut = timeIt(lambda: loopAggregate(y, 8760))
+        newTime, newOut = timeIt(lambda: aggHier(y, 8760))
+        same = all(np.array_equal(loopOut[key].iloc[:, 1].values, newOut[key].iloc[:, 1].values) for key in loopOut.keys())
+        print("%6d %9d %12.4f %12.4f %9.1fx %6s" % (years, len(y), loopTime, newTime, loopTime/newTime, same))
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the base forecaster backends on hourly data (m = 168 and m = 8760)
+
+fitProphet is run with Prophet on every level, with Prophet on the top and bottom levels and the Fourier backend in
+between, and with only the NumPy backends.  The reconciled (OLS) forecasts of the mixed and NumPy configurations are
+compared with the all Prophet ones at the original frequency.
+
+Needs fbprophet.  Run from the top of the repository:  python -m benchmarks.benchBackends
+
+"""
+import os
+import contextlib
+import numpy as np
+from lastprophet.aggHier import aggHier
+from lastprophet.fitProphet import fitProphet
+from lastprophet.reconcile import reconcile
+from benchmarks.benchAggHier import hourly
+from benchmarks.benchReconcile import timeIt
+
+#%% Run
+if __name__ == "__main__":
+    args = (True, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+    print("%6s %8s %10s %12s %10s %14s" % ("m", "levels", "backend", "fit (s)", "speedup", "mean abs diff"))
+    for m in [168, 8760]:
+        y = hourly(2).iloc[17:]
+        if m == 168:
+            y = y.iloc[:168*8]
+        aggs = aggHier(y, m)
+        configs = [("prophet", "prophet"), ("mixed", {1 : "prophet", m : "prophet", "default" : "fourier"}), \
+                   ("fourier", "fourier"), ("naive", "naive")]
+        baseline = None
+        for name, backend in configs:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                fitTime, (fcst, mse, resids) = timeIt(lambda: fitProphet(aggs, m, *args, backend = backend), 1)
+            yhat = reconcile(fcst, m, mse, resids, "OLS")[m].yhat.values[-m:]
+            if baseline is None:
+                baseline = (fitTime, yhat)
+            print("%6d %8d %10s %12.3f %9.1fx %14.4g" % (m, len(aggs), name, fitTime, baseline[0]/fitTime, \
+                  np.mean(np.abs(yhat - baseline[1]))))
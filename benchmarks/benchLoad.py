@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of serving forecasts from a saved LastForecaster instead of running lastF for every request
+
+A forecaster is fit once on each M3 monthly series and saved.  For every series this reports the size of the saved
+file, the cold start (a fresh Python process that imports lastprophet and loads the file), loading it again in the
+same process, predicting a few horizons from the loaded forecaster, and running lastF for the same horizons the way
+every request used to.
+
+Needs fbprophet.  Run from the top of the repository:  python -m benchmarks.benchLoad
+
+"""
+import os
+import sys
+import tempfile
+import subprocess
+import contextlib
+from lastprophet.last import lastF
+from lastprophet.forecaster import LastForecaster
+from benchmarks.benchReconcile import timeIt
+from benchmarks.benchWarmStart import m3Monthly
+
+COLD = "import time; start = time.perf_counter(); from lastprophet.forecaster import LastForecaster; " + \
+       "LastForecaster.load(%r); print(time.perf_counter() - start)"
+
+#%% Run
+if __name__ == "__main__":
+    horizons = [12, 24, 36]
+    print("%8s %10s %12s %10s %14s %14s %8s" % ("series", "size (KB)", "cold (s)", "load (s)", "predict (s)", "lastF (s)", "speedup"))
+    with tempfile.TemporaryDirectory() as directory:
+        for number, y in enumerate(m3Monthly()):
+            path = os.path.join(directory, "forecaster%d.pkl" % number)
+            forecaster = LastForecaster(m = 12, h = 12, comb = "OLS")
+            forecaster.fit(y)
+            forecaster.save(path)
+            cold = float(subprocess.check_output([sys.executable, "-c", COLD % path]).decode().split()[-1])
+            loadTime, loaded = timeIt(lambda: LastForecaster.load(path))
+            predictTime = sum(timeIt(lambda: loaded.predict(h), 1)[0] for h in horizons)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                refitTime = sum(timeIt(lambda: lastF(y, m = 12, h = h, comb = "OLS"), 1)[0] for h in horizons)
+            print("%8d %10.1f %12.3f %10.4f %14.4f %14.3f %7.1fx" % (number, os.path.getsize(path)/1024, cold, loadTime, \
+                  predictTime, refitTime, refitTime/(loadTime + predictTime)))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the NumPy MAP engine (backend = "map") against Prophet's Stan fit of the same model
+
+fitProphet is run on every level with Prophet and with the map backend, on the M3 monthly series (m = 12), six weeks of
+hourly data (m = 168) and a year of hourly data (m = 8760).  For each it reports the fit time of every level, the
+speedup, the largest in-sample difference in yhat (relative to the level's largest value), the smallest gap between
+the log posterior the map fit reaches and the one Prophet's optimiser stops at (positive when the map fit is the
+better mode on every level that has one, levels with fewer observations than coefficients are fit exactly and have
+no mode, see mapEngine.solveMAP) and the mean absolute difference of the reconciled (OLS) forecasts at the original frequency.
+
+Needs fbprophet.  Run from the top of the repository:  python -m benchmarks.benchMapEngine
+
+"""
+import os
+import contextlib
+import numpy as np
+from lastprophet.aggHier import aggHier
+from lastprophet.fitProphet import fitProphet
+from lastprophet.reconcile import reconcile
+from lastprophet.mapEngine import OPTIONS, levelProblem, paramsTheta, logPosterior
+from benchmarks.benchAggHier import hourly
+from benchmarks.benchReconcile import timeIt
+from benchmarks.benchWarmStart import m3Monthly
+
+#%% Run
+if __name__ == "__main__":
+    args = (True, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+    cases = [("M3 %d" % number, 12, y) for number, y in enumerate(m3Monthly(3))]
+    cases.append(("hourly", 168, hourly(1).iloc[17:17 + 168*6]))
+    cases.append(("hourly", 8760, hourly(2).iloc[17:]))
+    options = dict(zip(OPTIONS, args[1:]))
+    print("%8s %6s %8s %12s %10s %10s %16s %16s %14s" % ("series", "m", "levels", "prophet (s)", "map (s)", "speedup", \
+                                                        "in-sample diff", "posterior gap", "mean abs diff"))
+    for name, m, y in cases:
+        aggs = aggHier(y, m)
+        prophetParams = {}
+        mapParams = {}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            prophetTime, prophetFit = timeIt(lambda: fitProphet(aggs, m, *args, params = prophetParams), 1)
+        mapTime, mapFit = timeIt(lambda: fitProphet(aggs, m, *args, params = mapParams, backend = "map"))
+        gap = np.inf
+        for key in aggs.keys():
+            data = aggs[key].rename(columns = {aggs[key].columns[0] : 'ds', aggs[key].columns[1] : 'y'})
+            problem = levelProblem(data, aggs[key].columns[0], 1, options)
+            if problem["n"] <= len(problem["xty"]):
+                continue
+            gap = min(gap, logPosterior(problem, paramsTheta(problem, mapParams[key]), mapParams[key]["sigma_obs"]) - \
+                           logPosterior(problem, paramsTheta(problem, prophetParams[key]), prophetParams[key]["sigma_obs"]))
+        inSample = max(np.max(np.abs(mapFit[0][key].yhat.values[:len(aggs[key])] - prophetFit[0][key].yhat.values[:len(aggs[key])])) / \
+                       np.max(np.abs(aggs[key].iloc[:, 1].values)) for key in aggs.keys())
+        prophetYhat = reconcile(prophetFit[0], m, prophetFit[1], prophetFit[2], "OLS")[m].yhat.values[-m:]
+        mapYhat = reconcile(mapFit[0], m, mapFit[1], mapFit[2], "OLS")[m].yhat.values[-m:]
+        print("%8s %6d %8d %12.3f %10.3f %9.1fx %16.2e %16.4g %14.4g" % (name, m, len(aggs), prophetTime, mapTime, \
+              prophetTime/mapTime, inSample, gap, np.mean(np.abs(mapYhat - prophetYhat))))
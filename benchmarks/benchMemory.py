@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Memory benchmark of the lastF data flow on multi-year hourly data (m = 8760), measured with tracemalloc
+
+Every stage except the Prophet fits is run twice, the way it used to be done and the way it is done now, and the
+peak memory allocated during the stage is reported:
+
+    aggregate - the old loop (a copy of the series per level) against aggArrays/aggHier (read only arrays, the
+                seasonal level shares the series)
+    fit input - the two rename calls fitProphet used to make per level, each a full copy, against one rename that
+                shares the arrays of the level
+    boxcox    - copying every level into placeHold and back against transformLevels, which makes new level arrays
+    reconcile - deep copying the base forecasts (needed to reconcile them more than once) against the copy on
+                write frames reconcile returns now.  The projection is built before it is measured
+    result    - the memory held by the reconciled forecasts, as DataFrames against lastF's compact result (ds and yhat)
+
+Run from the top of the repository:  python -m benchmarks.benchMemory
+
+"""
+import tracemalloc
+import numpy as np
+import pandas as pd
+from scipy.stats import boxcox
+from lastprophet.aggHier import aggArrays, levelFrame
+from lastprophet.transform import transformLevels
+from lastprophet.reconcile import reconcile, getProjection
+from lastprophet.results import LastResult
+from benchmarks.benchAggHier import loopAggregate, hourly
+
+#%% Measure
+def peakMemory(func):
+    """
+    Run func and return its output and the peak memory (MB) allocated while it ran
+    """
+    tracemalloc.start()
+    out = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, peak/2**20
+
+#%% The old and new stages
+def oldFitInput(aggs):
+    frames = {}
+    for key in aggs.keys():
+        df = aggs[key].rename(columns = {aggs[key].columns[0] : 'ds'})
+        frames[key] = df.rename(columns = {df.columns[1] : 'y'})
+    return frames
+
+def newFitInput(aggs):
+    return {key : aggs[key].rename(columns = {aggs[key].columns[0] : 'ds', aggs[key].columns[1] : 'y'}, copy = False) for key in aggs.keys()}
+
+def oldBoxCox(aggs):
+    boxcoxT = [None]*(len(aggs.keys()))
+    i = 0
+    placeHold = []
+    for key in sorted(aggs.keys()):
+        placeHold.append(aggs[key].copy())
+        placeHold[i].iloc[:, 1], boxcoxT[i] = boxcox(placeHold[i].iloc[:, 1])
+        i += 1
+    i = 0
+    for key in sorted(aggs.keys()):
+        aggs[key] = placeHold[i]
+        i += 1
+    return aggs, boxcoxT
+
+def newBoxCox(levels):
+    levels, boxcoxT, fellBack = transformLevels(levels)
+    return {key : levelFrame(levels[key]) for key in levels.keys()}, boxcoxT
+
+def prophetForecasts(aggs, h, m, columns = 15, seed = 0):
+    """
+    Frames shaped like Prophet's output with include_history: ds, yhat and the trend, seasonal and interval columns
+    """
+    rng = np.random.RandomState(seed)
+    forecastsDict = {}
+    for key in aggs.keys():
+        rows = len(aggs[key]) + int(h/m)*key
+        frame = pd.DataFrame(rng.rand(rows, columns)*(m/key), columns = ["col" + str(i) for i in range(columns)])
+        frame.insert(0, "ds", pd.date_range("2000-01-01", periods = rows, freq = "H"))
+        frame["yhat"] = rng.rand(rows)*(m/key)
+        forecastsDict[key] = frame
+    return forecastsDict
+
+#%% Run
+if __name__ == "__main__":
+    m = 8760
+    y = hourly(5)
+    y["load"] = y["load"].astype(float)
+    results = []
+    ##
+    # Aggregate
+    ##
+    oldAggs, oldPeak = peakMemory(lambda: loopAggregate(y, m))
+    levels, newPeak = peakMemory(lambda: aggArrays(y, m))
+    results.append(("aggregate", oldPeak, newPeak))
+    newAggs = {key : levelFrame(levels[key]) for key in levels.keys()}
+    ##
+    # Fit input
+    ##
+    oldPeak = peakMemory(lambda: oldFitInput(oldAggs))[1]
+    newPeak = peakMemory(lambda: newFitInput(newAggs))[1]
+    results.append(("fit input", oldPeak, newPeak))
+    ##
+    # BoxCox
+    ##
+    oldPeak = peakMemory(lambda: oldBoxCox(dict(oldAggs)))[1]
+    newPeak = peakMemory(lambda: newBoxCox(dict(levels)))[1]
+    results.append(("boxcox", oldPeak, newPeak))
+    ##
+    # Reconcile
+    ##
+    forecastsDict = prophetForecasts(newAggs, m, m)
+    getProjection(list(forecastsDict.keys()), "OLS")
+    oldPeak = peakMemory(lambda: reconcile({key : frame.copy() for key, frame in forecastsDict.items()}, m, None, None, "OLS"))[1]
+    newPeak = peakMemory(lambda: reconcile(forecastsDict, m, None, None, "OLS"))[1]
+    results.append(("reconcile", oldPeak, newPeak))
+    ##
+    # What is kept of the result, the full frames or the compact arrays (see results.py)
+    ##
+    newDict = reconcile(forecastsDict, m, None, None, "OLS")
+    oldHeld = sum(frame.memory_usage(deep = True).sum() for frame in newDict.values())/2**20
+    newHeld = LastResult.fromForecasts(newDict).nbytes/2**20
+    results.append(("result", oldHeld, newHeld))
+    print("%d hourly observations, %d aggregation levels" % (len(y), len(levels)))
+    print("%10s %14s %14s %8s" % ("stage", "before (MB)", "now (MB)", "ratio"))
+    for stage, oldPeak, newPeak in results:
+        print("%10s %14.1f %14.1f %7.1fx" % (stage, oldPeak, newPeak, oldPeak/max(newPeak, 1e-6)))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the projection step at the end of reconcile across forecast horizons
+
+Compares the old per-year loop (one np.dot per forecast year) with the batched product that writes each level
+straight into its yhat view, for the same betaEst.  The structured solver is timed as well for reference.
+
+Run from the top of the repository:  python -m benchmarks.benchProjection
+
+"""
+import numpy as np
+from lastprophet.reconcile import summingMat, Projection
+from benchmarks.benchReconcile import factors, timeIt
+
+#%% The two ways of applying betaEst
+def loopProjection(betaEst, hatMat):
+    """
+    How reconcile used to apply betaEst, one forecast year at a time
+    """
+    newMat = np.empty([hatMat.shape[0], betaEst.shape[0]])
+    for i in range(hatMat.shape[0]):
+        newMat[i,:] = np.dot(betaEst, np.transpose(hatMat[i,:]))
+    return newMat
+
+def batchedProjection(betaEst, hatMat, outs):
+    """
+    How reconcile applies betaEst now, one product per level written into that level's view
+    """
+    prevKey = 0
+    for out in outs:
+        np.dot(hatMat, np.transpose(betaEst[prevKey:prevKey+out.shape[1]]), out = out)
+        prevKey += out.shape[1]
+    return outs
+
+#%% Run
+if __name__ == "__main__":
+    print("%6s %7s %12s %12s %10s %12s" % ("m", "years", "loop (s)", "batched (s)", "speedup", "struct (s)"))
+    for m in [12, 52, 365]:
+        freqs = factors(m)
+        sumMat = summingMat(freqs)
+        betaEst = np.dot(np.dot(sumMat, np.linalg.inv(np.dot(np.transpose(sumMat), sumMat))), np.transpose(sumMat))
+        projection = Projection(freqs, "OLS")
+        for years in [1, 10, 100, 1000]:
+            hatMat = np.random.rand(years, sum(freqs))
+            yhats = [np.empty(years*freq) for freq in freqs]
+            outs = [yhat.reshape((years, freq)) for yhat, freq in zip(yhats, freqs)]
+            loopTime, loopOut = timeIt(lambda: loopProjection(betaEst, hatMat))
+            batchTime, batchOut = timeIt(lambda: batchedProjection(betaEst, hatMat, outs))
+            strTime, strOut = timeIt(lambda: projection.apply(hatMat, outs))
+            print("%6d %7d %12.5f %12.5f %9.1fx %12.5f" % (m, years, loopTime, batchTime, loopTime/batchTime, strTime))
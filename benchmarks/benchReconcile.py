@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the reconciliation solvers in reconcile.py
+
+Compares the explicit inverse solver (solver = "inv") with the structured banded plus low rank solver (solver = "structured")
+for m in {12, 52, 365, 8760} and checks that both give the same forecasts.  The dense inverse path forms the (n x n)
+betaEst, which for m = 8760 is several gigabytes, so above 365 the inverse solver is run with the sparse summing matrix.
+
+Run from the top of the repository:  python -m benchmarks.benchReconcile
+
+"""
+import copy
+import time
+import numpy as np
+import pandas as pd
+from lastprophet.reconcile import reconcile
+
+#%% Synthetic base forecasts
+def factors(m):
+    return [i for i in range(1, m+1) if m % i == 0]
+
+def baseForecasts(m, h, seed = 0):
+    """
+    Build a dictionary of forecast DataFrames and mse values that look like the output of fitProphet
+    """
+    rng = np.random.RandomState(seed)
+    forecastsDict = {}
+    mse = {}
+    for key in factors(m):
+        periods = int(h/m)*key
+        forecastsDict[key] = pd.DataFrame({"yhat" : rng.rand(2*key + periods)*100*(m/key)})
+        mse[key] = rng.rand() + 0.1
+    return forecastsDict, mse
+
+def timeIt(func, repeat = 3):
+    best = np.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+#%% Run
+if __name__ == "__main__":
+    print("%6s %5s %12s %12s %10s %12s" % ("m", "comb", "inv (s)", "struct (s)", "speedup", "max rel diff"))
+    for m in [12, 52, 365, 8760]:
+        repeat = 1 if m > 365 else 3
+        for comb in ["OLS", "WLSS", "WLSV"]:
+            forecastsDict, mse = baseForecasts(m, m)
+            invTime, invOut = timeIt(lambda: reconcile(copy.deepcopy(forecastsDict), m, mse, None, comb, solver = "inv"), repeat)
+            strTime, strOut = timeIt(lambda: reconcile(copy.deepcopy(forecastsDict), m, mse, None, comb, solver = "structured"), repeat)
+            diff = max(np.max(np.abs(invOut[key].yhat.values - strOut[key].yhat.values)/np.abs(invOut[key].yhat.values)) for key in invOut.keys())
+            print("%6d %5s %12.4f %12.4f %9.1fx %12.2e" % (m, comb, invTime, strTime, invTime/strTime, diff))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the cost model scheduler on the levels of one hourly series (m = 8760, 32 levels)
+
+The levels are fit in a process pool in the order of aggs (one task each, how fitProphet used to send them) and then
+with scheduler.scheduleTasks (longest first, small levels packed together), first from the cost model and then from
+the seconds each level took the first time (scheduler.learnedCosts).  The predicted cost and the seconds each level
+took are compared with scheduler.calibrate, the levels the model is furthest off on are listed at the end.
+
+Needs fbprophet.  Run from the top of the repository:  python -m benchmarks.benchScheduler
+
+"""
+import os
+import time
+import contextlib
+from lastprophet.aggHier import aggHier
+from lastprophet.parallel import mapTasks
+from lastprophet.fitProphet import levelTasks, fitLevel
+from lastprophet.scheduler import taskCost, packChunks, scheduleTasks, learnedCosts, calibrate
+from benchmarks.benchAggHier import hourly
+
+#%% Run
+if __name__ == "__main__":
+    m = 8760
+    n_jobs = min(4, os.cpu_count() or 1)
+    aggs = aggHier(hourly(2).iloc[17:], m)
+    args = (None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+    tasks = levelTasks(aggs, m, True, *args)
+    costs = [taskCost(task) for task in tasks]
+    print("%d levels, %d workers, %d chunks\n" % (len(tasks), n_jobs, len(packChunks(costs, n_jobs))))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        mapTasks(fitLevel, tasks, "process", n_jobs)
+        inOrder = time.perf_counter() - start
+        report = []
+        start = time.perf_counter()
+        scheduleTasks(fitLevel, tasks, costs, "process", n_jobs, report)
+        scheduled = time.perf_counter() - start
+        timed = {task[0] : level for task, level in zip(tasks, report)}
+        start = time.perf_counter()
+        scheduleTasks(fitLevel, tasks, learnedCosts([task[0] for task in tasks], costs, timed), "process", n_jobs)
+        learned = time.perf_counter() - start
+    print("%20s %12s" % ("", "wall (s)"))
+    print("%20s %12.2f" % ("order of aggs", inOrder))
+    print("%20s %12.2f" % ("cost model", scheduled))
+    print("%20s %12.2f" % ("learned costs", learned))
+    secondsPerUnit, ratios = calibrate(timed)
+    print("\n%.3g seconds per unit of predicted cost\n" % secondsPerUnit)
+    print("%8s %8s %14s %12s %14s %8s" % ("level", "rows", "predicted", "actual (s)", "predicted (s)", "ratio"))
+    for task, level in sorted(zip(tasks, report), key = lambda pair: -abs(ratios[pair[0][0]] - 1))[:10]:
+        print("%8d %8d %14.0f %12.3f %14.3f %8.2f" % (task[0], len(task[1]), level["predicted"], level["actual"], \
+              secondsPerUnit*level["predicted"], ratios[task[0]]))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of warm starting Prophet at rolling forecast origins
+
+Runs lastF on M3 monthly series at a number of origins one month apart, the way predDJIA.py evaluates forecasts.
+Each origin is fit once cold (Prophet's usual starting values) and once warm, starting every level from the
+parameters fitted at the previous origin (the init and params inputs of lastF).  Stan prints the progress of its
+optimiser straight to the process's stdout, so it is captured at the file descriptor and the last iteration number of
+every fit is added up.  The largest absolute difference between the cold and warm forecasts is reported as well.
+
+Needs fbprophet.  Run from the top of the repository:  python -m benchmarks.benchWarmStart
+
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+from lastprophet.last import lastF
+from lastprophet.profiling import captureStan
+
+#%% Count optimiser iterations
+def stanIterations(func):
+    """
+    Run func and return its output and the number of iterations Stan reported, summed over every fit it made
+    """
+    record = {}
+    with captureStan(record):
+        out = func()
+    return out, record["iterations"] or 0
+
+def m3Monthly(series = 5, minLength = 120):
+    """
+    The longest few M3 monthly series as two column DataFrames
+    """
+    m3 = pd.read_csv(os.path.join("lastprophet", "instructional", "M3CM.csv"))
+    m3 = m3[m3.N >= minLength].iloc[:series]
+    out = []
+    for i in range(len(m3)):
+        values = m3.iloc[i, 6:].dropna().values.astype(float)
+        out.append(pd.DataFrame({"month" : pd.date_range("1990-01-31", periods = len(values), freq = "M"), "y" : values}))
+    return out
+
+#%% Run
+if __name__ == "__main__":
+    origins = 6
+    print("%8s %7s %12s %12s %10s %10s %14s" % ("series", "origin", "cold iters", "warm iters", "cold (s)", "warm (s)", "max abs diff"))
+    totals = np.zeros(4)
+    for number, y in enumerate(m3Monthly()):
+        init = None
+        for origin in range(len(y) - origins, len(y)):
+            train = y.iloc[:origin].copy()
+            start = time.perf_counter()
+            cold, coldIters = stanIterations(lambda: lastF(train.copy(), m = 12, h = 12, comb = "WLSS"))
+            coldTime = time.perf_counter() - start
+            params = {}
+            start = time.perf_counter()
+            warm, warmIters = stanIterations(lambda: lastF(train.copy(), m = 12, h = 12, comb = "WLSS", init = init, params = params))
+            warmTime = time.perf_counter() - start
+            diff = max(np.max(np.abs(cold[key].yhat.values - warm[key].yhat.values)) for key in cold.keys())
+            ##
+            # The first origin has nothing to start from, so it is only used to get the params for the next one
+            ##
+            if init is not None:
+                totals += [coldIters, warmIters, coldTime, warmTime]
+                print("%8d %7d %12d %12d %10.3f %10.3f %14.4g" % (number, origin, coldIters, warmIters, coldTime, warmTime, diff))
+            init = params
+    print("%16s %12d %12d %10.3f %10.3f" % ("total", totals[0], totals[1], totals[2], totals[3]))
+    print("Warm starting took %.1f%% fewer iterations" % (100*(1 - totals[1]/max(totals[0], 1))))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of a warm WorkerPool against starting a process pool in every lastF call
+
+Each M3 monthly series is forecast with executor = "serial", with executor = "process" (a new pool for the call), with
+a new pool of spawned processes for the call (what "process" is on Windows and macOS, every worker imports fbprophet
+and loads Stan again, where forked workers inherit what this process has already loaded) and with one WorkerPool kept
+for all of them.  The overhead per fit
+is the time over the serial run divided by the number of levels fit, so the saving is what the WorkerPool takes off
+every fit.  The sizes of one level's messages are also shown, pickled DataFrames against the arrays of packFrame and
+LevelResult.
+
+Needs fbprophet.  Run from the top of the repository:  python -m benchmarks.benchWorkers
+
+"""
+import os
+import time
+import pickle
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from lastprophet.last import lastF
+from lastprophet.aggHier import aggHier
+from lastprophet.fitProphet import fitLevel
+from lastprophet.workers import WorkerPool, packFrame, packForecasts
+from benchmarks.benchReconcile import timeIt
+from benchmarks.benchWarmStart import m3Monthly
+
+#%% Run
+if __name__ == "__main__":
+    n_jobs = 2
+    series = list(m3Monthly())
+    start = time.perf_counter()
+    pool = WorkerPool(n_jobs = n_jobs)
+    startup = time.perf_counter() - start
+    print("WorkerPool of %d warm workers started in %.2f s\n" % (n_jobs, startup))
+    print("%8s %6s %12s %14s %14s %14s %16s %16s %16s" % ("series", "fits", "serial (s)", "process (s)", "spawned (s)", \
+          "workers (s)", "process/fit (s)", "spawned/fit (s)", "workers/fit (s)"))
+    with pool, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        rows = []
+        for number, y in enumerate(series):
+            fits = len(aggHier(y, 12))
+            serialTime = timeIt(lambda: lastF(y, m = 12, h = 12), 1)[0]
+            processTime = timeIt(lambda: lastF(y, m = 12, h = 12, executor = "process", n_jobs = n_jobs), 1)[0]
+            start = time.perf_counter()
+            with ProcessPoolExecutor(n_jobs, mp_context = multiprocessing.get_context("spawn")) as spawned:
+                lastF(y, m = 12, h = 12, executor = spawned)
+            spawnedTime = time.perf_counter() - start
+            workersTime = timeIt(lambda: lastF(y, m = 12, h = 12, executor = pool), 1)[0]
+            rows.append((number, fits, serialTime, processTime, spawnedTime, workersTime))
+    for number, fits, serialTime, processTime, spawnedTime, workersTime in rows:
+        print("%8d %6d %12.3f %14.3f %14.3f %14.3f %16.3f %16.3f %16.3f" % (number, fits, serialTime, processTime, spawnedTime, \
+              workersTime, (processTime - serialTime)/fits, (spawnedTime - serialTime)/fits, (workersTime - serialTime)/fits))
+    ##
+    # The messages of the bottom level of the first series
+    ##
+    aggs = aggHier(series[0], 12)
+    task = (12, aggs[12], 12, True, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        key, fcst, mse, resids, params, records = fitLevel(*task)
+    print("\n%10s %16s %16s" % ("message", "DataFrame (B)", "arrays (B)"))
+    print("%10s %16d %16d" % ("level", len(pickle.dumps(aggs[12])), len(pickle.dumps(packFrame(aggs[12])))))
+    print("%10s %16d %16d" % ("forecast", len(pickle.dumps(fcst)), len(pickle.dumps(packForecasts({key : fcst})[key]))))
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of every stage of lastF, for every seasonal period the package ships a calendar for
+
+Each case is a seasonal period m, a history length (in whole seasonal periods) and a horizon (also in seasonal
+periods).  Quarterly (m = 4) and monthly (m = 12) cases use the bundled M3 series (instructional/M3CQ.csv and M3CM.csv),
+the rest use synthetic series with a trend, a seasonal cycle and noise, so the suite runs offline and gives the same
+data every time.  For every case these stages are measured:
+
+    aggregate  - aggArrays
+    transform  - transformLevels (BoxCox with a lambda per level)
+    reconcile  - reconcile of synthetic base forecasts for each comb, with an empty projection cache so the
+                 factorisation is included
+    fit        - fitProphet of every level with lastF's defaults, and predicting only the periods ahead (needs fbprophet)
+    lastF      - the whole of lastF with comb = "OLS" (needs fbprophet)
+
+The best wall time of a few runs, its CPU time, the throughput (observations of y per second) and the peak memory of
+one more run under tracemalloc are reported.  Prophet takes a long time on long hourly series, so fit and lastF are
+only run on cases with at most --fitRows observations.
+
+Results can be saved as JSON together with the commit and library versions they were measured on, and compared
+against an earlier file to track regressions.  A case is a regression if its wall time or peak memory grew by more
+than --threshold (the ratio), and the exit status is 1 if there are any, so it can be used in CI.
+
+Run from the top of the repository:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --m 12 52 --stages aggregate reconcile
+    python -m benchmarks.suite --save benchmarks/results/baseline.json
+    python -m benchmarks.suite --compare benchmarks/results/baseline.json
+
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+import scipy
+from lastprophet.aggHier import aggArrays, levelFrame
+from lastprophet.transform import transformLevels
+from lastprophet.reconcile import reconcile, clearProjectionCache
+from lastprophet.frequencies import getCalendar
+from lastprophet.profiling import measure
+from benchmarks.benchMemory import prophetForecasts
+
+PERIODS = [4, 12, 52, 365, 252, 168, 24, 8760]
+HISTORIES = [2, 4, 8]
+HORIZONS = [1, 2]
+STAGES = ["aggregate", "transform", "reconcile", "fit", "lastF"]
+COMBS = ["BU", "OLS", "WLSS", "WLSV"]
+M3 = {4 : "M3CQ.csv", 12 : "M3CM.csv"}
+
+#%% Data
+def benchSeries(m, periods, seed = 0):
+    """
+    Parameters
+    ----------
+
+    m - (int) the seasonal period
+
+    periods - (int) the number of seasonal periods of history
+
+    seed - (int) seed of the synthetic series
+
+    Returns
+    ----------
+
+    y - (DataFrame) two columns, the time instances and the series, periods*m long
+
+    source - (String) where the values came from, the M3 series name or "synthetic"
+    """
+    n = periods*m
+    dates = pd.date_range("2000-01-01", periods = n, freq = getCalendar(m)["base"])
+    if m in M3:
+        m3 = pd.read_csv(os.path.join("lastprophet", "instructional", M3[m]))
+        m3 = m3[m3.N >= n]
+        if len(m3) > 0:
+            values = m3.iloc[0, 6:6+n].values.astype(float)
+            return pd.DataFrame({"ds" : dates, "y" : values}), m3.iloc[0, 0].strip()
+    rng = np.random.RandomState(seed)
+    t = np.arange(n)
+    values = 1000 + 0.01*t + 200*np.sin(2*np.pi*t/m) + rng.randn(n)*20
+    return pd.DataFrame({"ds" : dates, "y" : values}), "synthetic"
+
+#%% Stages
+def stageRuns(stage, y, m, h):
+    """
+    Parameters
+    ----------
+
+    stage - (String) one of STAGES
+
+    y, m, h - the case
+
+    Returns
+    ----------
+
+    runs - (list) (name, function) of every benchmark of the stage.  Anything the stage needs (the aggregated levels,
+            base forecasts) is made beforehand so it isn't measured
+    """
+    if stage == "aggregate":
+        return [("aggregate", lambda: aggArrays(y, m))]
+    levels = aggArrays(y, m)
+    if stage == "transform":
+        return [("transform", lambda: transformLevels(levels))]
+    aggs = {key : levelFrame(levels[key]) for key in levels.keys()}
+    if stage == "reconcile":
+        forecastsDict = prophetForecasts(aggs, h, m)
+        mse = {key : 1.0 + 1.0/key for key in aggs.keys()}
+        def reconcileRun(comb):
+            def run():
+                clearProjectionCache()
+                return reconcile(forecastsDict, h, mse, None, comb)
+            return run
+        return [("reconcile " + comb, reconcileRun(comb)) for comb in COMBS]
+    ##
+    # Prophet is only imported here so the other stages run without it
+    ##
+    from lastprophet.fitProphet import fitProphet
+    from lastprophet.last import lastF
+    if stage == "fit":
+        args = (None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+        return [("fit", lambda: fitProphet(aggs, h, True, *args)), \
+                ("fit future only", lambda: fitProphet(aggs, h, False, *args, residuals = False))]
+    return [("lastF", lambda: lastF(y, m = m, h = h, comb = "OLS"))]
+
+def benchmark(func, repeat = 3, memory = True):
+    """
+    Parameters
+    ----------
+
+    func - (function) what to measure
+
+    repeat - (int) the number of timed runs, the best is kept
+
+    memory - (Boolean) run once more under tracemalloc for the peak memory
+
+    Returns
+    ----------
+
+    record - (dict) wall and cpu (seconds) of the fastest run, and peak (bytes) if memory
+    """
+    best = None
+    for i in range(repeat):
+        with measure("run") as record:
+            func()
+        if best is None or record["wall"] < best["wall"]:
+            best = record
+    result = {"wall" : best["wall"], "cpu" : best["cpu"]}
+    if memory:
+        tracemalloc.start()
+        try:
+            with measure("run") as record:
+                func()
+        finally:
+            tracemalloc.stop()
+        result["peak"] = record["peak"]
+    return result
+
+def runSuite(mList = PERIODS, histories = HISTORIES, horizons = HORIZONS, stages = STAGES, repeat = 3, memory = True, \
+             fitRows = 5000, log = print):
+    """
+    Parameters
+    ----------
+
+    mList, histories, horizons, stages - the cases to run, see the top of the file
+
+    repeat - (int) timed runs of each case, fit and lastF are only run once
+
+    memory - (Boolean) measure peak memory as well
+
+    fitRows - (int) the largest series fit and lastF are run on
+
+    log - (function) called with a line of text for every case
+
+    Returns
+    ----------
+
+    results - (list of dicts) one per case and stage
+    """
+    if "fit" in stages or "lastF" in stages:
+        try:
+            import fbprophet
+        except ImportError:
+            log("fbprophet isn't installed, so fit and lastF are skipped")
+            stages = [stage for stage in stages if stage not in ["fit", "lastF"]]
+    results = []
+    for m in mList:
+        for periods in histories:
+            y, source = benchSeries(m, periods)
+            for horizon in horizons:
+                h = horizon*m
+                for stage in stages:
+                    if stage in ["fit", "lastF"] and len(y) > fitRows:
+                        continue
+                    for name, func in stageRuns(stage, y, m, h):
+                        times = 1 if stage in ["fit", "lastF"] else repeat
+                        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                            record = benchmark(func, times, memory)
+                        record.update({"stage" : name, "m" : m, "periods" : periods, "h" : h, "rows" : len(y), "source" : source})
+                        record["throughput"] = len(y)/max(record["wall"], 1e-12)
+                        results.append(record)
+                        log(formatRecord(record))
+    return results
+
+#%% Reporting and regressions
+def caseKey(record):
+    return "%s|%d|%d|%d" % (record["stage"], record["m"], record["periods"], record["h"])
+
+def formatRecord(record):
+    peak = "%10.2f" % (record["peak"]/2**20) if "peak" in record else "%10s" % "-"
+    return "%-16s %6d %8d %6d %9d %11.4f %11.4f %s %14.0f" % (record["stage"], record["m"], record["periods"], record["h"], \
+            record["rows"], record["wall"], record["cpu"], peak, record["throughput"])
+
+def header():
+    return "%-16s %6s %8s %6s %9s %11s %11s %10s %14s" % ("stage", "m", "periods", "h", "rows", "wall (s)", "cpu (s)", "peak (MB)", "rows/s")
+
+def environment():
+    """
+    Returns
+    ----------
+
+    env - (dict) what the results were measured on, so saved results can be told apart
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit" : commit, "time" : time.strftime("%Y-%m-%d %H:%M:%S"), "python" : platform.python_version(), \
+            "numpy" : np.__version__, "pandas" : pd.__version__, "scipy" : scipy.__version__, "machine" : platform.platform(), \
+            "processor" : platform.processor(), "cpus" : os.cpu_count()}
+
+def compare(results, baseline, threshold = 1.2, log = print):
+    """
+    Parameters
+    ----------
+
+    results - (list of dicts) see runSuite
+
+    baseline - (list of dicts) earlier results
+
+    threshold - (float) the ratio of wall time or peak memory above which a case is a regression
+
+    log - (function) called with a line of text for every case in both
+
+    Returns
+    ----------
+
+    regressions - (list) the keys of the cases that got slower or bigger
+    """
+    old = {caseKey(record) : record for record in baseline}
+    regressions = []
+    log("%-40s %12s %12s %12s" % ("case", "wall ratio", "peak ratio", ""))
+    for record in results:
+        key = caseKey(record)
+        if key not in old:
+            continue
+        wallRatio = record["wall"]/max(old[key]["wall"], 1e-12)
+        peakRatio = record["peak"]/max(old[key]["peak"], 1) if "peak" in record and "peak" in old[key] else np.nan
+        flag = wallRatio > threshold or peakRatio > threshold
+        if flag:
+            regressions.append(key)
+        log("%-40s %12.2f %12.2f %12s" % (key, wallRatio, peakRatio, "REGRESSION" if flag else ""))
+    return regressions
+
+#%% Run
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark every stage of lastF")
+    parser.add_argument("--m", type = int, nargs = "+", default = PERIODS, help = "seasonal periods")
+    parser.add_argument("--periods", type = int, nargs = "+", default = HISTORIES, help = "history lengths in seasonal periods")
+    parser.add_argument("--horizons", type = int, nargs = "+", default = HORIZONS, help = "horizons in seasonal periods")
+    parser.add_argument("--stages", nargs = "+", default = STAGES, choices = STAGES)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--noMemory", action = "store_true", help = "don't measure peak memory")
+    parser.add_argument("--fitRows", type = int, default = 5000, help = "largest series fit and lastF are run on")
+    parser.add_argument("--save", help = "write the results to this JSON file")
+    parser.add_argument("--compare", help = "JSON file of earlier results to check for regressions")
+    parser.add_argument("--threshold", type = float, default = 1.2)
+    args = parser.parse_args()
+
+    print(header())
+    results = runSuite(args.m, args.periods, args.horizons, args.stages, args.repeat, not args.noMemory, args.fitRows)
+    if args.save:
+        if os.path.dirname(args.save):
+            os.makedirs(os.path.dirname(args.save), exist_ok = True)
+        with open(args.save, "w") as out:
+            json.dump({"environment" : environment(), "results" : results}, out, indent = 1)
+    if args.compare:
+        with open(args.compare) as baseline:
+            baseline = json.load(baseline)
+        print("Compared with %s (commit %s)" % (args.compare, baseline["environment"]["commit"]))
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("%d regressions" % len(regressions))
+            sys.exit(1)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds an asyncio version of lastF, for calling it from an async service without blocking the event loop.
+
+    forecast = await lastFAsync(y, m = 12, h = 24)
+
+or, with a pool of its own,
+
+    async with AsyncLast(n_jobs = 4, max_fits = 8) as service:
+        forecast = await service.lastF(y, m = 12, h = 24, timeout = 60)
+
+Aggregation, every Prophet fit and reconciliation are run in a process pool, the event loop only waits on them.  The
+levels of a request are fit as separate tasks, so the levels of many requests share the pool, and max_fits caps how
+many fits are in the pool at once across every request (the rest wait their turn on the event loop, which keeps the
+pool's queue short).  Each level can have a timeout of its own, and the whole request can too.  Cancelling a request
+(or running out of time) cancels the fits it has waiting, fits already running in a process are left to finish and
+their results are dropped.  Identical requests made while one is running wait on that one instead of fitting again.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import os
+import sys
+import pickle
+import asyncio
+import hashlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from pandas.util import hash_pandas_object
+from lastprophet.parallel import getExecutor
+from lastprophet.fitProphet import levelTasks, fitLevel
+from lastprophet.last import checkInputs, prepareLevels, reconcileCombs
+from lastprophet.frequencies import getCalendar
+
+def fitQuietly(*task):
+    """
+    fitLevel with Prophet's output thrown away.  Only used in processes, where each worker fits one level at a time
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return fitLevel(*task)
+
+def checkRequest(y, m, h, aggList = None):
+    """
+    Raises ValueError if the request can't be forecast, see lastF.  lastF reports bad inputs with sys.exit, and a
+    SystemExit would stop the event loop, so every check that can be made before the work starts is made here
+    """
+    try:
+        checkInputs(y, m, aggList)
+        getCalendar(m)
+        if h < m:
+            sys.exit("The prediction length (h) should be at least as long as the seasonality (m)")
+    except SystemExit as error:
+        raise ValueError(str(error)) from None
+
+def requestKey(y, args):
+    """
+    Parameters
+    ----------
+
+    y - (DataFrame) the series of the request
+
+    args - (tuple) every other input of the request
+
+    Returns
+    ----------
+
+    key - (String) the same for identical requests
+    """
+    digest = hashlib.sha1(hash_pandas_object(y, index = False).values.tobytes())
+    try:
+        digest.update(pickle.dumps(args, protocol = pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, AttributeError, TypeError):
+        digest.update(repr(args).encode())      # eg. a lambda as the backend, which is only the same request if it is the same object
+    return digest.hexdigest()
+
+class AsyncLast(object):
+    """
+    Parameters
+    ----------
+
+    executor - (String or Executor) the pool the work is run in, "process" (Default), "thread" or a concurrent.futures
+                Executor, see parallel.getExecutor.  It can't be "serial", that would block the event loop
+
+    n_jobs - (int or None) the number of workers of a "process" or "thread" pool
+
+    max_fits - (int or None) the most level fits in the pool at once, over every request.  None is n_jobs, or the
+                number of processors
+
+    """
+    def __init__(self, executor = "process", n_jobs = None, max_fits = None):
+        if executor == "serial":
+            sys.exit("AsyncLast needs a pool, the executor must be 'thread', 'process' or a concurrent.futures Executor")
+        self.pool, self.owned = getExecutor(executor, n_jobs)
+        self.max_fits = max_fits or n_jobs or os.cpu_count()
+        self.quiet = isinstance(self.pool, ProcessPoolExecutor)
+        self.inflight = {}
+        self._loop = None
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the pool if it was made here
+        """
+        if self.owned:
+            self.pool.shutdown(wait = False)
+
+    def _semaphore(self):
+        ##
+        # asyncio primitives belong to the loop they were first used on, so the fit slots are made for the running loop
+        ##
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_fits)
+        return self._slots
+
+    async def _run(self, func, *args):
+        ##
+        # Anything else lastF reports with sys.exit comes back from the pool as a SystemExit, which would stop the event
+        # loop and every other request with it
+        ##
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+        except SystemExit as error:
+            raise ValueError(str(error)) from None
+
+    async def _fitLevel(self, task, level_timeout):
+        async with self._semaphore():
+            return await asyncio.wait_for(self._run(fitQuietly if self.quiet else fitLevel, *task), level_timeout)
+
+    async def _forecast(self, y, m, h, comb, aggList, include_history, prophetArgs, transform, init, lambdas, compact, backend, \
+                        level_timeout):
+        """
+        The work of one request, see lastF.  Returns the forecasts, the params of every level and the BoxCox lambdas
+        """
+        aggs, boxcoxT = await self._run(prepareLevels, y, m, aggList, transform, lambdas)
+        combs = comb if isinstance(comb, list) else [comb]
+        try:
+            tasks = levelTasks(aggs, h, include_history, *prophetArgs, init = init, residuals = "WLSV" in combs, backend = backend)
+        except SystemExit as error:
+            raise ValueError(str(error)) from None     # eg. a backend that isn't registered
+        fits = [asyncio.ensure_future(self._fitLevel(task, level_timeout)) for task in tasks]
+        try:
+            results = await asyncio.gather(*fits)
+        finally:
+            ##
+            # If a level failed, timed out or the request was cancelled, the fits still waiting are not started
+            ##
+            for fit in fits:
+                fit.cancel()
+        forecastsDict = {}
+        mse = {}
+        resids = {}
+        params = {}
+        for key, levelFcst, levelMse, levelResids, levelParams, records in results:
+            forecastsDict[key] = levelFcst
+            mse[key] = levelMse
+            resids[key] = levelResids
+            params[key] = levelParams
+        newDict = await self._run(reconcileCombs, forecastsDict, h, mse, resids, comb, boxcoxT, None, compact)
+
+        return newDict, params, boxcoxT
+
+    async def lastF(self, y, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = True, cap = None, capF = None, \
+                    changepoints = None, n_changepoints = 25, yearly_seasonality = True, weekly_seasonality = 'auto', holidays = None, \
+                    seasonality_prior_scale = 10.0, holidays_prior_scale = 10.0, changepoint_prior_scale = 0.05, mcmc_samples = 0, \
+                    interval_width = 0.80, uncertainty_samples = 0, transform = None, init = None, params = None, lambdas = None, \
+                    compact = False, backend = "prophet", timeout = None, level_timeout = None):
+        """
+        Parameters
+        ----------
+
+        All the same as lastF, except
+
+        timeout - (float or None) seconds to wait for the whole forecast, asyncio.TimeoutError is raised after that
+
+        level_timeout - (float or None) seconds each level can take once it is in the pool, asyncio.TimeoutError is
+                         raised (and the request stops) if one takes longer
+
+        Inputs lastF would stop at with sys.exit raise ValueError instead, so one bad request doesn't stop the event loop
+
+        Returns
+        ----------
+
+        newDict - the output of lastF.  Identical requests that overlap get the same object, so copy it before changing it
+        """
+        checkRequest(y, m, h, aggList)
+        prophetArgs = (cap, capF, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, \
+                       seasonality_prior_scale, holidays_prior_scale, changepoint_prior_scale, mcmc_samples, \
+                       interval_width, uncertainty_samples)
+        key = requestKey(y, (m, h, comb, aggList, include_history, prophetArgs, transform, init, lambdas, compact, backend, level_timeout))
+        ##
+        # The first request starts the work, the ones that match it while it runs wait on the same task.  Each waiter is
+        # shielded so one timing out doesn't stop it for the others, it is only cancelled when nobody is waiting any more
+        ##
+        entry = self.inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self._forecast(y, m, h, comb, aggList, include_history, prophetArgs, transform, init, \
+                                                        None if lambdas is None else dict(lambdas), compact, backend, level_timeout))
+            entry = self.inflight[key] = {"task" : task, "waiting" : 0}
+            task.add_done_callback(lambda done: self.inflight.pop(key, None) if self.inflight.get(key) is entry else None)
+        entry["waiting"] += 1
+        try:
+            newDict, levelParams, boxcoxT = await asyncio.wait_for(asyncio.shield(entry["task"]), timeout)
+        finally:
+            entry["waiting"] -= 1
+            if entry["waiting"] == 0 and not entry["task"].done():
+                entry["task"].cancel()
+        if params is not None:
+            params.update(levelParams)
+        if lambdas is not None and boxcoxT is not None:
+            lambdas.update(boxcoxT)
+
+        return newDict
+
+_service = {}
+
+async def lastFAsync(y, m = 12, h = 12*2, comb = "OLS", **kwargs):
+    """
+    Parameters
+    ----------
+
+    All the same as AsyncLast.lastF.  The work is run in a process pool shared by every call, with the default n_jobs and
+    max_fits of AsyncLast
+
+    Returns
+    ----------
+
+    newDict - the output of lastF
+    """
+    if "default" not in _service:
+        _service["default"] = AsyncLast()
+    return await _service["default"].lastF(y, m, h, comb, **kwargs)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds the registry of base forecasters (backends) that can fit an aggregation level instead of Prophet.
+
+Every level is fit with Prophet by default, but many of the levels of a long calendar (the 32 levels of m = 8760 for
+example) don't need a full Stan fit.  lastF's backend input picks the model of each level, eg. Prophet on the top and
+bottom levels and a cheap model in between:
+
+    lastF(y, m = 8760, backend = {1 : "prophet", 8760 : "prophet", "default" : "fourier"})
+
+A backend is a function
+
+    backend(data, freq, periods, include_history, residuals, season, init, options)
+
+    data - (DataFrame) the level with columns ds and y
+    freq - (String) the pandas frequency of the level
+    periods - (int) the number of periods to forecast
+    include_history - (Boolean) also return the fitted values of the history
+    residuals - (Boolean) work out mse and resids
+    season - (int) the number of periods of the level in one seasonal cycle (the level itself, eg. 12 for months of a year)
+    init - (dict or None) what the backend returned as params the last time it fit this level, to warm start from
+    options - (dict) the Prophet inputs of lastF (cap, capF, changepoints, ...), for backends that use them
+
+that returns (fcst, mse, resids, params) like fitProphet: fcst a DataFrame with columns ds and yhat (and any components),
+mse a float, resids an array (both None without residuals) and params anything that can be handed back as init.
+Backends are registered by name with registerBackend, or a function can be given to lastF directly.  Backends that are
+fit in other processes have to be module level functions so they can be pickled.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import sys
+import numpy as np
+import pandas as pd
+
+_registry = {}
+
+def registerBackend(name, backend):
+    """
+    Parameters
+    ----------
+
+    name - (String) what the backend is called in lastF's backend input
+
+    backend - (function) the base forecaster, see the top of the file
+
+    """
+    if not callable(backend):
+        sys.exit("A backend must be a function, see backends.py")
+    _registry[name] = backend
+
+def registeredBackends():
+    """
+    Returns
+    ----------
+
+    names - (list) every backend that can be named in lastF
+    """
+    return sorted(_registry.keys())
+
+def getBackend(backend, key = None):
+    """
+    Parameters
+    ----------
+
+    backend - (String, function or dict) a registered name, a backend function, or aggregation level : name or function.
+               Levels missing from a dict use its "default" entry, or Prophet if it has none
+
+    key - (int or None) the aggregation level, only needed when backend is a dict
+
+    Returns
+    ----------
+
+    backend - (function) the backend of the level
+    """
+    if isinstance(backend, dict):
+        backend = backend.get(key, backend.get("default", "prophet"))
+    if callable(backend):
+        return backend
+    if backend not in _registry:
+        sys.exit("Sorry, " + str(backend) + " is not a registered backend.  Please use one of " + ", ".join(registeredBackends()) + \
+                 ", a function or add it with backends.registerBackend")
+    return _registry[backend]
+
+#%% Helpers for the NumPy backends
+def futureDates(ds, freq, periods):
+    """
+    The periods after the end of ds, the same dates Prophet's make_future_dataframe makes
+    """
+    return pd.date_range(start = ds.max(), periods = periods + 1, freq = freq)[1:]
+
+def arrayForecast(data, freq, periods, include_history, residuals, fitted, ahead):
+    """
+    Parameters
+    ----------
+
+    data, freq, periods, include_history, residuals - see the top of the file
+
+    fitted - (numpy array) the in-sample predictions, NaN where the model has none
+
+    ahead - (numpy array) the forecasts of the periods ahead
+
+    Returns
+    ----------
+
+    fcst, mse, resids - see the top of the file
+    """
+    future = futureDates(data.ds, freq, periods)
+    if include_history:
+        fcst = pd.DataFrame({"ds" : np.concatenate((data.ds.values, future.values)), "yhat" : np.concatenate((fitted, ahead))})
+    else:
+        fcst = pd.DataFrame({"ds" : future.values, "yhat" : ahead})
+    if not residuals:
+        return fcst, None, None
+    resids = np.asarray(data.y.values, dtype = float) - fitted
+    return fcst, np.nanmean(resids**2), resids
+
+#%% The backends
+def prophetBackend(data, freq, periods, include_history, residuals, season, init, options):
+    """
+    A full Prophet fit, see fitProphet.fitModel.  params are the fitted parameters, see fitProphet.prophetInit
+    """
+    from lastprophet.fitProphet import fitModel, predictLevel, prophetInit
+    model = fitModel(data, freq, options["cap"], options["capF"], options["changepoints"], options["n_changepoints"], \
+                     options["yearly_seasonality"], options["weekly_seasonality"], options["holidays"], \
+                     options["seasonality_prior_scale"], options["holidays_prior_scale"], options["changepoint_prior_scale"], \
+                     options["mcmc_samples"], options["interval_width"], options["uncertainty_samples"], init)
+    fcst, mse, resids = predictLevel(model, data, freq, periods, include_history, options["capF"], residuals)
+    return fcst, mse, resids, prophetInit(model)
+
+def naiveBackend(data, freq, periods, include_history, residuals, season, init, options):
+    """
+    Seasonal naive, every period is forecast as the same period of the last cycle.  The top level (one period per cycle)
+    is a random walk.  There are no params
+    """
+    y = np.asarray(data.y.values, dtype = float)
+    fitted = np.concatenate((np.full(season, np.nan), y[:-season]))
+    ahead = np.resize(y[-season:], periods)
+    return arrayForecast(data, freq, periods, include_history, residuals, fitted, ahead) + ({},)
+
+def fourierBackend(data, freq, periods, include_history, residuals, season, init, options):
+    """
+    A linear trend plus Fourier terms of the seasonal cycle (up to 10 harmonics), fit by least squares.  params are the coefficients
+    """
+    y = np.asarray(data.y.values, dtype = float)
+    n = len(y)
+    t = np.arange(n + periods, dtype = float)
+    columns = [np.ones(n + periods), t/n]
+    for k in range(1, min(10, season//2) + 1):
+        columns.append(np.sin(2*np.pi*k*t/season))
+        columns.append(np.cos(2*np.pi*k*t/season))
+    design = np.column_stack(columns)
+    coef = np.linalg.lstsq(design[:n], y, rcond = None)[0]
+    predicted = np.dot(design, coef)
+    return arrayForecast(data, freq, periods, include_history, residuals, predicted[:n], predicted[n:]) + ({"coef" : coef},)
+
+##
+# The pre-defined backends
+##
+registerBackend("prophet", prophetBackend)
+registerBackend("naive", naiveBackend)
+registerBackend("fourier", fourierBackend)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+This file evaluates lastF at rolling forecast origins (eg. the loops in predDJIA.py and prophetVerify.py) in one call.
+
+The series is read once: the running total of its values gives the aggregated levels at any origin by differencing,
+so no origin re-aggregates or copies the history.  The origins are independent, so they can be fit in parallel, and
+each origin's base forecasts are fit once and then reconciled with every comb asked for.  The errors of every origin,
+comb and step ahead are worked out together as arrays and handed back as one long table.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import sys
+import numpy as np
+import pandas as pd
+from lastprophet.aggHier import aggLevels
+from lastprophet.fitProphet import fitProphet
+from lastprophet.frequencies import levelFreq
+from lastprophet.reconcile import reconcile
+from lastprophet.parallel import mapTasks, quietStdout
+
+def originLevels(y, sums, m, mList, origin):
+    """
+    Parameters
+    ----------
+
+    y - (DataFrame) the whole series, see lastF
+
+    sums - (numpy array) the running total of the values of y with a 0 in front, so sums[j] - sums[i] is the sum of rows i to j-1
+
+    m - (int) the seasonal period
+
+    mList - (list) the aggregation levels, see aggLevels
+
+    origin - (int) the number of observations in the training data
+
+    Returns
+    ----------
+
+    aggs - (dict of DataFrames) the same as aggHier(y.iloc[:origin], m), each bucket is a difference of the running total
+    """
+    start = origin % m
+    dates = y.iloc[:origin, 0]
+    aggs = {}
+    for freq in mList:
+        block = int(m/freq)
+        ends = np.arange(start + block, origin + 1, block)      # One past the last row of every full block
+        temporary = pd.DataFrame(dates.iloc[ends - 1])
+        temporary['y'] = sums[ends] - sums[ends - block]
+        aggs[freq] = temporary
+    for freq in mList:
+        aggs[freq] = aggs[freq].rename(columns = {aggs[freq].columns[0] : levelFreq(m, freq, aggs[freq].iloc[0,0])})
+
+    return aggs
+
+def fitOrigin(origin, aggs, h, prophetArgs, init = None, residuals = True):
+    """
+    Parameters
+    ----------
+
+    origin - (int) the number of observations in the training data
+
+    aggs - (dict of DataFrames) the aggregated training data, see originLevels
+
+    h - (int) the forecast horizon
+
+    prophetArgs - (tuple) cap through uncertainty_samples, in the order fitProphet takes them
+
+    init - (dict or None) starting values for each level, see fitProphet
+
+    residuals - (Boolean) work out mse and resids, only WLSV needs them.  Only the periods ahead are predicted either way
+
+    Returns
+    ----------
+
+    origin - (int) the origin, so results can be matched up
+
+    forecastsDict, mse, resids - the base forecasts, see fitProphet
+
+    params - (dict) the fitted parameters of every level, to warm start other origins
+    """
+    params = {}
+    forecastsDict, mse, resids = fitProphet(aggs, h, False, *prophetArgs, init = init, params = params, residuals = residuals)
+
+    return origin, forecastsDict, mse, resids, params
+
+def backtest(y, m = 12, h = 12*2, origins = None, comb = ["OLS"], aggList = None, cap = None, capF = None, changepoints = None, \
+             n_changepoints = 25, yearly_seasonality = True, weekly_seasonality = 'auto', holidays = None, seasonality_prior_scale = 10.0, \
+             holidays_prior_scale = 10.0, changepoint_prior_scale = 0.05, mcmc_samples = 0, interval_width = 0.80, uncertainty_samples = 0, \
+             executor = "serial", n_jobs = None, warm_start = False):
+    """
+    Parameters
+    ----------------
+
+    y - dataframe of time-series data, see lastF.  The observations after each origin are the test data
+
+    m - (int) frequency of time series, see lastF
+
+    h - (int) the forecast horizon, rounded down to whole seasonal cycles like lastF does
+
+    origins - (list or None) the number of observations in the training data at each origin (at least 2*m).  If None, the
+               last 5 origins, one period apart, that still have h observations after them
+
+    comb - (String or list) the combinations to evaluate, any of "OLS", "WLSS", "WLSV" and "BU" (see lastF).  They are
+            all reconciled from the same base forecasts, which are evaluated as well with comb "base"
+
+    aggList - (list) see lastF
+
+    executor - (String or Executor) how the origins are fit, see parallel.getExecutor.  The levels of an origin are fit one
+                after another in its worker
+
+    n_jobs - (int or None) the number of workers for the "thread" and "process" executors
+
+    warm_start - (Boolean) start the fits of an origin from the parameters fitted at another.  Run serially, each origin
+                  starts from the one before it.  Run in parallel, the first origin is fit on its own and the rest start from it
+
+    All other inputs - see lastF.  transform is not supported
+
+    Returns
+    -----------------
+
+    errors - (DataFrame) one row per origin, comb and step ahead that has an observation to compare to, with columns
+
+            	origin - the number of observations in the training data
+                comb - the combination, or "base" for the forecasts before reconciliation
+                step - how many periods ahead of the origin (1 is the first forecast)
+                ds - the time instance
+                y - the observation
+                yhat - the forecast
+                error - y - yhat
+                ape - the absolute percentage error, |error|/|y|
+                ase - the absolute scaled error, |error| over the in-sample mean absolute error of the seasonal naive
+                      forecast (so the mean of ase is the MASE)
+
+             eg. errors.groupby(["comb", "step"])[["ape", "ase"]].mean()
+
+    """
+    ##
+    # Error Catching
+    ##
+    y = y.copy()
+    y[y.columns[0]] = pd.DatetimeIndex(y.iloc[:,0])
+    if m <= 1:
+        sys.exit("Seasonal period (m) must be greater than 1")
+    if h < m:
+        sys.exit("The prediction length (h) should be at least as long as the seasonality (m)")
+    if aggList is not None:
+        if 1 not in aggList or m not in aggList:
+            sys.exit("1 and the seasonal period must be included in the aggList input")
+    if isinstance(comb, str):
+        comb = [comb]
+    for method in comb:
+        if method not in ["BU", "OLS", "WLSS", "WLSV"]:
+            sys.exit("The reconciliation method must be one of the specified types, see instructions")
+    n = len(y)
+    ##
+    # Only the last whole cycles of a forecast are reconciled, so the horizon is cut to them before anything is fit.  The
+    # forecasts then start the step after the origin, lined up with the actuals they are scored against
+    ##
+    periods = int(h/m)*m
+    h = periods
+    if origins is None:
+        origins = list(range(n - periods - 4, n - periods + 1))
+    origins = sorted(int(origin) for origin in origins)
+    if len(origins) == 0 or origins[0] < 2*m or origins[-1] >= n:
+        sys.exit("Every origin needs at least 2 periods of data before it and one observation after it")
+    ##
+    # The series is only summed once, every level of every origin is a difference of the running total
+    ##
+    values = np.asarray(y.iloc[:, 1])
+    sums = np.concatenate(([0], np.cumsum(values)))
+    mList = aggLevels(m, 2*m, aggList)
+    prophetArgs = (cap, capF, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, \
+                   seasonality_prior_scale, holidays_prior_scale, changepoint_prior_scale, mcmc_samples, \
+                   interval_width, uncertainty_samples)
+    ##
+    # Fit the base forecasts of every origin.  Prophet's output is thrown away once around all of them, the origins fit in
+    # threads share sys.stdout (see parallel.quietStdout)
+    ##
+    residuals = "WLSV" in comb
+    fits = []
+    with quietStdout():
+        if warm_start and executor == "serial":
+            init = None
+            for origin in origins:
+                fits.append(fitOrigin(origin, originLevels(y, sums, m, mList, origin), h, prophetArgs, init, residuals))
+                init = fits[-1][4]
+        else:
+            init = None
+            if warm_start:
+                fits.append(fitOrigin(origins[0], originLevels(y, sums, m, mList, origins[0]), h, prophetArgs, None, residuals))
+                init = fits[0][4]
+            tasks = [(origin, originLevels(y, sums, m, mList, origin), h, prophetArgs, init, residuals) for origin in origins[len(fits):]]
+            fits.extend(mapTasks(fitOrigin, tasks, executor, n_jobs))
+    ##
+    # Reconcile every origin with every comb, keeping the forecasts at the original frequency
+    ##
+    names = ["base"] + comb
+    yhat = np.empty((len(origins), len(names), periods))
+    ds = np.empty((len(origins), periods), dtype = 'datetime64[ns]')
+    for i, (origin, forecastsDict, mse, resids, params) in enumerate(fits):
+        yhat[i, 0] = forecastsDict[m].yhat.values[-periods:]
+        ds[i] = forecastsDict[m].ds.values[-periods:]
+        for j, method in enumerate(comb):
+            newDict = reconcile(forecastsDict, h, mse, resids, method)
+            yhat[i, j + 1] = newDict[m].yhat.values[-periods:]
+    ##
+    # Test data and the seasonal naive scale of every origin, as arrays, with NaN past the end of the series
+    ##
+    origins = np.array(origins)
+    index = origins[:, None] + np.arange(periods)
+    actual = np.full(index.shape, np.nan)
+    inside = index < n
+    actual[inside] = values[index[inside]]
+    naive = np.concatenate(([0], np.cumsum(np.abs(values[m:] - values[:-m]))))
+    scale = naive[origins - m]/(origins - m)
+    error = actual[:, None, :] - yhat
+    ##
+    # One long table, dropping the steps that run past the end of the series
+    ##
+    shape = yhat.shape
+    errors = pd.DataFrame({"origin" : np.repeat(origins, shape[1]*shape[2]),
+                           "comb" : np.tile(np.repeat(names, shape[2]), shape[0]),
+                           "step" : np.tile(np.arange(1, periods + 1), shape[0]*shape[1]),
+                           "ds" : np.repeat(ds, shape[1], axis = 0).ravel(),
+                           "y" : np.repeat(actual, shape[1], axis = 0).ravel(),
+                           "yhat" : yhat.ravel(),
+                           "error" : error.ravel(),
+                           "ape" : (np.abs(error)/np.abs(actual[:, None, :])).ravel(),
+                           "ase" : (np.abs(error)/scale[:, None, None]).ravel()})
+
+    return errors[~np.isnan(errors.y.values)].reset_index(drop = True)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+This file runs lastF over many series that share a date column (eg. every SKU or metric in a table) in one call.
+Series are sent to a pool of workers and their results are handed back as soon as each one finishes, so a large
+batch can be written out while it is still running.  A series that fails is reported instead of stopping the batch.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from lastprophet.last import lastF
+from lastprophet.aggHier import aggLevels
+from lastprophet.reconcile import getProjection
+from lastprophet.parallel import getExecutor, quietStdout
+from lastprophet.workers import WorkerPool, packFrame, forecastPacked, unpackSeries
+from lastprophet.scheduler import seriesCost, workerCount, streamTasks
+
+##
+# The projection shared by every series in a worker process lastBatch started, set once when the process starts.  It is
+# only read by forecastShared, which is only sent to those processes
+##
+_sharedProjection = None
+
+def _setProjection(projection):
+    global _sharedProjection
+    _sharedProjection = projection
+
+def forecastSeries(name, y, m, h, comb, aggList, kwargs, projection = None):
+    """
+    Parameters
+    ----------
+
+    name - the name of the series, handed back with the result
+
+    y - (DataFrame) the two column series, see lastF
+
+    m, h, comb, aggList - see lastF
+
+    kwargs - (dict) any other inputs of lastF
+
+    projection - (Projection or None) the shared reconciliation, None builds (or takes from the cache) the one the series needs
+
+    Returns
+    ----------
+
+    name - the name of the series
+
+    newDict - (dict of DataFrames or None) the output of lastF, None if the series failed
+
+    error - (Exception or None) why the series failed.  lastF reports bad inputs with sys.exit, so that is caught here as well
+    """
+    try:
+        return name, lastF(y, m, h, comb, aggList, projection = projection, **kwargs), None
+    except (Exception, SystemExit) as error:
+        return name, None, error
+
+def forecastShared(name, y, m, h, comb, aggList, kwargs):
+    """
+    forecastSeries with the projection set when this worker process was started by lastBatch, see _setProjection
+    """
+    return forecastSeries(name, y, m, h, comb, aggList, kwargs, _sharedProjection)
+
+def splitSeries(data, idCol = None, dateCol = None, valueCol = None):
+    """
+    Parameters
+    ----------
+
+    data - (DataFrame) the series, in one of two layouts
+
+            	Wide (idCol is None):
+                     1st Col (or dateCol) - Time instances
+                     Every other column - one series
+
+            	Long:
+                     idCol - the name of the series each row belongs to
+                     dateCol - Time instances
+                     valueCol - the value of the series
+
+    Returns
+    ----------
+
+    generator of (name, DataFrame) - each series as the two column layout lastF expects, without missing values
+    """
+    if idCol is None:
+        if dateCol is None:
+            dateCol = data.columns[0]
+        for name in data.columns:
+            if name == dateCol:
+                continue
+            yield name, data[[dateCol, name]].dropna().reset_index(drop = True)
+    else:
+        if dateCol is None or valueCol is None:
+            sys.exit("dateCol and valueCol must be given when idCol is")
+        for name, group in data.groupby(idCol, sort = False):
+            yield name, group[[dateCol, valueCol]].dropna().sort_values(dateCol).reset_index(drop = True)
+
+def lastBatch(data, m = 12, h = 12*2, comb = "OLS", aggList = None, idCol = None, dateCol = None, valueCol = None, \
+              executor = "process", n_jobs = None, **kwargs):
+    """
+    Parameters
+    ----------------
+
+    data - (DataFrame) many series sharing a date column, in a wide or long layout, see splitSeries
+
+    m, h, comb, aggList - see lastF, the same for every series
+
+    idCol, dateCol, valueCol - see splitSeries
+
+    executor - (String or Executor) how the series are run, one of "serial", "thread", "process" (Default) or a
+                concurrent.futures Executor (or a workers.WorkerPool).  The aggregation levels of each series are fit one after
+                another in its worker, and the series are sent longest first (see scheduler.py).  With threads Prophet's
+                output is thrown away once for the whole batch (unless verbose), so anything else printed while it runs is too
+
+    n_jobs - (int or None) the number of workers, None uses the number of processors
+
+    kwargs - any other inputs of lastF
+
+    Returns
+    -----------------
+
+    generator of (name, newDict, error) - one tuple per series in the order they finish.  newDict is the output of lastF,
+     or None with the reason in error if that series failed
+
+    """
+    ##
+    # For every comb but WLSV the reconciliation only depends on the aggregation levels, which are the same for every series
+    # long enough to forecast, so it is factorised once here and handed to every worker instead of once per series
+    ##
+    projection = None
+    if comb in ["BU", "OLS", "WLSS"]:
+        projection = getProjection(aggLevels(m, 2*m, aggList), comb)
+    ##
+    # Processes created here are handed the projection once as they start, so it is not pickled again with every series.
+    # Everywhere else (threads, the serial path and pools that aren't ours) it is passed with each series
+    ##
+    shared = executor == "process"
+    if shared:
+        pool, owned = getExecutor(executor, n_jobs, _setProjection, (projection,))
+    else:
+        pool, owned = getExecutor(executor, n_jobs)
+    series = splitSeries(data, idCol, dateCol, valueCol)
+    if pool is None:
+        for name, y in series:
+            yield forecastSeries(name, y, m, h, comb, aggList, kwargs, projection)
+        return
+    ##
+    # The series are sent longest first, with the short ones packed together (see scheduler.py).  Only a few chunks per
+    # worker are kept in flight so a very large batch is not all queued up at once
+    ##
+    series = list(series)
+    costs = [seriesCost(len(y), m, aggList) for name, y in series]
+    workers = workerCount(pool, n_jobs)
+    ##
+    # A WorkerPool is sent every series (and sends back its forecasts) as arrays instead of DataFrames
+    ##
+    packed = isinstance(pool, WorkerPool)
+    threaded = isinstance(pool, ThreadPoolExecutor)
+    if packed:
+        func = forecastPacked
+        tasks = [(name, packFrame(y), m, h, comb, aggList, kwargs, projection) for name, y in series]
+    elif shared:
+        func = forecastShared
+        tasks = [(name, y, m, h, comb, aggList, kwargs) for name, y in series]
+    else:
+        ##
+        # Threads share sys.stdout, so it is silenced once here around the pool and each series is left to print
+        ##
+        func = forecastSeries
+        seriesKwargs = dict(kwargs, verbose = True) if threaded else kwargs
+        tasks = [(name, y, m, h, comb, aggList, seriesKwargs, projection) for name, y in series]
+    with quietStdout(threaded and not kwargs.get("verbose", False)):
+        try:
+            for i, result, seconds, chunk in streamTasks(pool, func, tasks, costs, workers, 2*workers):
+                yield unpackSeries(result, kwargs) if packed else result
+        finally:
+            if owned:
+                pool.shutdown()
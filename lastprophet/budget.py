@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds the time budgets of fitProphet, so one slow level (eg. the bottom level of a long hourly series)
+can't hold up a whole lastF call.
+
+A budget can be given for the whole call (time_budget) and for each level (level_budget, seconds for every level or a
+dict of aggregation level : seconds like the backend input, eg. {8760 : 60, "default" : 10}).  A level's clock starts
+when it starts running.  A level that runs out of time, or hasn't finished when the call runs out, is dropped and
+forecast with seasonal naive instead (see backends.naiveBackend), which is vectorised and instant and has residuals,
+so reconcile still gets every level.  Which levels fell back, and why, is handed back in the fallbacks input.
+
+Python can't stop a running fit, so a level that runs out of time is left to finish in the background (in its thread
+or process) and its result is thrown away, the same as a cancelled asyncLast request.  Levels that haven't started are
+cancelled.  Because an abandoned level can still be running in a thread of this process, a profiled serial run with a
+budget only times the levels and doesn't count Stan's iterations at the stdout file descriptor (see profiling.captureStan).
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, FIRST_COMPLETED
+from lastprophet.parallel import getExecutor
+from lastprophet.backends import naiveBackend
+from lastprophet.scheduler import runChunk
+
+##
+# How often (in seconds) the levels running in a pool are checked against their budgets
+##
+POLL = 0.05
+
+def levelBudget(level_budget, key):
+    """
+    Parameters
+    ----------
+
+    level_budget - (float, dict or None) seconds for every level, or aggregation level : seconds.  Levels missing from a
+                    dict use its "default" entry, or have no budget if it has none
+
+    key - (int) the aggregation level
+
+    Returns
+    ----------
+
+    seconds - (float) the budget of the level, inf if it has none
+    """
+    if isinstance(level_budget, dict):
+        level_budget = level_budget.get(key, level_budget.get("default"))
+    return np.inf if level_budget is None else float(level_budget)
+
+def fallbackLevel(task):
+    """
+    Parameters
+    ----------
+
+    task - (tuple) the arguments of fitProphet.fitLevel for the level, see fitProphet.levelTasks
+
+    Returns
+    ----------
+
+    key, fcst, mse, resids, params, records - like fitProphet.fitLevel, from a seasonal naive forecast of the level
+    """
+    key, data, periods, include_history = task[:4]
+    residuals = task[19] if len(task) > 19 else True
+    freq = data.columns.tolist()[0]
+    data = data.rename(columns = {data.columns[0] : 'ds', data.columns[1] : 'y'}, copy = False)
+    fcst, mse, resids, params = naiveBackend(data, freq, periods, include_history, residuals, key, None, {})
+    return key, fcst, mse, resids, params, []
+
+def budgetTasks(func, tasks, costs, executor = "serial", n_jobs = None, time_budget = None, level_budget = None, report = None, \
+                fallbacks = None):
+    """
+    Parameters
+    ----------
+
+    func - (function) fitProphet.fitLevel, run as func(*task)
+
+    tasks - (list of tuples) the arguments of fitLevel for every level, see fitProphet.levelTasks
+
+    costs - (list of floats) the predicted cost of every level, the most expensive are sent to a pool first (see scheduler.py)
+
+    executor, n_jobs - see parallel.getExecutor.  With "serial" the levels are still run one after another, each in a
+                        thread of its own so it can be left behind when it runs out of time
+
+    time_budget - (float or None) seconds for every level together, None is no limit
+
+    level_budget - (float, dict or None) seconds for each level, see levelBudget
+
+    report - (list or None) see scheduler.scheduleTasks.  A level that fell back has the seconds it ran before it was dropped
+
+    fallbacks - (dict or None) if given, filled with aggregation level : "level_budget" or "time_budget" for every level
+                 that was forecast with seasonal naive, and which budget it ran out of
+
+    Returns
+    ----------
+
+    results - (list) what fitLevel returns for every task, in the same order as tasks
+    """
+    deadline = time.perf_counter() + (np.inf if time_budget is None else time_budget)
+    results = [None]*len(tasks)
+    seconds = [None]*len(tasks)
+    dropped = {}
+    pool, owned = getExecutor(executor, n_jobs)
+    if pool is None:
+        for i, task in enumerate(tasks):
+            budget = min(levelBudget(level_budget, task[0]), deadline - time.perf_counter())
+            if budget <= 0:
+                dropped[i] = "time_budget"
+                continue
+            thread = ThreadPoolExecutor(max_workers = 1)
+            start = time.perf_counter()
+            future = thread.submit(func, *task)
+            thread.shutdown(wait = False)
+            try:
+                results[i] = future.result(timeout = None if np.isinf(budget) else budget)
+            except TimeoutError:
+                dropped[i] = "level_budget" if budget < deadline - start else "time_budget"
+            seconds[i] = time.perf_counter() - start
+    else:
+        futures = {}
+        started = {}
+        try:
+            for i in sorted(range(len(tasks)), key = lambda i: -costs[i]):
+                futures[pool.submit(runChunk, func, [tasks[i]])] = i
+            while len(futures) > 0:
+                done, notDone = wait(futures, timeout = POLL, return_when = FIRST_COMPLETED)
+                now = time.perf_counter()
+                for future in done:
+                    i = futures.pop(future)
+                    (results[i], seconds[i]), = future.result()
+                for future, i in list(futures.items()):
+                    if future.running():
+                        started.setdefault(i, now)
+                    if now >= deadline:
+                        dropped[i] = "time_budget"
+                    elif i in started and now - started[i] > levelBudget(level_budget, tasks[i][0]):
+                        dropped[i] = "level_budget"
+                    else:
+                        continue
+                    future.cancel()
+                    futures.pop(future)
+                    seconds[i] = now - started[i] if i in started else 0.0
+        finally:
+            for future in futures:
+                future.cancel()
+            if owned:
+                pool.shutdown(wait = len(dropped) == 0)
+    for i, reason in dropped.items():
+        results[i] = fallbackLevel(tasks[i])
+        if fallbacks is not None:
+            fallbacks[tasks[i][0]] = reason
+    if report is not None:
+        report.extend({"predicted" : costs[i], "actual" : seconds[i], "chunk" : None} for i in range(len(tasks)))
+    return results
@@ -16,26 +16,283 @@ It was my intention to make some of the code look similar to certain sections in
 """
 
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from fbprophet import Prophet
+from lastprophet.scheduler import taskCost, learnedCosts, scheduleTasks
+from lastprophet.profiling import measure, captureStan
+from lastprophet.backends import getBackend, prophetBackend
+from lastprophet.mapEngine import mapLevels
+from lastprophet.workers import WorkerPool
+from lastprophet.budget import budgetTasks
 
-def fitProphet(aggs, h, include_history, cap, capF, changepoints, n_changepoints, \
+def prophetInit(model):
+    """
+    Parameters
+    ----------
+    
+    model - (Prophet) a fitted Prophet model
+    
+    Returns
+    ----------
+    
+    init - (dict) the fitted parameters (k, m, delta, beta, sigma_obs) in the form Stan takes as starting values,
+            so a refit on a little more data can start where the last fit finished
+    """
+    init = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        init[pname] = model.params[pname][0][0]
+    for pname in ['delta', 'beta']:
+        init[pname] = model.params[pname][0]
+    
+    return init
+
+def fitModel(data, freq, cap, capF, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, \
+                seasonality_prior_scale, holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, \
+                uncertainty_samples, init = None):
+    """
+    Parameters
+    ----------
+    All largely the same as fitProphet
+    
+    data - (DataFrame) aggregated data for one level with columns ds and y
+    
+    freq - (String) the pandas frequency of the level (see frequencies.py)
+    
+    init - (dict or None) starting values for the optimiser, see prophetInit.  If Stan can't use them (the number of
+            changepoints or seasonal terms changed) the model is fit from Prophet's usual starting values instead
+    
+    
+    Returns
+    ----------
+    model - (Prophet) the fitted model
+    """
+    if 'AS-' in freq:
+        yearly_seasonality = False
+    if capF is None:
+        growth = 'linear'
+    else:
+        growth = 'logistic'
+        data['cap'] = cap
+    model = Prophet(growth, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, \
+                    holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples)
+    if init is None:
+        return model.fit(data)
+    try:
+        return model.fit(data, init = init)
+    except Exception:
+        model = Prophet(growth, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, \
+                        holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples)
+        return model.fit(data)
+
+def predictLevel(model, data, freq, periods, include_history, capF, residuals = True):
+    """
+    Parameters
+    ----------
+    
+    model - (Prophet) a fitted model, see fitModel
+    
+    data - (DataFrame) the data the model was fit to, with columns ds and y
+    
+    freq - (String) the pandas frequency of the level
+    
+    periods - (int) the number of periods to forecast
+    
+    include_history, capF - see fitProphet
+    
+    residuals - (Boolean) work out the in-sample errors.  Without include_history they take a second predict over the
+                 history, which only needs yhat so it is done without uncertainty intervals
+    
+    
+    Returns
+    ----------
+    fcst - (DataFrame) seasonalities and forecasts for this level, only the periods ahead unless include_history
+    
+    mse - (float or None) the mean square error and the estimator for error variance, None without residuals
+    
+    resids - (numpy array or None) the error of the fitted values with respect to the data, None without residuals
+    """
+    future = model.make_future_dataframe(periods = periods, freq = freq, include_history = include_history) #Frequency is equal to our hard coded column name
+    if capF is not None:
+        future['cap'] = capF
+    fcst = model.predict(future)
+    ##
+    # Find MSE and resids, from the history rows of the forecast if it has them
+    ##
+    if include_history:
+        fitted = fcst.yhat.values[:len(data)]
+    elif residuals:
+        uncertainty = model.uncertainty_samples
+        model.uncertainty_samples = 0
+        try:
+            fitted = model.predict(data[[column for column in data.columns if column != 'y']]).yhat.values
+        finally:
+            model.uncertainty_samples = uncertainty
+    else:
+        return fcst, None, None
+    resids = np.asarray(data.y.values - fitted, dtype = float)
+    mse = np.mean(resids**2)
+    
+    return fcst, mse, resids
+
+def fitLevel(key, data, periods, include_history, cap, capF, changepoints, n_changepoints, \
                 yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, holidays_prior_scale,\
-                changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples):
+                changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples, init = None, profile = None, residuals = True, \
+                backend = None):
     """
     Parameters
     ----------
-    All largely the same as lastF
+    All largely the same as fitProphet
     
-    aggs - (dict of DataFrames) output of aggHier
+    key - (int) the aggregation level being fit
+    
+    data - (DataFrame) aggregated data for this level, the name of the first column is the pandas frequency (see aggHier)
+    
+    periods - (int) the number of periods to forecast at this level
+    
+    init - (dict or None) starting values for the optimiser from an earlier fit of this level, see prophetInit
+    
+    profile - (None, "time" or "iterations") measure the fit and predict of this level (see profiling.measure), and with
+               "iterations" count the optimiser iterations as well (see profiling.captureStan)
+    
+    residuals - (Boolean) work out mse and resids, see predictLevel
+    
+    backend - (function or None) the base forecaster of this level (see backends.py), None is Prophet
     
     
     Returns
     ----------
-    forecastsDict - (dict of DataFrames)  contains seasonalities and forecasts for all of the different temporal aggregation levels
+    key - (int) the aggregation level, so results can be matched up when levels are fit out of order
+    
+    fcst - (DataFrame) seasonalities and forecasts for this level
     
-    mse - (dict)  the mean square error and the estimator for error variance
+    mse - (float or None) the mean square error and the estimator for error variance
     
-    resids - (dict)  the error of the fitted values with respect to the data
+    resids - (numpy array or None) the error of the fitted values with respect to the data
+    
+    params - (dict) the fitted parameters of this level, to warm start the next fit of it
+    
+    records - (list) the profiling records of this level, empty if profile is None
+    """
+    freq = data.columns.tolist()[0]
+    data = data.rename(columns = {data.columns[0] : 'ds', data.columns[1] : 'y'}, copy = False)    # Shares the arrays of the level
+    if backend is not None:
+        options = {"cap" : cap, "capF" : capF, "changepoints" : changepoints, "n_changepoints" : n_changepoints, \
+                   "yearly_seasonality" : yearly_seasonality, "weekly_seasonality" : weekly_seasonality, "holidays" : holidays, \
+                   "seasonality_prior_scale" : seasonality_prior_scale, "holidays_prior_scale" : holidays_prior_scale, \
+                   "changepoint_prior_scale" : changepoint_prior_scale, "mcmc_samples" : mcmc_samples, \
+                   "interval_width" : interval_width, "uncertainty_samples" : uncertainty_samples}
+        if profile is None:
+            fcst, mse, resids, params = backend(data, freq, periods, include_history, residuals, key, init, options)
+            return key, fcst, mse, resids, params, []
+        with measure("fit", key, rows = len(data), warm = init is not None, backend = getattr(backend, "__name__", None)) as fitRecord:
+            fcst, mse, resids, params = backend(data, freq, periods, include_history, residuals, key, init, options)
+        return key, fcst, mse, resids, params, [fitRecord]
+    fitArgs = (data, freq, cap, capF, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, \
+               seasonality_prior_scale, holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, \
+               uncertainty_samples, init)
+    if profile is None:
+        model = fitModel(*fitArgs)
+        fcst, mse, resids = predictLevel(model, data, freq, periods, include_history, capF, residuals)
+        return key, fcst, mse, resids, prophetInit(model), []
+    ##
+    # Profiled, the same steps measured one at a time
+    ##
+    with measure("fit", key, rows = len(data), warm = init is not None) as fitRecord:
+        if profile == "iterations":
+            with captureStan(fitRecord):
+                model = fitModel(*fitArgs)
+        else:
+            model = fitModel(*fitArgs)
+    with measure("predict", key, periods = periods, history = include_history, residuals = residuals) as predictRecord:
+        fcst, mse, resids = predictLevel(model, data, freq, periods, include_history, capF, residuals)
+    
+    return key, fcst, mse, resids, prophetInit(model), [fitRecord, predictRecord]
+
+def levelTasks(aggs, h, include_history, cap, capF, changepoints, n_changepoints, \
+                yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, holidays_prior_scale,\
+                changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples, init = None, profile = None, \
+                residuals = True, backend = "prophet"):
+    """
+    Parameters
+    ----------
+    All the same as fitProphet and fitLevel
+    
+    Returns
+    ----------
+    tasks - (list of tuples) the arguments of fitLevel for every level, in the order of aggs
+    """
+    seasonal = max(aggs.keys())
+    tasks = []
+    for key in aggs.keys():
+        periods = int((h/seasonal)*key)
+        ##
+        # Prophet levels take fitLevel's own path, which can count Stan's iterations
+        ##
+        levelBackend = getBackend(backend, key)
+        tasks.append((key, aggs[key], periods, include_history, cap, capF, changepoints, n_changepoints, \
+                      yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, holidays_prior_scale, \
+                      changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples, \
+                      None if init is None else init.get(key), profile, residuals, \
+                      None if levelBackend is prophetBackend else levelBackend))
+    
+    return tasks
+
+def fitProphet(aggs, h, include_history, cap, capF, changepoints, n_changepoints, \
+                yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, holidays_prior_scale,\
+                changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples, executor = "serial", n_jobs = None, \
+                init = None, params = None, profiler = None, residuals = True, backend = "prophet", costs = None, \
+                time_budget = None, level_budget = None, fallbacks = None):
+    """
+    Parameters
+    ----------
+    All largely the same as lastF
+
+    aggs - (dict of DataFrames) output of aggHier
+
+    executor - (String or Executor) how the aggregation levels are fit, the levels are independent so they can be fit
+                concurrently.  One of "serial" (Default), "thread", "process" or a concurrent.futures Executor, see parallel.getExecutor.
+                A workers.WorkerPool is sent the levels as arrays
+
+    n_jobs - (int or None) the number of workers when executor is "thread" or "process"
+
+    init - (dict or None) level : starting values for the optimiser (see prophetInit), eg. the params of the fit at the
+            previous forecast origin.  Levels that are missing are fit from Prophet's usual starting values
+
+    params - (dict or None) if given, it is filled with level : fitted parameters, which can be passed as init next time
+
+    profiler - (Profiler or None) if given, the fit and predict of every level are added to it, see profiling.py.  The
+                optimiser iterations are only counted when the levels are not fit in threads (which includes the serial
+                executor with a budget, see budget.py)
+
+    residuals - (Boolean) work out mse and resids.  Only WLSV needs them, so without them and include_history only the
+                 periods ahead are predicted
+
+    backend - (String, function or dict) the base forecaster of every level, or aggregation level : backend, see
+               backends.getBackend.  Prophet (Default) unless told otherwise.  "map" fits Prophet's model without Stan,
+               see mapEngine.py.  Its levels are solved together in this process, so executor and n_jobs don't apply,
+               unless there is a budget
+
+    costs - (dict or None) if given, it is filled with level : the predicted cost of its fit, the seconds it took and the
+             chunk it was sent to the pool in (see scheduler.py), to compare with scheduler.calibrate.  Levels it already
+             has the seconds of are scheduled by those instead of the cost model, see scheduler.learnedCosts
+
+    time_budget - (float or None) seconds for fitting every level, levels not done by then are forecast with seasonal
+                   naive instead, see budget.py.  With backend = "map" each level is then solved on its own (in executor)
+                   so it can be timed and fall back by itself
+
+    level_budget - (float, dict or None) seconds for each level, or aggregation level : seconds, see budget.levelBudget
+
+    fallbacks - (dict or None) if given, it is filled with level : the budget it ran out of, for every level that was
+                 forecast with seasonal naive
+
+
+    Returns
+    ----------
+    forecastsDict - (dict of DataFrames)  contains seasonalities and forecasts for all of the different temporal aggregation levels
+
+    mse - (dict)  the mean square error and the estimator for error variance, None for every level without residuals
+
+    resids - (dict)  the error of the fitted values with respect to the data, None for every level without residuals
     """
     # Prophet related stuff
     ##
@@ -44,34 +301,47 @@ def fitProphet(aggs, h, include_history, cap, capF, changepoints, n_changepoints
     mse = {}
     resids = {}
     fcst = {}
-    for key in aggs.keys():
-        freq = aggs[key].columns.tolist()[0]
-        seasonal = max(aggs.keys())
-        aggs[key] = aggs[key].rename(columns = {aggs[key].columns[0] : 'ds'})
-        aggs[key] = aggs[key].rename(columns = {aggs[key].columns[1] : 'y'})
-        if 'AS-' in freq:
-            yearly_seasonality = False
-        if capF is None:
-            growth = 'linear'
-            m = Prophet(growth, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, \
-                        holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples)
-        else:
-            growth = 'logistic'
-            m = Prophet(growth, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, \
-                        holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples)
-            aggs[key]['cap'] = cap
-        m.fit(aggs[key])
-        periods = int((h/seasonal)*key)
-        future = m.make_future_dataframe(periods = periods, freq = freq, include_history = include_history) #Frequency is equal to our hard coded column name
-        if capF is not None:
-            future['cap'] = capF
-        fcst[key] = m.predict(future)
+    profile = None
+    if profiler is not None:
         ##
-        # Find MSE and resids
+        # Stan's iterations are counted at the stdout file descriptor (see profiling.captureStan), which threads share.
+        # With a budget the serial levels run in threads too, and one that runs out of time is left running
         ##
-        if periods == 0:
-            periods = 1
-        resids[key] = aggs[key].y.values - fcst[key].yhat[:-periods].values
-        mse[key] = np.mean(np.array(resids[key])**2)
-        
+        budgeted = time_budget is not None or level_budget is not None
+        threaded = executor == "thread" or isinstance(executor, ThreadPoolExecutor) or (budgeted and executor == "serial")
+        profile = "time" if threaded else "iterations"
+    tasks = levelTasks(aggs, h, include_history, cap, capF, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, \
+                       holidays, seasonality_prior_scale, holidays_prior_scale, changepoint_prior_scale, mcmc_samples, \
+                       interval_width, uncertainty_samples, init, profile, residuals, backend)
+    ##
+    # Results come back in the order of aggs no matter how they were run.  In a pool the levels are sent longest first,
+    # with the small ones packed together (see scheduler.py), or one at a time and watched when they have a time budget
+    # (see budget.py).  The NumPy MAP engine solves every level in one batch in this process instead, unless the stages
+    # are being profiled or there is a budget, then each level is fit and timed on its own
+    ##
+    keys = [task[0] for task in tasks]
+    levelCosts = [taskCost(task) for task in tasks]
+    report = None
+    if costs is not None:
+        levelCosts = learnedCosts(keys, levelCosts, costs)
+        report = []
+    if time_budget is not None or level_budget is not None:
+        results = budgetTasks(fitLevel, tasks, levelCosts, executor, n_jobs, time_budget, level_budget, report, fallbacks)
+    elif backend == "map" and profile is None:
+        results = mapLevels(tasks, levelCosts, report)
+    elif isinstance(executor, WorkerPool):
+        results = executor.fitLevels(tasks, levelCosts, report)
+    else:
+        results = scheduleTasks(fitLevel, tasks, levelCosts, executor, n_jobs, report)
+    if report is not None:
+        costs.update(zip(keys, report))
+    for key, levelFcst, levelMse, levelResids, levelParams, records in results:
+        fcst[key] = levelFcst
+        mse[key] = levelMse
+        resids[key] = levelResids
+        if params is not None:
+            params[key] = levelParams
+        for record in records:
+            profiler.add(record)
+
     return fcst, mse, resids
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains a stateful version of lastF for series that keep getting new observations (eg. a new day every night).
+
+Instead of re-aggregating the whole history and refitting every level, the forecaster keeps the aggregated levels and
+the fitted Prophet models between calls.  New observations only add the buckets they complete, only the levels that
+gained a complete bucket are refit (starting the optimiser from the last fit's parameters), and the rest only have
+their forecasts extended when the horizon moves into a new cycle.
+
+A fitted forecaster can be saved to disk and loaded back (save and LastForecaster.load) with everything it needs to
+forecast again: the aggregation layout, the fitted models of every level, the BoxCox lambdas and the reconciliation.
+predict then gives reconciled forecasts for any horizon without refitting, eg. behind a forecasting service.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import os
+import sys
+import pickle
+import contextlib
+import pandas as pd
+from scipy.stats import boxcox
+from lastprophet.aggHier import aggHier
+from lastprophet.fitProphet import fitModel, predictLevel, prophetInit
+from lastprophet.reconcile import reconcile, getProjection
+from lastprophet.transform import boxcoxLevel
+##
+# Prophet's own serialisation (fbprophet 0.6 and later) is used for the saved models when it is there, older versions are pickled
+##
+try:
+    from fbprophet.serialize import model_to_json, model_from_json
+except ImportError:
+    model_to_json = None
+    model_from_json = None
+
+class LastForecaster(object):
+    """
+    Parameters
+    ----------
+
+    All the same as lastF, except
+
+    h - (int) the forecast horizon, rounded down to whole seasonal cycles (at least one)
+
+    warm_start - (Boolean) start each refit from the parameters of the previous fit of that level
+
+    transform - (None or "BoxCox") as in lastF.  The lambdas are found when the forecaster is fit, and the observations
+                 added by update are transformed with the same ones
+
+
+    Attributes
+    ----------
+
+    forecast - (dict of DataFrames) the reconciled forecasts from the last fit or update, the same as the output of lastF
+
+    refit - (list) the aggregation levels that were fit during the last fit or update
+
+    lambdas - (dict or None) aggregation level : BoxCox lambda, None without transform
+
+    projection - (reconcile.Projection) the reconciliation of the levels, kept so it is only built again when it changes
+
+    """
+    def __init__(self, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = True, cap = None, capF = None, \
+                 changepoints = None, n_changepoints = 25, yearly_seasonality = True, weekly_seasonality = 'auto', holidays = None, \
+                 seasonality_prior_scale = 10.0, holidays_prior_scale = 10.0, changepoint_prior_scale = 0.05, mcmc_samples = 0, \
+                 interval_width = 0.80, uncertainty_samples = 0, warm_start = True, transform = None):
+        if m <= 1:
+            sys.exit("Seasonal period (m) must be greater than 1")
+        if h < m:
+            sys.exit("The prediction length (h) should be at least as long as the seasonality (m)")
+        if aggList is not None:
+            if 1 not in aggList or m not in aggList:
+                sys.exit("1 and the seasonal period must be included in the aggList input")
+        self.m = int(m)
+        self.h = h
+        self.comb = comb
+        self.aggList = aggList
+        self.include_history = include_history
+        self.capF = capF
+        self.warm_start = warm_start
+        self.transform = transform
+        self.prophetArgs = (cap, capF, changepoints, n_changepoints, yearly_seasonality, weekly_seasonality, holidays, \
+                            seasonality_prior_scale, holidays_prior_scale, changepoint_prior_scale, mcmc_samples, \
+                            interval_width, uncertainty_samples)
+        self.y = None
+        self.forecast = None
+        self.refit = []
+        self.lambdas = None
+        self.projection = None
+
+    def fit(self, y):
+        """
+        Parameters
+        ----------
+
+        y - (DataFrame) the history, laid out like the input of lastF
+
+        Returns
+        ----------
+
+        forecast - (dict of DataFrames) reconciled forecasts, see lastF
+        """
+        if len(y) < 2*self.m:
+            sys.exit("Need at least 2 periods of data")
+        y = y.copy()
+        y[y.columns[0]] = pd.DatetimeIndex(y.iloc[:,0])
+        aggs = aggHier(y, self.m, self.aggList)
+        ##
+        # The buckets are lined up with the end of the history here and stay on that grid as observations are added
+        ##
+        self.y = y
+        self.origin = len(y) % self.m
+        self.levels = sorted(aggs.keys())
+        self.freqs = {key : aggs[key].columns[0] for key in self.levels}
+        self.data = {key : aggs[key].rename(columns = {aggs[key].columns[0] : 'ds', aggs[key].columns[1] : 'y'}).reset_index(drop = True) \
+                     for key in self.levels}
+        self.counts = {key : len(self.data[key]) for key in self.levels}
+        self.lambdas = None
+        self.projection = None
+        if self.transform == 'BoxCox':
+            self.lambdas = {}
+            fellBack = []
+            for key in self.levels:
+                key, transformed, self.lambdas[key], failed = boxcoxLevel(key, self.data[key].y.values)
+                self.data[key]['y'] = transformed
+                if failed:
+                    fellBack.append(key)
+            if len(fellBack) > 0:
+                print("It looks like scipy's boxcox function couldn't deal with your data at levels " + ", ".join(str(key) for key in fellBack) + \
+                      ". Proceeding with Natural Log Transform for them")
+        elif self.transform is not None:
+            print("Nothing will be transformed because the input was not = to 'BoxCox'")
+        self.models = {}
+        self.periods = {}
+        self.fcst = {}
+        self.mse = {}
+        self.resids = {}
+
+        return self._refresh(self.levels)
+
+    def update(self, newY):
+        """
+        Parameters
+        ----------
+
+        newY - (DataFrame) observations that come after the current history, with the same columns
+
+        Returns
+        ----------
+
+        forecast - (dict of DataFrames) reconciled forecasts, see lastF
+        """
+        if self.y is None:
+            sys.exit("The forecaster has to be fit before it can be updated")
+        newY = newY.copy()
+        newY.columns = self.y.columns
+        newY[newY.columns[0]] = pd.DatetimeIndex(newY.iloc[:,0])
+        if newY.iloc[:,0].min() <= self.y.iloc[-1,0]:
+            sys.exit("New observations must come after the end of the current history")
+        self.y = pd.concat([self.y, newY], ignore_index = True)
+        ##
+        # Only the buckets that the new observations complete are summed and added to each level
+        ##
+        observed = len(self.y) - self.origin
+        dates = self.y.iloc[:,0]
+        values = self.y.iloc[:,1].values
+        refit = []
+        for key in self.levels:
+            block = int(self.m/key)
+            count = int(observed/block)
+            if count > self.counts[key]:
+                start = self.origin + self.counts[key]*block
+                stop = self.origin + count*block
+                newRows = pd.DataFrame({'ds' : dates.iloc[start+block-1:stop:block].values, \
+                                        'y' : values[start:stop].reshape((-1, block)).sum(axis = 1)})
+                if self.lambdas is not None:
+                    newRows['y'] = boxcox(newRows.y.values.astype(float), lmbda = self.lambdas[key])
+                self.data[key] = pd.concat([self.data[key], newRows], ignore_index = True)
+                self.counts[key] = count
+                refit.append(key)
+
+        return self._refresh(refit)
+
+    def _refresh(self, refit):
+        """
+        Refit the levels in refit, extend the forecasts of any level whose horizon moved, then reconcile
+        """
+        ##
+        # Every level forecasts to the end of the same cycle: the rest of the current cycle plus h/m whole cycles
+        ##
+        cycles = int(self.h/self.m)
+        observed = len(self.y) - self.origin
+        lastCycle = -(-observed//self.m)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for key in self.levels:
+                if key in refit:
+                    init = None
+                    if self.warm_start and key in self.models:
+                        init = prophetInit(self.models[key])
+                    self.models[key] = fitModel(self.data[key], self.freqs[key], *self.prophetArgs, init = init)
+                periods = (lastCycle + cycles)*key - self.counts[key]
+                if key in refit or periods != self.periods[key]:
+                    self.fcst[key], self.mse[key], self.resids[key] = predictLevel(self.models[key], self.data[key], self.freqs[key], \
+                                                                                   periods, self.include_history, self.capF, \
+                                                                                   self.comb == "WLSV")
+                    self.periods[key] = periods
+        self.refit = list(refit)
+        ##
+        # Only WLSV's reconciliation depends on the fits, the rest come from the cache
+        ##
+        if self.projection is None or (self.comb == "WLSV" and len(refit) > 0):
+            self.projection = getProjection(self.levels, self.comb, self.mse)
+        self.forecast = reconcile(self.fcst, cycles*self.m, self.mse, self.resids, self.comb, self.lambdas, projection = self.projection)
+
+        return self.forecast
+
+    def predict(self, h):
+        """
+        Parameters
+        ----------
+
+        h - (int) the forecast horizon, rounded down to whole seasonal cycles (at least one).  It doesn't have to be the h
+             the forecaster was made with
+
+        Returns
+        ----------
+
+        forecast - (dict of DataFrames) reconciled forecasts from the current models, nothing is refit and the forecaster
+                    is left as it was
+        """
+        if self.y is None:
+            sys.exit("The forecaster has to be fit before it can predict")
+        if h < self.m:
+            sys.exit("The prediction length (h) should be at least as long as the seasonality (m)")
+        cycles = int(h/self.m)
+        observed = len(self.y) - self.origin
+        lastCycle = -(-observed//self.m)
+        fcst = {}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for key in self.levels:
+                periods = (lastCycle + cycles)*key - self.counts[key]
+                if periods == self.periods[key]:
+                    fcst[key] = self.fcst[key]
+                else:
+                    fcst[key] = predictLevel(self.models[key], self.data[key], self.freqs[key], periods, self.include_history, \
+                                             self.capF, False)[0]
+
+        return reconcile(fcst, cycles*self.m, self.mse, None, self.comb, self.lambdas, projection = self.projection)
+
+    def save(self, path):
+        """
+        Parameters
+        ----------
+
+        path - (String) the file to save the forecaster in, see load
+        """
+        with open(path, "wb") as out:
+            pickle.dump(self, out, protocol = pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Parameters
+        ----------
+
+        path - (String) a file written by save
+
+        Returns
+        ----------
+
+        forecaster - (LastForecaster) ready to predict or update without refitting
+        """
+        with open(path, "rb") as saved:
+            forecaster = pickle.load(saved)
+        if not isinstance(forecaster, cls):
+            sys.exit("The file does not hold a saved LastForecaster")
+        return forecaster
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if model_to_json is not None and self.y is not None:
+            state["models"] = {key : model_to_json(model) for key, model in self.models.items()}
+        return state
+
+    def __setstate__(self, state):
+        if model_from_json is not None and state["y"] is not None:
+            state["models"] = {key : model_from_json(model) if isinstance(model, str) else model for key, model in state["models"].items()}
+        self.__dict__.update(state)
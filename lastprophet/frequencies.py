@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds the registry of seasonal periods (m) that lastF knows how to aggregate.
+
+Prophet needs a pandas frequency for every aggregation level to make its future dataframe.  Each registered period
+has a base pandas offset (one period of the original series), and the frequency of a level is the base offset times
+the number of periods it sums, eg. summing 3 hours of an "H" series gives "3H".  Aliases can name a level something
+nicer ("D" instead of "24H"), and annual calendars name their top level after the month the series starts in.
+New calendars (eg. 15 minute telemetry) can be added with registerFrequency, without changing aggHier.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import sys
+import calendar
+from functools import lru_cache
+from pandas.tseries.frequencies import to_offset
+
+_registry = {}
+
+def registerFrequency(m, base, levels = None, aliases = None, annual = False):
+    """
+    Parameters
+    ----------
+
+    m - (int) the seasonal period, the number of base periods in one cycle eg. 96 quarter hours in a day
+
+    base - (String) pandas offset alias of one period of the original series eg. "H" or "15T"
+
+    levels - (list or None) the aggregation levels to use instead of every factor of m, eg. months and quarters of 252 trading days.
+              Must include 1 and m and only contain factors of m
+
+    aliases - (dict or None) block length (number of base periods summed) : pandas frequency to use instead of the worked out one
+
+    annual - (Boolean) True if one cycle is a year.  The top level is then named year start anchored on the month the
+              series starts in (eg. "AS-Jan"), which is also how fitProphet knows to turn off yearly seasonality for it
+
+    """
+    m = int(m)
+    if m <= 1:
+        sys.exit("Seasonal period (m) must be greater than 1")
+    if levels is not None:
+        levels = sorted(int(level) for level in levels)
+        if 1 not in levels or m not in levels or any(m % level != 0 for level in levels):
+            sys.exit("The levels must include 1 and m, and only contain factors of m")
+    to_offset(base)     # Fails now instead of when Prophet is called if the base isn't a pandas offset
+    _registry[m] = {"base" : base, "levels" : levels, "aliases" : dict(aliases or {}), "annual" : annual}
+
+def registeredFrequencies():
+    """
+    Returns
+    ----------
+
+    mList - (list) every seasonal period that can be aggregated
+    """
+    return sorted(_registry.keys())
+
+def getCalendar(m):
+    """
+    Parameters
+    ----------
+
+    m - (int) the seasonal period
+
+    Returns
+    ----------
+
+    cal - (dict) the registered base, levels, aliases and annual flag of m
+    """
+    m = int(m)
+    if m not in _registry:
+        sys.exit("Sorry, your frequency did not match our list of registered ones.  Please enter m as one of " + \
+                 ",".join(str(key) for key in registeredFrequencies()) + " or add it with frequencies.registerFrequency")
+    return _registry[m]
+
+@lru_cache(maxsize = None)
+def factors(m):
+    """
+    Parameters
+    ----------
+
+    m - (int) the seasonal period
+
+    Returns
+    ----------
+
+    factors - (tuple) every factor of m in ascending order, worked out once per m
+    """
+    return tuple(i for i in range(1, m+1) if m % i == 0)
+
+def levelFreq(m, level, firstDate = None):
+    """
+    Parameters
+    ----------
+
+    m - (int) the seasonal period
+
+    level - (int) the aggregation level, the number of aggregated periods in one cycle
+
+    firstDate - (Timestamp) the first time instance of the level, only needed for the top level of an annual calendar
+
+    Returns
+    ----------
+
+    freq - (String) the pandas frequency of the level, for Prophet's make_future_dataframe
+    """
+    cal = getCalendar(m)
+    block = int(m/level)
+    if block in cal["aliases"]:
+        return cal["aliases"][block]
+    if block == m and cal["annual"]:
+        return 'AS-' + calendar.month_abbr[firstDate.month]
+    if block == 1:
+        return cal["base"]
+    return (to_offset(cal["base"])*block).freqstr
+
+##
+# The pre-defined calendars
+##
+registerFrequency(4, "Q", aliases = {2 : "6M"}, annual = True)
+registerFrequency(12, "M", aliases = {3 : "Q"}, annual = True)
+registerFrequency(52, "W", annual = True)
+registerFrequency(365, "D", annual = True)
+registerFrequency(252, "B", levels = [1, 4, 12, 21, 63, 252], annual = True)
+registerFrequency(8760, "H", aliases = {24 : "D", 120 : "5D", 1752 : "73D", 2190 : "Q", 2920 : "4M", 4380 : "6M"}, annual = True)
+registerFrequency(7, "D", aliases = {7 : "W"})
+registerFrequency(24, "H", aliases = {24 : "D"})
+registerFrequency(168, "H", aliases = {24 : "D", 168 : "W"})
+registerFrequency(96, "15T", aliases = {4 : "H", 96 : "D"})
+registerFrequency(288, "5T", aliases = {12 : "H", 288 : "D"})
+registerFrequency(1440, "T", aliases = {60 : "H", 1440 : "D"})
@@ -16,19 +16,23 @@ https://facebookincubator.github.io/prophet/
 It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
 
 """
-import pandas as pd
 import sys
 from lastprophet.fitProphet import fitProphet
-from lastprophet.aggHier import aggHier
+from lastprophet.aggHier import aggArrays, levelFrame
 from lastprophet.reconcile import reconcile
-from scipy.stats import boxcox
-import contextlib
-import os
+from lastprophet.transform import transformLevels
+from lastprophet.profiling import noStage
+from lastprophet.results import LastResult
+from lastprophet.parallel import quietStdout
+import time
 
 #%%
 def lastF(y, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = True, cap = None, capF = None, \
         changepoints = None, n_changepoints = 25, yearly_seasonality = True, weekly_seasonality = 'auto', holidays = None, seasonality_prior_scale = 10.0, \
-        holidays_prior_scale = 10.0, changepoint_prior_scale = 0.05, mcmc_samples = 0, interval_width = 0.80, uncertainty_samples = 0, transform = None):
+        holidays_prior_scale = 10.0, changepoint_prior_scale = 0.05, mcmc_samples = 0, interval_width = 0.80, uncertainty_samples = 0, transform = None, \
+        executor = "serial", n_jobs = None, projection = None, init = None, params = None, lambdas = None, \
+        profiler = None, verbose = False, compact = False, backend = "prophet", costs = None, time_budget = None, level_budget = None, \
+        fallbacks = None):
     """
         Parameters
         ----------------
@@ -39,7 +43,8 @@ def lastF(y, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = T
                      1st Col - Time instances
                      2nd Col - Total of TS
              
-        m - (int) frequency of time series eg. weekly is 52 (len(y) > 2*m)
+        m - (int) frequency of time series eg. weekly is 52 (len(y) > 2*m).  See frequencies.py for the periods that are
+         supported, others can be added with frequencies.registerFrequency
             
         h - (int) the forecast horizon for the time series
         
@@ -51,9 +56,13 @@ def lastF(y, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = T
                     "WLSV" - optimal combination by variance weighted least squares
                     "BU" - bottom up combination
         
+                    or a list of them, eg. ["BU", "OLS", "WLSS", "WLSV"], to compare methods.  The Prophet models are
+                    only fit once and every method is reconciled from the same base forecasts
+        
         aggList - (list) The factors that the user would like to consider for ex. m = 52, aggList = [1, 52] 
         
-        include_history - (Boolean) input for the forecasting function of Prophet
+        include_history - (Boolean) input for the forecasting function of Prophet.  If False, only the periods ahead are
+         predicted, which is much quicker on long series (the history is only predicted again for WLSV, which needs the errors)
                         
         cap - (Dataframe or Constant) carrying capacity of the input time series.  If it is a dataframe, then
          the number of columns must equal len(y.columns) - 1
@@ -67,7 +76,60 @@ def lastF(y, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = T
         n_changepoints - (constant or list) changepoints for the model to consider fitting. If it is a list, then
          the number of items must equal len(y.columns) - 1
           
-        transform - (None or "BoxCox") Do you want to transform your data before fitting the prophet function? If yes, type "BoxCox"
+        transform - (None or "BoxCox") Do you want to transform your data before fitting the prophet function? If yes, type "BoxCox".
+         Each aggregation level is transformed with its own lambda, and a level scipy's boxcox can't deal with is log transformed instead
+        
+        lambdas - (dict or None) aggregation level : BoxCox lambda.  Levels in it reuse that lambda instead of estimating
+         it again (eg. from the last time the series was forecast), and the lambdas of every level are put back into it
+        
+        profiler - (profiling.Profiler or None) if given, the wall time, CPU time (and peak memory if the profiler asks
+         for it) of every stage and of the fit and predict of every aggregation level are recorded in it, along with the
+         optimiser iterations and the size of each reconciliation.  See profiling.py
+        
+        verbose - (Boolean) let Prophet and Stan print what they are doing, instead of throwing it away
+        
+        compact - (Boolean or list) return a results.LastResult instead of the DataFrames, which only keeps ds and yhat
+         (and the components in the list, eg. ["yhat_lower", "yhat_upper"]) as arrays.  Much smaller when many series are kept
+        
+        executor - (String or Executor) how the aggregation levels are fit.  They are independent, so they can be fit concurrently
+        
+        	Options:
+                    "serial" - one after another (Default)
+                    "thread" - a pool of threads
+                    "process" - a pool of processes
+                    any concurrent.futures.Executor - an already running pool
+                    a workers.WorkerPool - warm processes kept between calls, for programs that call lastF many times
+        
+        n_jobs - (int or None) the number of workers for the "thread" and "process" executors, None uses the number of processors
+        
+        projection - (reconcile.Projection or None) an already built reconciliation for the same aggregation levels and comb,
+         shared between series by lastBatch so it is only factorised once
+        
+        init - (dict or None) aggregation level : starting values for Prophet's optimiser, usually the params of an earlier
+         run on the same series (eg. the previous origin of a rolling forecast).  Starting close to the answer takes far
+         fewer iterations.  A level whose starting values don't fit its model (eg. a different number of changepoints) is fit cold
+        
+        params - (dict or None) if given, it is filled with aggregation level : the fitted parameters (k, m, delta, beta, sigma_obs),
+         ready to be passed as init on the next run
+        
+        costs - (dict or None) if given, it is filled with aggregation level : the predicted and actual cost of its fit, see
+         fitProphet and scheduler.py
+        
+        time_budget - (float or None) seconds the whole call can take.  Levels still being fit when it runs out are forecast
+         with seasonal naive instead, so the call still returns reconciled forecasts (see budget.py).  With backend = "map"
+         and a budget, the levels are solved one at a time in executor instead of together, so each can be timed and fall back
+        
+        level_budget - (float, dict or None) seconds each level can take once it starts, or aggregation level : seconds with
+         an optional "default" entry, eg. {8760 : 120, "default" : 10}.  A level that runs out is forecast with seasonal naive
+        
+        fallbacks - (dict or None) if given, it is filled with aggregation level : "time_budget" or "level_budget" for every
+         level that ran out of time and was forecast with seasonal naive
+        
+        backend - (String, function or dict) the base forecaster of the levels (see backends.py), a registered name
+         ("prophet" (Default), "map", "fourier", "naive"), a function, or a dict of aggregation level : backend for a mix, eg.
+         {1 : "prophet", m : "prophet", "default" : "fourier"}.  "map" is Prophet's model fit in NumPy instead of Stan (see
+         mapEngine.py), every level is solved together in this process so executor and n_jobs only apply to it with a
+         time_budget or level_budget.  The Prophet inputs below only apply to the Prophet and map levels
         
         All other inputs - see Prophet
         
@@ -75,13 +137,49 @@ def lastF(y, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = T
         -----------------
          
         newDict - a dictionary of DataFrames with predictions, seasonalities and trends that can all be plotted
+         
+         If comb is a list, a dictionary of comb : newDict instead.  With compact, each newDict is a LastResult
         
+    """
+    start = time.perf_counter()
+    checkInputs(y, m, aggList)
+    ##
+    # Every stage is measured if there is a profiler, otherwise stage does nothing
+    ##
+    stage = noStage if profiler is None else profiler.stage
+    aggs, boxcoxT = prepareLevels(y, m, aggList, transform, lambdas, executor, n_jobs, stage)
+    ##
+    # Forecast.  Prophet's output is thrown away unless verbose, with one redirect shared by every call running in threads
+    # (see parallel.quietStdout).  Only WLSV uses the in-sample errors, so without it and include_history Prophet only
+    # predicts the periods ahead.  With a time budget, levels that run out of time are forecast with seasonal naive (see
+    # budget.py) and listed
+    ##
+    combs = comb if isinstance(comb, list) else [comb]
+    fellBack = {}
+    with quietStdout(not verbose):
+        with stage("fitProphet", levels = len(aggs)):
+            forecastsDict, mse, resids = fitProphet(aggs, h, include_history, cap, capF, changepoints, n_changepoints, \
+                                                     yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, \
+                                                     holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples, \
+                                                     executor, n_jobs, init, params, profiler, \
+                                                     residuals = "WLSV" in combs, backend = backend, costs = costs, \
+                                                     time_budget = None if time_budget is None else time_budget - (time.perf_counter() - start), \
+                                                     level_budget = level_budget, fallbacks = fellBack)
+    if len(fellBack) > 0:
+        print("Levels " + ", ".join(str(key) for key in sorted(fellBack)) + " ran out of their time budget" + \
+              ". Proceeding with Seasonal Naive forecasts for them")
+        if fallbacks is not None:
+            fallbacks.update(fellBack)
+
+    return reconcileCombs(forecastsDict, h, mse, resids, comb, boxcoxT, projection, compact, stage)
+
+def checkInputs(y, m, aggList = None):
+    """
+    Exits with a message if y, m and aggList can't be forecast, see lastF
     """
     ##
-    # Error Catching
+    # Error Catching.  y itself is never changed, the time instances are read as a DatetimeIndex by aggArrays
     ##
-    if not isinstance(y.iloc[:,0], pd.DatetimeIndex):
-        y.iloc[:,0] = pd.DatetimeIndex(y.iloc[:,0])
     if m <= 1:
         sys.exit("Seasonal period (m) must be greater than 1")
     if len(y) < 2*m:
@@ -89,50 +187,76 @@ def lastF(y, m = 12, h = 12*2, comb = "OLS", aggList = None, include_history = T
     if aggList is not None:
         if 1 not in aggList or m not in aggList:
             sys.exit("1 and the seasonal period must be included in the aggList input")
+
+def prepareLevels(y, m, aggList = None, transform = None, lambdas = None, executor = "serial", n_jobs = None, stage = noStage):
+    """
+    Parameters
+    ----------
+    
+    y, m, aggList, transform, lambdas, executor, n_jobs - see lastF
+    
+    stage - (function) measures each step, see profiling.Profiler.stage
+    
+    Returns
+    ----------
+    
+    aggs - (dict of DataFrames) the aggregated (and transformed) data of every level, ready for fitProphet
+    
+    boxcoxT - (dict or None) aggregation level : the BoxCox lambda used, None without transform
+    """
     ##
-    # Compute Aggregate Time Series and return a dictionary of dataframes
+    # Compute Aggregate Time Series as read only arrays that share memory with y where they can (see aggHier.Level)
     ##
-    aggs = aggHier(y, m, aggList)
+    with stage("aggregate", rows = len(y)):
+        levels = aggArrays(y, m, aggList)
     ##
-    # Transform Variables
+    # Transform Variables.  Each level gets its own lambda (see transform.py), the levels are only read
     ##
+    boxcoxT = None
     if transform is not None:
         if transform == 'BoxCox':
-            import warnings
-            warnings.simplefilter("error", RuntimeWarning)
-            boxcoxT = [None]*(len(aggs.keys()))
-            try:
-                i = 0
-                placeHold = []
-                for key in sorted(aggs.keys()):
-                    placeHold.append(aggs[key].copy())
-                    placeHold[i].iloc[:, 1], boxcoxT[i] = boxcox(placeHold[i].iloc[:, 1])
-                    i += 1
-                i = 0
-                for key in sorted(aggs.keys()):
-                    aggs[key] = placeHold[i]
-                    i += 1
-            ##
-            # Does a Natural Log Transform if scipy's boxcox cant deal
-            ##
-            except RuntimeWarning:
-                print("It looks like scipy's boxcox function couldn't deal with your data. Proceeding with Natural Log Transform")
-                i = 0
-                for key in sorted(aggs.keys()):
-                    aggs[key].iloc[:, 1] = boxcox(aggs[key].iloc[:, 1], lmbda = 0)
-                    boxcoxT[i] = 0
-                    i += 1
+            with stage("transform", cached = 0 if lambdas is None else len(lambdas)):
+                levels, boxcoxT, fellBack = transformLevels(levels, lambdas, executor, n_jobs)
+            if len(fellBack) > 0:
+                print("It looks like scipy's boxcox function couldn't deal with your data at levels " + ", ".join(str(key) for key in fellBack) + \
+                      ". Proceeding with Natural Log Transform for them")
+            if lambdas is not None:
+                lambdas.update(boxcoxT)
         else:
             print("Nothing will be transformed because the input was not = to 'BoxCox'")
-    else:
-        boxcoxT = None
+    
+    return {key : levelFrame(levels[key]) for key in levels.keys()}, boxcoxT
+
+def reconcileCombs(forecastsDict, h, mse, resids, comb, boxcoxT = None, projection = None, compact = False, stage = noStage):
+    """
+    Parameters
+    ----------
+    
+    forecastsDict, mse, resids - the base forecasts, see fitProphet
+    
+    h, comb, projection, compact - see lastF
+    
+    boxcoxT - (dict or None) the lambdas to transform back with, see prepareLevels
+    
+    stage - (function) measures each reconciliation, see profiling.Profiler.stage
+    
+    Returns
+    ----------
+    
+    newDict - the output of lastF
+    """
     ##
-    # Forecast and Reconcile
+    # Reconcile.  reconcile leaves the base forecasts alone, so every method in a list works from the same fit
     ##
-    with contextlib.redirect_stdout(open(os.devnull, "w")):
-        forecastsDict, mse, resids = fitProphet(aggs, h, include_history, cap, capF, changepoints, n_changepoints, \
-                                                 yearly_seasonality, weekly_seasonality, holidays, seasonality_prior_scale, \
-                                                 holidays_prior_scale, changepoint_prior_scale, mcmc_samples, interval_width, uncertainty_samples)
-    newDict = reconcile(forecastsDict, h, mse, resids, comb, boxcoxT)
+    m = max(forecastsDict.keys())
+    newDict = {}
+    for method in (comb if isinstance(comb, list) else [comb]):
+        shared = projection if projection is not None and projection.comb == method else None
+        with stage("reconcile", comb = method, rows = sum(forecastsDict.keys()), columns = m, years = int(h/m)):
+            newDict[method] = reconcile(forecastsDict, h, mse, resids, method, boxcoxT, projection = shared)
+        if compact:
+            newDict[method] = LastResult.fromForecasts(newDict[method], compact if isinstance(compact, list) else None)
+    if isinstance(comb, list):
+        return newDict
 
-    return newDict
\ No newline at end of file
+    return newDict[comb]
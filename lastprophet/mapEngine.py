@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds a NumPy engine for the MAP fit of Prophet's linear model (backend = "map"), without Stan.
+
+With mcmc_samples = 0 Prophet finds the mode of its posterior:
+
+    y/y_scale ~ Normal(trend(t) + X beta, sigma_obs)
+    trend(t) = k t + m + sum over changepoints j of delta_j (t - s_j) for t >= s_j
+    k, m ~ Normal(0, 5),  delta ~ Laplace(0, changepoint_prior_scale),  beta ~ Normal(0, prior scales),  sigma_obs ~ Normal(0, 0.5)
+
+where t is time scaled to [0, 1] over the history and X holds the Fourier terms of the seasonalities (worked out the
+way Prophet does, including its 'auto' rules) and the holiday indicators.  For a fixed sigma_obs that is a least
+squares problem with ridge priors and an L1 prior on the changepoints, which is solved by iteratively reweighted least
+squares (the L1 term becomes a ridge whose weights follow the last solution), and sigma_obs has a closed form given the
+residuals.  The two are alternated until the coefficients stop changing.  Only X'X, X'y and y'y are needed in the loop,
+so every level is solved at once as one batch of small (p x p) systems, however long the levels are.
+
+The forecast has ds, trend, the seasonalities, holidays, seasonal (their sum) and yhat, like Prophet's, but no
+uncertainty intervals.  params are in Prophet's form (k, m, delta, beta, sigma_obs), so they can warm start Prophet
+and the other way around.  Logistic growth (capF) and mcmc_samples > 0 are handed to Prophet.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import time
+import numpy as np
+import pandas as pd
+from lastprophet.backends import registerBackend, prophetBackend, futureDates
+
+##
+# Prophet's default seasonalities, name : (period in days, Fourier order)
+##
+SEASONALITIES = {"yearly" : (365.25, 10), "weekly" : (7, 3), "daily" : (1, 4)}
+
+##
+# The days of history Prophet's 'auto' setting needs before it turns a seasonality on
+##
+AUTO_SPAN = {"yearly" : 730, "weekly" : 14, "daily" : 2}
+
+##
+# The Prophet inputs in the order fitProphet takes them
+##
+OPTIONS = ["cap", "capF", "changepoints", "n_changepoints", "yearly_seasonality", "weekly_seasonality", "holidays", \
+           "seasonality_prior_scale", "holidays_prior_scale", "changepoint_prior_scale", "mcmc_samples", "interval_width", \
+           "uncertainty_samples"]
+
+##
+# The smallest sigma_obs (on the scale of y/y_scale) the solver goes down to, see solveMAP
+##
+MIN_SIGMA = 1e-4
+
+def seasonalityOrder(name, setting, ds):
+    """
+    Parameters
+    ----------
+
+    name - (String) "yearly", "weekly" or "daily"
+
+    setting - (Boolean, int or 'auto') the input given to Prophet
+
+    ds - (Series) the time instances of the history
+
+    Returns
+    ----------
+
+    order - (int) the Fourier order of the seasonality, 0 if it is off.  'auto' follows Prophet: on if the history is at
+             least two cycles long and the observations are closer together than the cycle
+    """
+    period, order = SEASONALITIES[name]
+    if setting == 'auto':
+        span = (ds.max() - ds.min())/pd.Timedelta(days = 1)
+        spacing = np.min(np.diff(ds.values))/np.timedelta64(1, 'D') if len(ds) > 1 else period
+        return order if span >= AUTO_SPAN[name] and spacing < period else 0
+    if setting is True:
+        return order
+    if setting is False or setting is None:
+        return 0
+    return int(setting)
+
+def fourierTerms(days, period, order):
+    """
+    sin and cos of every harmonic up to order, in Prophet's column order
+    """
+    return np.column_stack([fun(2.0*(i + 1)*np.pi*days/period) for i in range(order) for fun in (np.sin, np.cos)])
+
+def holidayTerms(ds, holidays, priorScale):
+    """
+    Parameters
+    ----------
+
+    ds - (DatetimeIndex) the time instances to make indicators for
+
+    holidays - (DataFrame) Prophet's holidays input, with columns holiday, ds and optionally lower_window, upper_window and prior_scale
+
+    priorScale - (float) the prior scale of holidays without their own
+
+    Returns
+    ----------
+
+    terms - (numpy 2d array) one indicator column per holiday and day of its window
+
+    scales - (list) the prior scale of each column
+    """
+    dates = ds.normalize()
+    columns = {}
+    scales = {}
+    for row in holidays.to_dict("records"):
+        lower = int(row.get("lower_window", 0)) if pd.notnull(row.get("lower_window", 0)) else 0
+        upper = int(row.get("upper_window", 0)) if pd.notnull(row.get("upper_window", 0)) else 0
+        scale = row.get("prior_scale", priorScale)
+        scale = priorScale if pd.isnull(scale) else float(scale)
+        for offset in range(lower, upper + 1):
+            name = "%s_%+d" % (row["holiday"], offset)
+            if name not in columns:
+                columns[name] = np.zeros(len(dates))
+                scales[name] = scale
+            columns[name][dates == pd.Timestamp(row["ds"]).normalize() + pd.Timedelta(days = offset)] = 1.0
+    if len(columns) == 0:
+        return np.zeros((len(dates), 0)), []
+    return np.column_stack(list(columns.values())), list(scales.values())
+
+def levelProblem(data, freq, periods, options, init = None):
+    """
+    Parameters
+    ----------
+
+    data - (DataFrame) the level with columns ds and y
+
+    freq, periods - see backends.py
+
+    options - (dict) the Prophet inputs, see backends.py
+
+    init - (dict or None) params of an earlier fit to start from, used if they have the same shape
+
+    Returns
+    ----------
+
+    problem - (dict) the design of the history and the periods ahead, the priors and the sufficient statistics
+               (X'X, X'y, y'y) the solver needs
+    """
+    ds = pd.DatetimeIndex(data.ds)
+    future = futureDates(data.ds, freq, periods)
+    allDs = ds.append(future)
+    n = len(ds)
+    y = np.asarray(data.y.values, dtype = float)
+    yScale = np.abs(y).max()
+    if yScale == 0:
+        yScale = 1.0
+    ##
+    # Trend.  Time is scaled to [0, 1] over the history, the changepoints are spread over the first 80% of it
+    ##
+    start = ds.min()
+    tScale = (ds.max() - start)/pd.Timedelta(days = 1)
+    t = ((allDs - start)/pd.Timedelta(days = 1)).values/tScale
+    if options["changepoints"] is not None:
+        changepoints = pd.DatetimeIndex(options["changepoints"])
+    else:
+        histSize = int(np.floor(n*0.8))
+        nChangepoints = min(options["n_changepoints"], histSize - 1)
+        if nChangepoints > 0:
+            changepoints = ds[np.linspace(0, histSize - 1, nChangepoints + 1).round().astype(int)[1:]]
+        else:
+            changepoints = ds[:0]
+    tChange = ((changepoints - start)/pd.Timedelta(days = 1)).values/tScale
+    if len(tChange) == 0:
+        tChange = np.array([0.0])
+    hinge = np.maximum(t[:, None] - tChange[None, :], 0)
+    ##
+    # Seasonalities and holidays
+    ##
+    yearly = False if 'AS-' in freq else options["yearly_seasonality"]
+    days = ((allDs - pd.Timestamp("1970-01-01"))/pd.Timedelta(days = 1)).values
+    blocks = [np.column_stack((t, np.ones(len(t)))), hinge]
+    scales = [5.0, 5.0] + [np.nan]*hinge.shape[1]
+    groups = {}
+    column = 2 + hinge.shape[1]
+    for name, setting in [("yearly", yearly), ("weekly", options["weekly_seasonality"]), ("daily", options.get("daily_seasonality", 'auto'))]:
+        order = seasonalityOrder(name, setting, data.ds)
+        if order > 0:
+            blocks.append(fourierTerms(days, SEASONALITIES[name][0], order))
+            scales.extend([options["seasonality_prior_scale"]]*(2*order))
+            groups[name] = (column, column + 2*order)
+            column += 2*order
+    if options["holidays"] is not None:
+        terms, holidayScales = holidayTerms(allDs, options["holidays"], options["holidays_prior_scale"])
+        if terms.shape[1] > 0:
+            blocks.append(terms)
+            scales.extend(holidayScales)
+            groups["holidays"] = (column, column + terms.shape[1])
+    design = np.hstack(blocks)
+    scales = np.array(scales, dtype = float)
+    history = design[:n]
+    yScaled = y/yScale
+    problem = {"design" : design, "ds" : allDs.values, "n" : n, "yScale" : yScale, "groups" : groups, "nDelta" : hinge.shape[1], \
+               "gram" : np.dot(history.T, history), "xty" : np.dot(history.T, yScaled), "yy" : np.dot(yScaled, yScaled), \
+               "precision" : np.where(np.isnan(scales), 0, 1/scales**2), "l1" : np.isnan(scales), \
+               "tau" : options["changepoint_prior_scale"], "theta" : None, "sigma" : 1.0}
+    ##
+    # Warm start from earlier params of the same shape
+    ##
+    if init is not None:
+        theta = paramsTheta(problem, init)
+        if theta is not None:
+            problem["theta"] = theta
+            problem["sigma"] = max(float(np.ravel(init["sigma_obs"])[0]), MIN_SIGMA)
+    return problem
+
+def paramsTheta(problem, params):
+    """
+    Parameters
+    ----------
+
+    problem - (dict) see levelProblem
+
+    params - (dict) k, m, delta, beta and sigma_obs, from this engine or from Prophet (see fitProphet.prophetInit)
+
+    Returns
+    ----------
+
+    theta - (numpy array or None) the coefficients in the order of the problem's design, None if params have another shape
+    """
+    delta = np.ravel(params.get("delta", []))
+    beta = np.ravel(params.get("beta", []))
+    p = problem["gram"].shape[0]
+    if p == 2 + len(delta) and len(beta) == 1:
+        beta = beta[:0]     # Prophet's placeholder column when there are no seasonalities, see levelForecast
+    if len(delta) != problem["nDelta"] or 2 + len(delta) + len(beta) != p:
+        return None
+    return np.concatenate(([np.ravel(params["k"])[0], np.ravel(params["m"])[0]], delta, beta))
+
+def logPosterior(problem, theta, sigma):
+    """
+    Prophet's log posterior (up to a constant) at theta and sigma_obs, the quantity solveMAP maximises
+    """
+    rss = problem["yy"] - 2*np.dot(theta, problem["xty"]) + np.dot(theta, np.dot(problem["gram"], theta))
+    return -problem["n"]*np.log(sigma) - rss/(2*sigma**2) - 2*sigma**2 - np.sum(np.abs(theta[problem["l1"]]))/problem["tau"] - \
+           0.5*np.sum(problem["precision"]*theta**2)
+
+def solveMAP(problems, iterations = 500, tol = 1e-9):
+    """
+    Parameters
+    ----------
+
+    problems - (list of dicts) see levelProblem
+
+    iterations - (int) the most reweighting steps
+
+    tol - (float) stop when no coefficient moves more than this
+
+    Returns
+    ----------
+
+    solutions - (list) (theta, sigma_obs) of every problem.  theta is k, m, delta then beta (on the scale of y/y_scale)
+    """
+    count = len(problems)
+    p = max(problem["gram"].shape[0] for problem in problems)
+    ##
+    # The problems are padded to the same size.  Padded coefficients have no data and a unit ridge, so they stay at 0
+    ##
+    gram = np.zeros((count, p, p))
+    xty = np.zeros((count, p))
+    precision = np.ones((count, p))
+    l1 = np.zeros((count, p), dtype = bool)
+    theta = np.zeros((count, p))
+    yy = np.array([problem["yy"] for problem in problems])
+    n = np.array([problem["n"] for problem in problems], dtype = float)
+    tau = np.array([problem["tau"] for problem in problems], dtype = float)
+    sigma2 = np.array([problem["sigma"] for problem in problems], dtype = float)**2
+    for i, problem in enumerate(problems):
+        size = problem["gram"].shape[0]
+        gram[i, :size, :size] = problem["gram"]
+        xty[i, :size] = problem["xty"]
+        precision[i, :size] = problem["precision"]
+        l1[i, :size] = problem["l1"]
+        theta[i, :size] = tau[i] if problem["theta"] is None else problem["theta"]
+    diag = np.arange(p)
+    for iteration in range(iterations):
+        ##
+        # The L1 prior |delta|/tau is majorised by delta^2/(2 tau |delta_last|), a ridge that is recomputed every step
+        ##
+        weights = np.where(l1, 1/(tau[:, None]*np.maximum(np.abs(theta), 1e-10)), precision)
+        system = gram/sigma2[:, None, None]
+        system[:, diag, diag] += weights
+        newTheta = np.linalg.solve(system, (xty/sigma2[:, None])[:, :, None])[:, :, 0]
+        ##
+        # sigma_obs maximises -n log(sigma) - rss/(2 sigma^2) - 2 sigma^2.  A level with fewer observations than coefficients
+        # is fit exactly and sigma_obs would go to 0, so it is kept above MIN_SIGMA to keep the systems well conditioned
+        ##
+        rss = np.maximum(yy - 2*np.sum(newTheta*xty, axis = 1) + np.einsum('li,lij,lj->l', newTheta, gram, newTheta), 0)
+        sigma2 = np.maximum((-n + np.sqrt(n**2 + 16*rss))/8, MIN_SIGMA**2)
+        moved = np.max(np.abs(newTheta - theta))
+        theta = newTheta
+        if moved < tol:
+            break
+    return [(theta[i, :problem["gram"].shape[0]], np.sqrt(sigma2[i])) for i, problem in enumerate(problems)]
+
+def levelForecast(problem, theta, sigma, data, include_history, residuals):
+    """
+    Parameters
+    ----------
+
+    problem - (dict) see levelProblem
+
+    theta, sigma - the solution, see solveMAP
+
+    data, include_history, residuals - see backends.py
+
+    Returns
+    ----------
+
+    fcst, mse, resids, params - see backends.py
+    """
+    design = problem["design"]
+    yScale = problem["yScale"]
+    n = problem["n"]
+    nDelta = problem["nDelta"]
+    columns = {"trend" : np.dot(design[:, :2 + nDelta], theta[:2 + nDelta])*yScale}
+    seasonal = np.zeros(len(design))
+    for name, (first, last) in problem["groups"].items():
+        columns[name] = np.dot(design[:, first:last], theta[first:last])*yScale
+        seasonal += columns[name]
+    columns["seasonal"] = seasonal
+    columns["yhat"] = columns["trend"] + seasonal
+    rows = slice(0, None) if include_history else slice(n, None)
+    fcst = pd.DataFrame({"ds" : problem["ds"][rows]})
+    for name, values in columns.items():
+        fcst[name] = values[rows]
+    ##
+    # Prophet gives a level without seasonalities or holidays a column of zeros, so beta always has one entry
+    ##
+    beta = theta[2 + nDelta:] if len(theta) > 2 + nDelta else np.zeros(1)
+    params = {"k" : theta[0], "m" : theta[1], "delta" : theta[2:2 + nDelta], "beta" : beta, "sigma_obs" : sigma}
+    if not residuals:
+        return fcst, None, None, params
+    resids = np.asarray(data.y.values, dtype = float) - columns["yhat"][:n]
+    return fcst, np.mean(resids**2), resids, params
+
+def supported(options):
+    """
+    True if the engine can fit a level with these Prophet inputs, logistic growth and MCMC are left to Prophet
+    """
+    return options["capF"] is None and not options["mcmc_samples"]
+
+def mapBackend(data, freq, periods, include_history, residuals, season, init, options):
+    """
+    The MAP fit of Prophet's model for one level, see the top of the file
+    """
+    if not supported(options):
+        return prophetBackend(data, freq, periods, include_history, residuals, season, init, options)
+    problem = levelProblem(data, freq, periods, options, init)
+    theta, sigma = solveMAP([problem])[0]
+    return levelForecast(problem, theta, sigma, data, include_history, residuals)
+
+def mapLevels(tasks, costs = None, report = None):
+    """
+    Parameters
+    ----------
+
+    tasks - (list of tuples) the arguments of fitLevel for every level, see fitProphet.levelTasks
+
+    costs - (list or None) the predicted cost of every task, only used for report
+
+    report - (list or None) see scheduler.scheduleTasks.  Each level is timed setting up its problem and its forecast,
+              plus a share of the batched solve in proportion to the size of its (X'X)
+
+    Returns
+    ----------
+
+    results - (list) what fitLevel returns for every task, with the MAP problems of all the levels solved as one batch.
+               Levels the engine doesn't support are fit with Prophet
+    """
+    from lastprophet.fitProphet import fitLevel
+    results = [None]*len(tasks)
+    seconds = [0.0]*len(tasks)
+    batch = []
+    for i, task in enumerate(tasks):
+        start = time.perf_counter()
+        key, data, periods, include_history = task[:4]
+        options = dict(zip(OPTIONS, task[4:17]))
+        init, profile, residuals = task[17:20]
+        if not supported(options):
+            results[i] = fitLevel(*task[:20])
+            seconds[i] = time.perf_counter() - start
+            continue
+        freq = data.columns.tolist()[0]
+        data = data.rename(columns = {data.columns[0] : 'ds', data.columns[1] : 'y'}, copy = False)
+        batch.append((i, key, data, include_history, residuals, levelProblem(data, freq, periods, options, init)))
+        seconds[i] = time.perf_counter() - start
+    if len(batch) > 0:
+        start = time.perf_counter()
+        solutions = solveMAP([problem for i, key, data, include_history, residuals, problem in batch])
+        solveTime = time.perf_counter() - start
+        sizes = np.array([problem["gram"].size for i, key, data, include_history, residuals, problem in batch], dtype = float)
+        for (i, key, data, include_history, residuals, problem), (theta, sigma), share in zip(batch, solutions, sizes/sizes.sum()):
+            start = time.perf_counter()
+            fcst, mse, resids, params = levelForecast(problem, theta, sigma, data, include_history, residuals)
+            results[i] = (key, fcst, mse, resids, params, [])
+            seconds[i] += time.perf_counter() - start + share*solveTime
+    if report is not None:
+        report.extend({"predicted" : None if costs is None else costs[i], "actual" : seconds[i], "chunk" : None} for i in range(len(tasks)))
+    return results
+
+registerBackend("map", mapBackend)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the helpers used to run independent pieces of work (aggregation levels, series) concurrently.
+The pools come from concurrent.futures so the user can choose between processes, threads or a plain serial loop,
+or hand in a pool they already have.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import os
+import sys
+import threading
+import contextlib
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+##
+# Prophet's output is thrown away by pointing sys.stdout at devnull, and sys.stdout is shared by every thread.  One
+# redirect is kept for every caller that wants quiet at the same time, counted under a lock, so calls that overlap in
+# threads never restore each other's stdout out of order or leave it on a closed file
+##
+_quiet = {"count" : 0, "stdout" : None, "devnull" : None}
+_quietLock = threading.Lock()
+
+@contextlib.contextmanager
+def quietStdout(quiet = True):
+    """
+    Parameters
+    ----------
+
+    quiet - (Boolean) throw away what is printed inside the block.  If False the block runs as it is
+
+    The first block to start opens devnull and the last one to finish puts sys.stdout back and closes it.  Wrap a whole
+    pool of threads in one block where possible, the blocks the workers then enter only add to the count
+    """
+    if not quiet:
+        yield
+        return
+    with _quietLock:
+        if _quiet["count"] == 0:
+            _quiet["devnull"] = open(os.devnull, "w")
+            _quiet["stdout"] = sys.stdout
+            sys.stdout = _quiet["devnull"]
+        _quiet["count"] += 1
+    try:
+        yield
+    finally:
+        with _quietLock:
+            _quiet["count"] -= 1
+            if _quiet["count"] == 0:
+                sys.stdout = _quiet["stdout"]
+                _quiet["devnull"].close()
+                _quiet["stdout"] = None
+                _quiet["devnull"] = None
+
+def getExecutor(executor = "serial", n_jobs = None, initializer = None, initargs = ()):
+    """
+    Parameters
+    ----------
+
+    executor - (String or Executor) how the work is run
+
+        	Options:
+                    "serial" - one after another in this process (Default)
+                    "thread" - a ThreadPoolExecutor
+                    "process" - a ProcessPoolExecutor
+                    any concurrent.futures.Executor - an already running pool, it is not shut down afterwards
+
+    n_jobs - (int or None) the number of workers, None lets concurrent.futures choose from the number of processors
+
+    initializer, initargs - called once in every worker of a pool created here, eg. to hand each process data that
+                             should not be pickled again with every task
+
+    Returns
+    ----------
+
+    pool - (Executor or None) the pool to submit to, None if the work should be run serially
+
+    owned - (Boolean) True if the pool was created here and the caller should shut it down
+
+    """
+    if isinstance(executor, Executor):
+        return executor, False
+    if executor == "serial":
+        return None, False
+    if n_jobs is not None and n_jobs < 1:
+        sys.exit("n_jobs must be at least 1")
+    if executor == "thread":
+        return ThreadPoolExecutor(max_workers = n_jobs, initializer = initializer, initargs = initargs), True
+    if executor == "process":
+        return ProcessPoolExecutor(max_workers = n_jobs, initializer = initializer, initargs = initargs), True
+    sys.exit("The executor must be 'serial', 'thread', 'process' or a concurrent.futures Executor")
+
+def mapTasks(func, tasks, executor = "serial", n_jobs = None):
+    """
+    Parameters
+    ----------
+
+    func - (function) a module level function (so it can be pickled for processes)
+
+    tasks - (list of tuples) the arguments for each call of func
+
+    executor, n_jobs - see getExecutor
+
+    Returns
+    ----------
+
+    results - (list) func(*task) for every task, in the same order as tasks no matter which finished first
+
+    """
+    pool, owned = getExecutor(executor, n_jobs)
+    if pool is None:
+        return [func(*task) for task in tasks]
+    try:
+        futures = [pool.submit(func, *task) for task in tasks]
+        results = [future.result() for future in futures]
+    finally:
+        if owned:
+            pool.shutdown()
+
+    return results
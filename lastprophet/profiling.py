@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds the timing instrumentation of lastF.
+
+Pass a Profiler to lastF (profiler = Profiler()) and every stage of the call is measured: aggregation, the BoxCox
+transform, the fit and predict of each aggregation level and each reconciliation.  Every measurement is a record
+(a dict) with the wall time, CPU time and, if asked for, the peak memory allocated during it, along with what the
+stage worked on (the level, the number of optimiser iterations Stan reported, the size of the reconciliation, ...).
+Records can be handed to a callback as they are made, eg. to send them to a metrics system, and report() puts them
+all in a DataFrame.  Without a Profiler none of this is run.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+import tracemalloc
+import contextlib
+import pandas as pd
+
+##
+# The absolute peak memory seen inside each stage that is being measured, innermost last, so that nested stages
+# can reset tracemalloc's peak without losing it for the stages around them
+##
+_peakStack = []
+
+@contextlib.contextmanager
+def measure(stage, level = None, **info):
+    """
+    Parameters
+    ----------
+
+    stage - (String) the name of the stage
+
+    level - (int or None) the aggregation level the stage worked on
+
+    info - anything else to record about the stage
+
+    Returns
+    ----------
+
+    record - (dict) yielded straight away, and filled in with wall (seconds), cpu (seconds of CPU time of this process)
+              and peak (bytes allocated at the peak, only if tracemalloc is tracing) when the block finishes
+    """
+    record = {"stage" : stage, "level" : level}
+    record.update(info)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if len(_peakStack) > 0:
+            _peakStack[-1] = max(_peakStack[-1], peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        _peakStack.append(current)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall"] = time.perf_counter() - wall
+        record["cpu"] = time.process_time() - cpu
+        if tracing:
+            peak = max(_peakStack.pop(), tracemalloc.get_traced_memory()[1])
+            record["peak"] = peak - current
+            if len(_peakStack) > 0:
+                _peakStack[-1] = max(_peakStack[-1], peak)
+
+@contextlib.contextmanager
+def noStage(stage, level = None, **info):
+    """
+    Stands in for Profiler.stage when nothing is being profiled, so the stages cost next to nothing
+    """
+    yield None
+
+def stanIterations(text):
+    """
+    Parameters
+    ----------
+
+    text - (String) what Stan printed while optimising
+
+    Returns
+    ----------
+
+    iterations - (int or None) the number of iterations, summed over every fit in text.  None if Stan didn't report any
+    """
+    ##
+    # Every fit starts with "Initial log joint probability", then one row per reported iteration that starts with its number
+    ##
+    iterations = None
+    for fit in text.split("Initial log joint probability")[1:]:
+        rows = re.findall(r"^\s*(\d+)\s+-?\d", fit, re.MULTILINE)
+        if rows:
+            iterations = (iterations or 0) + int(rows[-1])
+    return iterations
+
+@contextlib.contextmanager
+def captureStan(record):
+    """
+    Parameters
+    ----------
+
+    record - (dict) where to put the number of iterations, see stanIterations
+
+    Stan prints straight to the stdout of the process, around Python, so it is caught at the file descriptor.  That is
+    shared by every thread, so this should only be used when the levels are fit serially or in their own processes
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with tempfile.TemporaryFile(mode = "w+") as captured:
+        os.dup2(captured.fileno(), 1)
+        try:
+            yield record
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+            captured.seek(0)
+            record["iterations"] = stanIterations(captured.read())
+
+class Profiler(object):
+    """
+    Parameters
+    ----------
+
+    memory - (Boolean) also record the peak memory of every stage with tracemalloc.  This slows everything down, so it is off by default.
+              Levels that are fit in other processes are only timed
+
+    callback - (function or None) called with every record as soon as it is made
+
+    """
+    def __init__(self, memory = False, callback = None):
+        self.memory = memory
+        self.callback = callback
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, stage, level = None, **info):
+        """
+        Measure the block as a stage, see measure
+        """
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            with measure(stage, level, **info) as record:
+                yield record
+        finally:
+            if started:
+                tracemalloc.stop()
+            self.add(record)
+
+    def add(self, record):
+        """
+        Keep a record that was measured somewhere else (eg. a level fit in a worker)
+        """
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def report(self):
+        """
+        Returns
+        ----------
+
+        report - (DataFrame) one row per record in the order they finished, with columns stage, level, wall, cpu,
+                  peak and anything else that was recorded
+        """
+        return pd.DataFrame(self.records)
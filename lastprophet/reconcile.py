@@ -16,41 +16,354 @@ It was my intention to make some of the code look similar to certain sections in
 
 """
 
+import os
 import sys
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
-from scipy.special import inv_boxcox
+import scipy.sparse as sps
+from scipy.linalg import cho_solve, cholesky_banded, cho_solve_banded
+from lastprophet.transform import inverseLevels
 
-def summingMat(freqs):
+def summingMat(freqs, sparse = False):
     """
     Parameters
     ----------
     
     freqs - (list) the frequencies of the time series aggregates
     
+    sparse - (Boolean) if True the matrix is returned as a scipy.sparse CSR matrix, which only stores the ones.
+              For large seasonal periods (m = 8760) the dense matrix is mostly zeros and takes gigabytes of memory
+    
     Returns
     ----------
     
-    sumMat - (numpy 2d array) summing matrix (see Hyndmans online book for explanation)
+    sumMat - (numpy 2d array or scipy.sparse.csr_matrix) summing matrix (see Hyndmans online book for explanation)
     
     """
     m = max(freqs)  # Find the finest grain seasonality period
-    top = np.ones(m)    # Create the top layer of the matrix
-    bottom = np.identity(m)     # Create the bottom layer of the matrix
-    if len(freqs) > 2:      # if there is a layer beyond the top and bottom
-        freqs = set(freqs)^set([1, m])      # get rid of the top and bottom layer frequencies from the list of frequencies
-        freqs = list(freqs)                 
-        for freq in sorted(freqs):
-            pattern = np.concatenate([np.ones(freq), np.zeros(m)])  # Each layer has a pattern of 1s and 0s, create it
-            rowForm = np.tile(pattern, int((m/freq)-1))             # Repeat that pattern
-            rowForm = np.concatenate([rowForm, np.ones(freq)])
-            middle = rowForm.reshape((int(m/freq), m))              # Reshape the rowForm into a matrix
-            bottom = np.vstack((middle, bottom))                    # Put that matrix inbetween the top and bottom
-    
-    sumMat = np.vstack((top, bottom))
+    ##
+    # Every layer has one row per aggregate, and each row sums a block of m/freq consecutive bottom level periods,
+    # so every column has exactly one 1 per layer and we only need to know which row it lands in
+    ##
+    rowInd = []
+    nRows = 0
+    for freq in sorted(freqs):
+        rowInd.append(nRows + np.arange(m)//int(m/freq))
+        nRows += freq
+    rowInd = np.concatenate(rowInd)
+    colInd = np.tile(np.arange(m), len(freqs))
+    sumMat = sps.csr_matrix((np.ones(len(colInd)), (rowInd, colInd)), shape = (nRows, m))
+    if not sparse:
+        sumMat = sumMat.toarray()
     
     return sumMat
 
-def reconcile(forecastsDict, h, mse = None, resids = None, comb = "BU", boxcoxT = None):
+def diagInverse(freqs, comb, mse = None):
+    """
+    Parameters
+    ----------
+    
+    freqs - (list) the frequencies of the time series aggregates
+    
+    comb - (String) "OLS", "WLSS" or "WLSV", see reconcile
+    
+    mse - (dict) the mean square error of each aggregate, only needed for "WLSV"
+    
+    Returns
+    ----------
+    
+    diagInv - (numpy 1d array) the diagonal of the inverse of the weighting matrix, in the same row order as summingMat.
+               The inverse of a diagonal matrix is just the reciprocal of its diagonal, so no matrix is ever inverted
+    
+    """
+    m = max(freqs)
+    if comb == 'OLS':
+        diagInv = np.ones(sum(freqs))
+    if comb == 'WLSS':
+        diagInv = np.concatenate([np.repeat(freq/m, freq) for freq in sorted(freqs)])   # Each row of the summing matrix sums m/freq values
+    if comb == 'WLSV':
+        diagMat = [np.repeat(mse[key], key) for key in sorted(mse.keys())]   # The mse (error variance) of every row, level by level as in summingMat
+        diagInv = 1/(np.hstack(diagMat)+0.00001)  # Added a very small number to fix the singular matrix problem
+        ##
+        # The mse of different levels can be many orders of magnitude apart (eg. after a BoxCox transform).  Weights that
+        # small next to the largest one change nothing but leave (S'WS) singular in floating point, so they are kept
+        # within 10 orders of magnitude of it
+        ##
+        diagInv = np.maximum(diagInv, diagInv.max()*1e-10)
+    
+    return diagInv
+
+def bandWidth(freqs):
+    """
+    Parameters
+    ----------
+    
+    freqs - (list) the frequencies of the time series aggregates
+    
+    Returns
+    ----------
+    
+    width - (int) the largest block (m/freq) of the levels Projection keeps in its band, the coarser levels are the low
+             rank part.  Picked to make the factorisation cheapest, a band of width w costs about m*w^2 and k low rank
+             columns about m*w*k + k^3
+    
+    """
+    m = max(freqs)
+    best = None
+    for width in sorted(set(int(m/freq) for freq in freqs)):
+        rank = sum(freq for freq in freqs if int(m/freq) > width)
+        cost = m*width*(width + rank) + rank**3
+        if best is None or cost < best[0]:
+            best = (cost, width)
+    
+    return best[1]
+
+class Projection(object):
+    """
+    Solver engine for the optimal combination methods that uses the structure of the temporal hierarchy.
+    
+    Every aggregate is the sum of a block of m/freq consecutive bottom level periods, so each level adds a constant
+    (block x block) term along the diagonal of (S'WS).  The levels with small blocks (the bottom level and its near
+    neighbours) only reach a few diagonals away, so they make a banded matrix that is factorised with a banded Cholesky
+    decomposition.  The levels with large blocks have few aggregates, so they are a low rank term (one column per
+    aggregate) that is added back with the Woodbury identity.  For m = 8760 that is a band of 73 diagonals and 313 low
+    rank columns, instead of a dense (m x m) matrix and its O(m^3) factorisation.  Neither the inverse nor the
+    (n x n) betaEst is ever formed.
+    
+    Parameters
+    ----------
+    
+    freqs - (list) the frequencies of the time series aggregates
+    
+    comb - (String) "BU", "OLS", "WLSS" or "WLSV", see reconcile
+    
+    mse - (dict) the mean square error of each aggregate, only needed for "WLSV"
+    
+    factor - (tuple of numpy 2d arrays) the band, low rank and inner factors from an earlier Projection (eg. loaded from
+              disk), so the factorisation is skipped
+    
+    """
+    def __init__(self, freqs, comb, mse = None, factor = None):
+        self.freqs = sorted(int(freq) for freq in freqs)
+        self.m = max(self.freqs)
+        self.comb = comb
+        if comb == 'BU':
+            self.diagInv = None
+            self.factor = None
+            return
+        self.diagInv = diagInverse(freqs, comb, mse)
+        self.width = bandWidth(self.freqs)
+        self.lowRank = [freq for freq in self.freqs if int(self.m/freq) > self.width]
+        if factor is not None:
+            self.factor = tuple(factor)
+            return
+        ##
+        # The band, stored by diagonals (row d is the d-th diagonal below the main one).  Inside a block every pair of
+        # periods gets the row's weight, so period j and j+d share it when they are in the same block
+        ##
+        band = np.zeros((self.width, self.m))
+        weights = {}
+        start = 0
+        for freq in self.freqs:
+            weights[freq] = self.diagInv[start:start+freq]
+            start += freq
+        j = np.arange(self.m)
+        for freq in self.freqs:
+            block = int(self.m/freq)
+            if block > self.width:
+                continue
+            spread = np.repeat(weights[freq], block)
+            for d in range(block):
+                band[d, :self.m-d] += np.where(j[:self.m-d] % block + d < block, spread[:self.m-d], 0.0)
+        bandFactor = cholesky_banded(band, lower = True, overwrite_ab = True, check_finite = False)
+        ##
+        # Woodbury - (B + U C U')^-1 = B^-1 - B^-1 U (C^-1 + U' B^-1 U)^-1 U' B^-1, where the columns of U mark the
+        # periods each coarse aggregate sums and C holds their weights
+        ##
+        rank = sum(self.lowRank)
+        spreadCols = np.zeros((self.m, rank))
+        col = 0
+        for freq in self.lowRank:
+            spreadCols[j, col + j//int(self.m/freq)] = 1.0
+            col += freq
+        lowFactor = cho_solve_banded((bandFactor, True), spreadCols, overwrite_b = True, check_finite = False)
+        inner = self.blockSums(lowFactor) + np.diag(1/np.concatenate([weights[freq] for freq in self.lowRank] + [np.zeros(0)]))
+        innerFactor = np.linalg.cholesky(inner) if rank > 0 else np.zeros((0, 0))
+        self.factor = (bandFactor, lowFactor, innerFactor)
+    
+    def blockSums(self, values):
+        """
+        (U' values), the sums of the rows of values over the blocks of every low rank level.  values is (m x columns)
+        """
+        return np.concatenate([values.reshape((freq, int(self.m/freq), values.shape[1])).sum(axis = 1) for freq in self.lowRank] + \
+                              [np.zeros((0, values.shape[1]))])
+    
+    def solve(self, rhs):
+        """
+        Parameters
+        ----------
+        
+        rhs - (numpy 2d array) (m x columns)
+        
+        Returns
+        ----------
+        
+        solution - (numpy 2d array) (S'WS)^-1 rhs, from the factors
+        
+        """
+        bandFactor, lowFactor, innerFactor = self.factor
+        solution = cho_solve_banded((bandFactor, True), rhs, check_finite = False)
+        if lowFactor.shape[1] > 0:
+            solution -= np.dot(lowFactor, cho_solve((innerFactor, True), self.blockSums(solution), check_finite = False))
+        
+        return solution
+    
+    def summed(self, bottom, out = None):
+        """
+        Parameters
+        ----------
+        
+        bottom - (numpy 2d array) (years x m) bottom level values
+        
+        out - (list of numpy 2d arrays) optional (years x freq) arrays, one per level in ascending order, to write into
+        
+        Returns
+        ----------
+        
+        newMat - (numpy 2d array) (years x n) every aggregate of the bottom level values, equivalent to (S * bottom')'.
+                  If out is given, out is returned instead
+        
+        """
+        if out is None:
+            newMat = np.empty((bottom.shape[0], sum(self.freqs)))
+            out = np.split(newMat, np.cumsum(self.freqs)[:-1], axis = 1)
+        else:
+            newMat = out
+        for freq, level in zip(self.freqs, out):
+            np.sum(bottom.reshape((bottom.shape[0], freq, int(self.m/freq))), axis = 2, out = level)
+        
+        return newMat
+    
+    def apply(self, hatMat, out = None):
+        """
+        Parameters
+        ----------
+        
+        hatMat - (numpy 2d array) (years x n) base forecasts, ordered like the rows of the summing matrix (or (years x m)
+                  bottom level forecasts for "BU")
+        
+        out - (list of numpy 2d arrays) optional (years x freq) arrays, one per level in ascending order, to write into
+        
+        Returns
+        ----------
+        
+        newMat - (numpy 2d array) (years x n) reconciled forecasts, or out if it is given
+        
+        """
+        if self.comb == 'BU':
+            return self.summed(hatMat, out)
+        ##
+        # Right hand side S'W^-1 y, each aggregate is spread back over the bottom level periods it sums
+        ##
+        weighted = hatMat*self.diagInv
+        rhs = np.zeros((hatMat.shape[0], self.m))
+        start = 0
+        for freq in self.freqs:
+            rhs += np.repeat(weighted[:, start:start+freq], int(self.m/freq), axis = 1)
+            start += freq
+        bottom = self.solve(rhs.T).T
+        
+        return self.summed(np.ascontiguousarray(bottom), out)
+
+##
+# Cache of Projections for the combinations that don't depend on the data (everything but WLSV), so repeated runs,
+# backtests and batches skip the factorisation.  Least recently used entries are dropped past maxsize, and if a
+# directory is set the factors (see Projection) are also saved there as .npy files and memory mapped back in
+##
+_projectionCache = OrderedDict()
+_cacheLock = threading.Lock()
+_cacheSettings = {"maxsize" : 8, "directory" : None}
+
+def setProjectionCache(maxsize = 8, directory = None):
+    """
+    Parameters
+    ----------
+    
+    maxsize - (int) the number of Projections kept in memory, 0 turns the cache off
+    
+    directory - (String or None) folder where factorisations are saved and reloaded from, None keeps them in memory only
+    
+    """
+    if maxsize < 0:
+        sys.exit("maxsize must be at least 0")
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with _cacheLock:
+        _cacheSettings["maxsize"] = maxsize
+        _cacheSettings["directory"] = directory
+        while len(_projectionCache) > maxsize:
+            _projectionCache.popitem(last = False)
+
+def clearProjectionCache():
+    """
+    Empties the in memory cache, files saved in the cache directory are left alone
+    """
+    with _cacheLock:
+        _projectionCache.clear()
+
+def getProjection(freqs, comb, mse = None):
+    """
+    Parameters
+    ----------
+    
+    freqs - (list) the frequencies of the time series aggregates
+    
+    comb - (String) "BU", "OLS", "WLSS" or "WLSV", see reconcile
+    
+    mse - (dict) the mean square error of each aggregate, only needed for "WLSV"
+    
+    Returns
+    ----------
+    
+    projection - (Projection) from the cache if it has been built before.  "WLSV" depends on the mse of each fit
+                  so it is always built fresh
+    
+    """
+    if comb == 'WLSV':
+        return Projection(freqs, comb, mse)
+    key = (tuple(sorted(int(freq) for freq in freqs)), comb)
+    with _cacheLock:
+        if key in _projectionCache:
+            _projectionCache.move_to_end(key)
+            return _projectionCache[key]
+        directory = _cacheSettings["directory"]
+    ##
+    # Look on disk, then build it
+    ##
+    paths = None
+    if directory is not None and comb != 'BU':
+        name = hashlib.md5(str(key).encode()).hexdigest()[:16]
+        paths = [os.path.join(directory, "projection_%s_%d_%s_%s.npy" % (comb, max(key[0]), name, part)) for part in ["band", "low", "inner"]]
+    if paths is not None and all(os.path.exists(path) for path in paths):
+        projection = Projection(key[0], comb, factor = [np.load(path, mmap_mode = 'r') for path in paths])
+    else:
+        projection = Projection(key[0], comb)
+        if paths is not None:
+            for path, factor in zip(paths, projection.factor):
+                np.save(path, factor)
+    with _cacheLock:
+        if _cacheSettings["maxsize"] > 0:
+            _projectionCache[key] = projection
+            _projectionCache.move_to_end(key)
+            while len(_projectionCache) > _cacheSettings["maxsize"]:
+                _projectionCache.popitem(last = False)
+    
+    return projection
+
+def reconcile(forecastsDict, h, mse = None, resids = None, comb = "BU", boxcoxT = None, sparse = None, solver = "structured", \
+              projection = None):
     """
     Parameters
     ----------
@@ -69,13 +382,27 @@ def reconcile(forecastsDict, h, mse = None, resids = None, comb = "BU", boxcoxT
                     "WLSV" - optimal combination by variance weighted least squares
                     "BU" - bottom up combination
     
-    boxcoxT - (list or None) if a list, then these are the lambda values that allow an inverse boxcox transform to take place
+    boxcoxT - (dict, list or None) if given, the lambda values of each level that allow an inverse boxcox transform to take
+               place, either aggregation level : lambda or a list in ascending order of the levels
+    
+    sparse - (Boolean or None) use a sparse summing matrix and never form the dense projection matrix (betaEst).
+              If None, the sparse path is used when the seasonal period is larger than 365.  Only used when solver = "inv"
+    
+    solver - (String) how the combination is solved
+    
+        	Options:
+                    "structured" - factorise (S'WS) as a band plus a low rank term using the block structure of the hierarchy, see Projection (Default)
+                    "inv" - form betaEst with explicit matrix inverses
+    
+    projection - (Projection or None) an already built Projection for these frequencies and comb, so that the factorisation
+                  can be shared between series.  Only used when solver = "structured"
     
     
     Returns
     ----------
     
-    forecastsDict - (dict of DataFrames) temporally revised forecasts
+    forecastsDict - (dict of DataFrames) temporally revised forecasts.  These are new DataFrames, the input is left as it
+                     was so the same base forecasts can be reconciled with every comb
     
     """
     ##
@@ -86,45 +413,41 @@ def reconcile(forecastsDict, h, mse = None, resids = None, comb = "BU", boxcoxT
         sys.exit("The minimum seasonal period should be 1 - Change aggList")
     if comb != "BU" and comb != "OLS" and comb != "WLSS" and comb != "WLSV":
         sys.exit("The reconciliation method must be one of the specified types, see instructions")
+    if solver != "structured" and solver != "inv":
+        sys.exit("The solver must be either 'structured' or 'inv'")
     m = max(freqs)
     if h < m:
         sys.exit("The prediction length (h) should be at least as long as the seasonality (m)")
+    if comb == "WLSV" and (mse is None or any(mse[key] is None for key in freqs)):
+        sys.exit("WLSV needs the mse of every level, fit them with residuals (see fitProphet)")
+    ##
+    # Copy on write - the new DataFrames share their columns with the input, and a column is only ever replaced with
+    # a new array (the inverse transformed columns and yhat), never written into
+    ##
+    forecastsDict = {key : forecastsDict[key].copy(deep = False) for key in freqs}
     ##
     # Get the Summing Matrix and Organize the Forecasts in the way needed
     ##
-    sumMat = summingMat(freqs)
+    if solver == 'inv':
+        if sparse is None:
+            sparse = m > 365
+        sumMat = summingMat(freqs, sparse)
     nCols = h/m
     ##
-    # Inverse Box Cox
+    # Inverse Box Cox, every component column of a level in one pass (see transform.py)
     ##
     if boxcoxT is not None:
-        i = 0
-        for key in sorted(forecastsDict.keys()):
-            forecastsDict[key].yhat = inv_boxcox(forecastsDict[key].yhat, boxcoxT[i])
-            forecastsDict[key].trend = inv_boxcox(forecastsDict[key].trend, boxcoxT[i])
-            if "seasonal" in forecastsDict[key].columns.tolist():
-                forecastsDict[key].seasonal = inv_boxcox(forecastsDict[key].seasonal, boxcoxT[i])
-            if "weekly" in forecastsDict[key].columns.tolist():
-                forecastsDict[key].weekly = inv_boxcox(forecastsDict[key].weekly, boxcoxT[i])
-            if "yearly" in forecastsDict[key].columns.tolist():
-                forecastsDict[key].yearly = inv_boxcox(forecastsDict[key].yearly, boxcoxT[i])
-            if "holidays" in forecastsDict[key].columns.tolist():
-                forecastsDict[key].yearly = inv_boxcox(forecastsDict[key].yearly, boxcoxT[i])
-            i += 1
+        forecastsDict = inverseLevels(forecastsDict, boxcoxT)
     ##
     # Bottom Up
     ##
     if comb == 'BU':
         hatMat = np.empty([int(nCols), 0])
         periods = int(h/m)*m                    # The number of full years * the seasonality constant
-        if h == m:
-            rowForm = np.array(forecastsDict[m].yhat[-(h+1):-(h-periods+1)])  # only include the forecasts that are (periods) ahead of the last value
-        else:
-            rowForm = np.array(forecastsDict[m].yhat[-(h):-(h-periods)])  # only include the forecasts that are (periods) ahead of the last value
+        rowForm = np.array(forecastsDict[m].yhat[-periods:])  # only include the forecasts that are (periods) ahead of the last value
         rowForm.shape = ((int(periods/m), m))
         chunk = rowForm
         hatMat = np.hstack((hatMat, chunk))
-        betaEst = sumMat  # This is what we will multiply by the normal forecasts
     ##
     # Optimal Combination
     ##
@@ -136,32 +459,63 @@ def reconcile(forecastsDict, h, mse = None, resids = None, comb = "BU", boxcoxT
             rowForm.shape = ((int(periods/key), key))
             chunk = rowForm
             hatMat = np.hstack((hatMat, chunk))
-    if comb == 'OLS':
-        betaEst = np.dot(np.dot(sumMat, np.linalg.inv(np.dot(np.transpose(sumMat), sumMat))),np.transpose(sumMat))  # See Hyndman's online textbook for explanation
-    if comb == 'WLSS':
-        diagMat = np.diag(np.transpose(np.sum(sumMat, axis = 1)))  # Create a matrix that describes the structure of the hierarchy
-        betaEst = np.dot(np.dot(np.dot(sumMat, np.linalg.inv(np.dot(np.dot(np.transpose(sumMat), np.linalg.inv(diagMat)), sumMat))), np.transpose(sumMat)), np.linalg.inv(diagMat))
-    if comb == 'WLSV':
-        diagMat = [np.repeat(mse[key], key) for key in sorted(mse.keys())]   # Create matrix of mse (error variance) values
-        diagMat = np.diag(np.flip(np.hstack(diagMat)+0.00001, 0))  # Added a very small number to fix the singular matrix problem
-        betaEst = np.dot(np.dot(np.dot(sumMat, np.linalg.inv(np.dot(np.dot(np.transpose(sumMat), np.linalg.inv(diagMat)), sumMat))), np.transpose(sumMat)), np.linalg.inv(diagMat))
     ##
-    # All
+    # The reconciled forecasts are written straight into the last periods of a new yhat array for each level, through a
+    # (years x key) view, so the whole horizon is one matrix product per level instead of one per year
     ##
-    newMat = np.empty([hatMat.shape[0],sumMat.shape[0]])
-    for i in range(hatMat.shape[0]):
-        newMat[i,:] = np.dot(betaEst, np.transpose(hatMat[i,:]))
+    yhats = {}
+    outs = []
+    for key in sorted(forecastsDict.keys()):
+        periods = int(h/m)*key
+        yhats[key] = np.array(forecastsDict[key].yhat.values, dtype = float)
+        outs.append(yhats[key][-periods:].reshape((int(periods/key), key)))
+    if solver == 'structured':
+        if projection is None:
+            projection = getProjection(freqs, comb, mse)
+        elif projection.freqs != sorted(freqs) or projection.comb != comb:
+            sys.exit("The projection was built for different aggregation levels or a different comb")
+        projection.apply(hatMat, outs)
+    elif not sparse:
+        if comb == 'BU':
+            betaEst = sumMat  # This is what we will multiply by the normal forecasts
+        if comb == 'OLS':
+            betaEst = np.dot(np.dot(sumMat, np.linalg.inv(np.dot(np.transpose(sumMat), sumMat))),np.transpose(sumMat))  # See Hyndman's online textbook for explanation
+        if comb == 'WLSS':
+            diagMat = np.diag(np.transpose(np.sum(sumMat, axis = 1)))  # Create a matrix that describes the structure of the hierarchy
+            betaEst = np.dot(np.dot(np.dot(sumMat, np.linalg.inv(np.dot(np.dot(np.transpose(sumMat), np.linalg.inv(diagMat)), sumMat))), np.transpose(sumMat)), np.linalg.inv(diagMat))
+        if comb == 'WLSV':
+            diagInv = np.diag(diagInverse(freqs, comb, mse))   # The same bounded weights as the other solvers, see diagInverse
+            betaEst = np.dot(np.dot(np.dot(sumMat, np.linalg.inv(np.dot(np.dot(np.transpose(sumMat), diagInv), sumMat))), np.transpose(sumMat)), diagInv)
+        ##
+        # All - (hatMat * betaEst') split by the rows of betaEst that belong to each level
+        ##
+        prevKey = 0
+        for out in outs:
+            np.dot(hatMat, np.transpose(betaEst[prevKey:prevKey+out.shape[1]]), out = out)
+            prevKey += out.shape[1]
     ##
-    # Put Matrix into a dictionary of dataframes
+    # Sparse - betaEst is (n x n) and dense, so it is never formed.  The products are taken from right to left
+    # so that the only dense matrices are the (m x m) inverse and the (m x years) forecasts
+    ##
+    else:
+        if comb == 'BU':
+            bottom = hatMat
+        else:
+            diagInv = sps.diags(diagInverse(freqs, comb, mse))
+            gramInv = np.linalg.inv(sumMat.T.dot(diagInv).dot(sumMat).toarray())
+            bottom = np.dot(gramInv, sumMat.T.dot(diagInv.dot(np.transpose(hatMat)))).T
+        ##
+        # S * bottom' split by level, transposed back into each level's view
+        ##
+        prevKey = 0
+        for out in outs:
+            out[:] = sumMat[prevKey:prevKey+out.shape[1]].dot(np.transpose(bottom)).T
+            prevKey += out.shape[1]
+    ##
+    # Put the arrays back into the dictionary of dataframes
     ##
-    prevKey = 0
     for key in sorted(forecastsDict.keys()):
-        periods = int(h/m)*key
-        values = forecastsDict[key].yhat.values
-        newDat = newMat[:,prevKey:prevKey+key].reshape(periods)
-        values[-periods:] = newDat.flatten()
-        forecastsDict[key].yhat = values
-        prevKey += key
+        forecastsDict[key].yhat = yhats[key]
         
     return forecastsDict
     
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds the compact result type of lastF (compact = True).
+
+Prophet's forecast of every level is a DataFrame with dozens of component columns, and lastF returns one per level.
+Kept for thousands of series that is more memory than the series themselves.  A LevelResult keeps only ds, yhat and
+the components asked for, each as one contiguous NumPy array, and only becomes a DataFrame when asked to.  LastResult
+is the dictionary of them for every aggregation level, and can be written to (and read back from) .npz, Parquet or Arrow
+for jobs downstream.  Parquet and Arrow need pyarrow (or fastparquet for Parquet).
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import numpy as np
+import pandas as pd
+
+class LevelResult(object):
+    """
+    Parameters
+    ----------
+
+    level - (int) the aggregation level
+
+    ds - (numpy array) the time instances
+
+    arrays - (dict) column name : values, the same length as ds.  yhat first, then the components
+
+    """
+    __slots__ = ["level", "ds", "arrays"]
+
+    def __init__(self, level, ds, arrays):
+        self.level = level
+        self.ds = np.ascontiguousarray(ds, dtype = 'datetime64[ns]')
+        self.arrays = {name : np.ascontiguousarray(values, dtype = float) for name, values in arrays.items()}
+
+    @classmethod
+    def fromFrame(cls, level, frame, components = None):
+        """
+        Parameters
+        ----------
+
+        level - (int) the aggregation level
+
+        frame - (DataFrame) a forecast with columns ds and yhat, eg. one level of the output of lastF
+
+        components - (list or None) the other columns to keep eg. ["yhat_lower", "yhat_upper", "trend"].  Ones the frame
+                      doesn't have are left out
+
+        Returns
+        ----------
+
+        result - (LevelResult) with copies of the columns kept, so the frame can be let go
+        """
+        columns = ["yhat"] + [column for column in (components or []) if column != "yhat" and column in frame.columns]
+        return cls(level, frame.ds.values, {column : frame[column].values for column in columns})
+
+    @property
+    def yhat(self):
+        return self.arrays["yhat"]
+
+    @property
+    def columns(self):
+        return ["ds"] + list(self.arrays.keys())
+
+    @property
+    def nbytes(self):
+        return self.ds.nbytes + sum(values.nbytes for values in self.arrays.values())
+
+    def __getitem__(self, name):
+        if name == "ds":
+            return self.ds
+        return self.arrays[name]
+
+    def __len__(self):
+        return len(self.ds)
+
+    def __repr__(self):
+        return "LevelResult(level = %d, rows = %d, columns = %s)" % (self.level, len(self), self.columns)
+
+    def toFrame(self):
+        """
+        Returns
+        ----------
+
+        frame - (DataFrame) ds and the kept columns, laid out like Prophet's forecast.  It is a copy, so changing it
+                 leaves the result alone
+        """
+        frame = pd.DataFrame({"ds" : self.ds})
+        for name, values in self.arrays.items():
+            frame[name] = values.copy()
+        return frame
+
+class LastResult(dict):
+    """
+    aggregation level : LevelResult.  It is a dictionary like the usual output of lastF, so result[key].yhat still
+    gives the forecasts of a level (as an array instead of a Series)
+    """
+    __slots__ = []
+
+    @classmethod
+    def fromForecasts(cls, forecastsDict, components = None):
+        """
+        Parameters
+        ----------
+
+        forecastsDict - (dict of DataFrames) the forecasts of every level, see lastF
+
+        components - (list or None) the columns to keep besides ds and yhat, see LevelResult.fromFrame
+
+        Returns
+        ----------
+
+        result - (LastResult)
+        """
+        return cls((key, LevelResult.fromFrame(key, forecastsDict[key], components)) for key in sorted(forecastsDict.keys()))
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.values())
+
+    def toFrames(self):
+        """
+        Returns
+        ----------
+
+        forecastsDict - (dict of DataFrames) level : the DataFrame of that level, see LevelResult.toFrame
+        """
+        return {key : self[key].toFrame() for key in self.keys()}
+
+    def toFrame(self):
+        """
+        Returns
+        ----------
+
+        frame - (DataFrame) every level in one long table with a level column first, the layout written to Parquet and Arrow
+        """
+        frames = []
+        for key in sorted(self.keys()):
+            frame = self[key].toFrame()
+            frame.insert(0, "level", key)
+            frames.append(frame)
+        return pd.concat(frames, ignore_index = True)
+
+    @classmethod
+    def fromFrame(cls, frame):
+        """
+        Parameters
+        ----------
+
+        frame - (DataFrame) the long table made by toFrame
+
+        Returns
+        ----------
+
+        result - (LastResult)
+        """
+        columns = [column for column in frame.columns if column not in ["level", "ds"]]
+        result = cls()
+        for key, rows in frame.groupby("level", sort = True):
+            result[int(key)] = LevelResult(int(key), rows.ds.values, {column : rows[column].values for column in columns})
+        return result
+
+    def toNpz(self, path, compressed = False):
+        """
+        Parameters
+        ----------
+
+        path - (String or file) where to write the arrays, one per level and column named "level/column"
+
+        compressed - (Boolean) use np.savez_compressed
+        """
+        arrays = {}
+        for key in self.keys():
+            arrays["%d/ds" % key] = self[key].ds
+            for name, values in self[key].arrays.items():
+                arrays["%d/%s" % (key, name)] = values
+        (np.savez_compressed if compressed else np.savez)(path, **arrays)
+
+    @classmethod
+    def fromNpz(cls, path):
+        """
+        Parameters
+        ----------
+
+        path - (String or file) an .npz file written by toNpz
+
+        Returns
+        ----------
+
+        result - (LastResult)
+        """
+        levels = {}
+        with np.load(path) as npz:
+            for name in npz.files:
+                key, column = name.split("/", 1)
+                levels.setdefault(int(key), {})[column] = npz[name]
+        result = cls()
+        for key in sorted(levels.keys()):
+            ds = levels[key].pop("ds")
+            yhat = levels[key].pop("yhat")
+            arrays = {"yhat" : yhat}
+            arrays.update(levels[key])
+            result[key] = LevelResult(key, ds, arrays)
+        return result
+
+    def toArrow(self):
+        """
+        Returns
+        ----------
+
+        table - (pyarrow.Table) the long table of toFrame
+        """
+        import pyarrow
+        return pyarrow.Table.from_pandas(self.toFrame(), preserve_index = False)
+
+    def toParquet(self, path):
+        """
+        Parameters
+        ----------
+
+        path - (String or file) where to write the long table of toFrame
+        """
+        self.toFrame().to_parquet(path, index = False)
+
+    @classmethod
+    def fromParquet(cls, path):
+        """
+        Parameters
+        ----------
+
+        path - (String or file) a Parquet file written by toParquet
+
+        Returns
+        ----------
+
+        result - (LastResult)
+        """
+        return cls.fromFrame(pd.read_parquet(path))
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds the cost model and scheduler used to run the aggregation levels (and the series of lastBatch) in a pool.
+
+The levels of one calendar differ in cost by orders of magnitude (the hourly level of m = 8760 has 8760 times the
+rows of the annual one), so handing them to a pool in the order of aggs can leave the biggest fit to start last while
+every other worker sits idle.  Each task gets a predicted cost instead, rows times the coefficients Prophet fits
+(trend, changepoints and seasonal terms), which is roughly how the optimiser's work grows, plus a fixed cost per fit.  Tasks are sent longest
+first, and the small ones (eg. levels fit with a NumPy backend) are packed together into chunks of up to a quarter of
+a worker's share of the work, so a pool doesn't pay its per task overhead for hundreds of tiny fits.
+
+The predicted cost of every task and the seconds it really took can be kept (see fitProphet's costs input) and
+compared with calibrate, to tune the model or spot tasks it gets wrong.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import os
+import time
+import numpy as np
+from concurrent.futures import wait, FIRST_COMPLETED
+from lastprophet.parallel import getExecutor
+from lastprophet.aggHier import aggLevels
+from lastprophet.mapEngine import OPTIONS, SEASONALITIES, seasonalityOrder
+
+##
+# Every fit costs about this much (in rows x coefficients) however small the level is, setting up the model and the
+# optimiser.  Measured with benchmarks/benchScheduler.py, where a fit took about 0.07s plus 3.5e-6s per row x coefficient
+##
+FIT_OVERHEAD = 20000
+
+##
+# The NumPy backends (see backends.py and mapEngine.py) are taken to be this many times cheaper than Prophet
+##
+NUMPY_SPEEDUP = 100
+
+##
+# Chunks of small tasks are filled up to this fraction of one worker's share of the work, but never past FIT_OVERHEAD.
+# Every Prophet fit is a chunk of its own then, a few of the smallest levels can take Prophet's optimiser far longer
+# than the model predicts and packing them together would put them all on one worker
+##
+CHUNK_SHARE = 0.25
+
+def levelCost(rows, changepoints, terms):
+    """
+    Parameters
+    ----------
+
+    rows - (int) the length of the level
+
+    changepoints - (int) the number of changepoints fit
+
+    terms - (int) the number of seasonal (Fourier) and holiday columns
+
+    Returns
+    ----------
+
+    cost - (float) the predicted cost of the fit, in rows x coefficients plus FIT_OVERHEAD
+    """
+    return float(FIT_OVERHEAD + rows*(2 + changepoints + terms))
+
+def taskCost(task):
+    """
+    Parameters
+    ----------
+
+    task - (tuple) the arguments of fitProphet.fitLevel for one level, see fitProphet.levelTasks
+
+    Returns
+    ----------
+
+    cost - (float) see levelCost, with the changepoints and seasonal terms Prophet would use for the level.  Levels fit
+            with a NumPy backend cost NUMPY_SPEEDUP times less
+    """
+    data = task[1]
+    options = dict(zip(OPTIONS, task[4:17]))
+    rows = len(data)
+    if options["changepoints"] is not None:
+        changepoints = len(options["changepoints"])
+    else:
+        changepoints = max(min(options["n_changepoints"], int(np.floor(rows*0.8)) - 1), 0)
+    ds = data.iloc[:, 0]
+    yearly = False if 'AS-' in data.columns[0] else options["yearly_seasonality"]
+    settings = {"yearly" : yearly, "weekly" : options["weekly_seasonality"], "daily" : 'auto'}
+    terms = sum(2*seasonalityOrder(name, settings[name], ds) for name in SEASONALITIES)
+    if options["holidays"] is not None:
+        terms += len(options["holidays"].holiday.unique())
+    if len(task) > 20 and task[20] is not None:
+        return levelCost(rows, changepoints, terms)/NUMPY_SPEEDUP
+    return levelCost(rows, changepoints, terms)
+
+def seriesCost(rows, m, aggList = None):
+    """
+    Parameters
+    ----------
+
+    rows - (int) the length of the series
+
+    m, aggList - see lastF
+
+    Returns
+    ----------
+
+    cost - (float) the predicted cost of every level of the series, with Prophet's default changepoints and a yearly
+            seasonality (the series itself isn't looked at, so it is cheap enough for a large batch)
+    """
+    try:
+        levels = aggLevels(m, rows, aggList)
+    except SystemExit:
+        return 0.0      # it can't be forecast, lastF reports why when it gets to it
+    return sum(levelCost(rows*key//m, max(min(25, int(np.floor(rows*key//m*0.8)) - 1), 0), 2*SEASONALITIES["yearly"][1]) \
+               for key in levels)
+
+def packChunks(costs, workers, share = CHUNK_SHARE):
+    """
+    Parameters
+    ----------
+
+    costs - (list of floats) the predicted cost of every task
+
+    workers - (int) the number of workers the tasks are shared between
+
+    share - (float) the fraction of one worker's share of the work a chunk of small tasks is filled up to (at most FIT_OVERHEAD)
+
+    Returns
+    ----------
+
+    chunks - (list of lists) the indices of the tasks sent together, most expensive chunk first and the most expensive
+              task first in each chunk.  A task costing more than the fill level is a chunk of its own
+    """
+    order = sorted(range(len(costs)), key = lambda i: -costs[i])
+    target = min(share*sum(costs)/max(workers, 1), FIT_OVERHEAD)
+    chunks = []
+    small = []
+    smallCost = 0.0
+    for i in order:
+        if costs[i] >= target:
+            chunks.append(([i], costs[i]))
+            continue
+        small.append(i)
+        smallCost += costs[i]
+        if smallCost >= target:
+            chunks.append((small, smallCost))
+            small = []
+            smallCost = 0.0
+    if len(small) > 0:
+        chunks.append((small, smallCost))
+    chunks.sort(key = lambda chunk: -chunk[1])
+    return [chunk for chunk, cost in chunks]
+
+def runChunk(func, tasks):
+    """
+    func(*task) for every task of a chunk, one after another in a worker.  Returns a list of (result, seconds)
+    """
+    results = []
+    for task in tasks:
+        start = time.perf_counter()
+        result = func(*task)
+        results.append((result, time.perf_counter() - start))
+    return results
+
+def workerCount(pool, n_jobs = None):
+    """
+    The number of workers of a pool, as well as it can be told
+    """
+    return getattr(pool, "n_jobs", None) or getattr(pool, "_max_workers", None) or n_jobs or os.cpu_count() or 1
+
+def streamTasks(pool, func, tasks, costs, workers, maxPending = None):
+    """
+    Parameters
+    ----------
+
+    pool - (Executor) where the chunks are run, see parallel.getExecutor
+
+    func - (function) a module level function, run as func(*task)
+
+    tasks - (list of tuples) the arguments for each call of func
+
+    costs - (list of floats) the predicted cost of every task, see taskCost and seriesCost
+
+    workers - (int) the number of workers of the pool
+
+    maxPending - (int or None) the most chunks in the pool at once, None sends them all straight away
+
+    Returns
+    ----------
+
+    generator of (index, result, seconds, chunk) - for every task in the order they finish.  index is its place in tasks
+     and chunk the number of the chunk it was sent in
+    """
+    chunks = packChunks(costs, workers)
+    pending = {}
+    def finished():
+        done, notDone = wait(pending, return_when = FIRST_COMPLETED)
+        for future in done:
+            number = pending.pop(future)
+            for i, (result, seconds) in zip(chunks[number], future.result()):
+                yield i, result, seconds, number
+    for number, chunk in enumerate(chunks):
+        pending[pool.submit(runChunk, func, [tasks[i] for i in chunk])] = number
+        if maxPending is not None and len(pending) >= maxPending:
+            yield from finished()
+    while len(pending) > 0:
+        yield from finished()
+
+def scheduleTasks(func, tasks, costs, executor = "serial", n_jobs = None, report = None):
+    """
+    Parameters
+    ----------
+
+    func, tasks, costs - see streamTasks
+
+    executor, n_jobs - see parallel.getExecutor.  A serial run keeps the order of tasks
+
+    report - (list or None) if given, filled with a dict per task of its predicted cost, the seconds it took and the chunk it was sent in
+
+    Returns
+    ----------
+
+    results - (list) func(*task) for every task, in the same order as tasks
+    """
+    pool, owned = getExecutor(executor, n_jobs)
+    if pool is None:
+        timed = [(i, result, seconds, i) for i, (result, seconds) in enumerate(runChunk(func, tasks))]
+    else:
+        try:
+            timed = list(streamTasks(pool, func, tasks, costs, workerCount(pool, n_jobs)))
+        finally:
+            if owned:
+                pool.shutdown()
+    results = [None]*len(tasks)
+    if report is not None:
+        report.extend([None]*len(tasks))
+    for i, result, seconds, chunk in timed:
+        results[i] = result
+        if report is not None:
+            report[i] = {"predicted" : costs[i], "actual" : seconds, "chunk" : chunk}
+    return results
+
+def learnedCosts(keys, predicted, costs):
+    """
+    Parameters
+    ----------
+
+    keys - (list) the level (or series) of every task
+
+    predicted - (list of floats) the cost model's prediction for every task
+
+    costs - (dict) the predicted and actual costs of an earlier run, see calibrate
+
+    Returns
+    ----------
+
+    predicted - (list of floats) with the tasks that were timed before costed by how long they took (in the units of the
+                 cost model, see calibrate), so a repeated run (eg. the next origin of a backtest) is scheduled from what
+                 was measured instead
+    """
+    timed = {key : cost for key, cost in costs.items() if cost.get("actual") is not None}
+    if len(timed) == 0:
+        return predicted
+    secondsPerUnit, ratios = calibrate(timed)
+    return [timed[key]["actual"]/secondsPerUnit if key in timed else cost for key, cost in zip(keys, predicted)]
+
+def calibrate(costs):
+    """
+    Parameters
+    ----------
+
+    costs - (dict) level (or series) : {"predicted", "actual", "chunk"}, see fitProphet's costs input
+
+    Returns
+    ----------
+
+    secondsPerUnit - (float) the seconds one unit of predicted cost took, fit by least squares through the origin
+
+    ratios - (dict) the same keys : actual over predicted seconds, far from 1 where the model is wrong about a task
+    """
+    predicted = np.array([cost["predicted"] for cost in costs.values()])
+    actual = np.array([cost["actual"] for cost in costs.values()])
+    secondsPerUnit = np.dot(predicted, actual)/np.dot(predicted, predicted)
+    return secondsPerUnit, {key : cost["actual"]/(secondsPerUnit*cost["predicted"]) for key, cost in costs.items()}
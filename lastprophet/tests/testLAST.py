@@ -1,10 +1,29 @@
 import unittest
+import sys
 import pandas as pd
 import numpy as np
 from lastprophet.aggHier import aggHier
 from lastprophet.fitProphet import fitProphet
-from lastprophet.reconcile import reconcile
+from lastprophet.reconcile import reconcile, summingMat, diagInverse, getProjection, setProjectionCache, clearProjectionCache
+import tempfile
 from lastprophet.last import lastF
+from lastprophet.batch import lastBatch
+from lastprophet.backtest import backtest
+from lastprophet.transform import inverseLevels
+from scipy.special import inv_boxcox
+from scipy.stats import boxcox
+import warnings
+from lastprophet.forecaster import LastForecaster
+from lastprophet.profiling import Profiler
+from lastprophet.results import LastResult
+from lastprophet.asyncLast import AsyncLast, lastFAsync
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+from lastprophet.backends import registerBackend, registeredBackends, fourierBackend
+from lastprophet.frequencies import registerFrequency, registeredFrequencies, levelFreq
+from lastprophet.workers import WorkerPool, packFrame, unpackFrame
+from lastprophet.scheduler import packChunks, learnedCosts, calibrate
 
 
 class testLASTOut(unittest.TestCase):
@@ -247,6 +266,628 @@ class testLASTOut(unittest.TestCase):
             myDict = lastF(data, m = 12, h = 12, comb = "FP")
         with self.assertRaises(SystemExit):
             myDict = lastF(data, m = 17, h = 12, comb = "WLSV")
+    
+    def testSparse(self):
+        ##
+        # Check that the sparse summing matrix matches the dense one
+        ##
+        for freqs in [[1,2,3,4,6,12], [1,5,73,365], [1,4,12,21,63,252]]:
+            dense = summingMat(freqs)
+            sparse = summingMat(freqs, sparse = True)
+            self.assertEqual(dense.shape, (sum(freqs), max(freqs)))
+            self.assertTrue(np.array_equal(dense, sparse.toarray()))
+        ##
+        # Check that reconciling with the sparse matrix gives the same forecasts as the dense one and the structured solver
+        ##
+        mse = {1 : 4.0, 5 : 3.0, 73 : 2.0, 365 : 1.0}
+        ##
+        # Each level is weighted by its own mse, on the rows summingMat gives it
+        ##
+        diagInv = diagInverse(list(mse.keys()), "WLSV", mse)
+        self.assertTrue(np.allclose(diagInv, np.repeat([1/4.0, 1/3.0, 1/2.0, 1/1.0], [1, 5, 73, 365]), rtol = 1e-4))
+        for comb in ["BU", "OLS", "WLSS", "WLSV"]:
+            forecastsDict = {key : pd.DataFrame({"yhat" : np.random.randint(100, 40000, size = 2*365)*(365/key)}) for key in mse.keys()}
+            dense = reconcile({key : frame.copy() for key, frame in forecastsDict.items()}, 365, mse, None, comb, sparse = False, solver = "inv")
+            sparse = reconcile({key : frame.copy() for key, frame in forecastsDict.items()}, 365, mse, None, comb, sparse = True, solver = "inv")
+            structured = reconcile(forecastsDict, 365, mse, None, comb, solver = "structured")
+            for key in mse.keys():
+                self.assertTrue(np.allclose(dense[key].yhat, sparse[key].yhat))
+                self.assertTrue(np.allclose(dense[key].yhat, structured[key].yhat))
+        ##
+        # Every solver bounds the WLSV weights the same way, so mse many orders of magnitude apart can still be reconciled
+        ##
+        mse = {1 : 4e40, 5 : 3.0, 73 : 2e20, 365 : 1.0}
+        for sparse, solver in [(False, "inv"), (True, "inv"), (None, "structured")]:
+            reconciled = reconcile(forecastsDict, 365, mse, None, "WLSV", sparse = sparse, solver = solver)
+            self.assertTrue(all(np.isfinite(reconciled[key].yhat).all() for key in mse.keys()))
+    
+    def testExecutor(self):
+        ##
+        # Fitting the levels concurrently should give exactly the same output as fitting them one after another
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        aggs = aggHier(data, m = 12)
+        serial = fitProphet(aggs, 12, True, None, None, None, 25, 'auto', 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+        for executor in ["thread", "process"]:
+            parallel = fitProphet(aggs, 12, True, None, None, None, 25, 'auto', 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0, \
+                                  executor = executor, n_jobs = 2)
+            self.assertEqual(list(serial[0].keys()), list(parallel[0].keys()))
+            for key in aggs.keys():
+                self.assertTrue(serial[0][key].equals(parallel[0][key]))
+                self.assertEqual(serial[1][key], parallel[1][key])
+                self.assertTrue(np.array_equal(serial[2][key], parallel[2][key]))
+        with self.assertRaises(SystemExit):
+            fitProphet(aggs, 12, True, None, None, None, 25, 'auto', 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0, executor = "gpu")
+        ##
+        # lastF called from many threads at once shares one redirect of stdout, and puts the caller's back at the end
+        ##
+        stdout = sys.stdout
+        with ThreadPoolExecutor(max_workers = 8) as pool:
+            list(pool.map(lambda i: lastF(data, m = 12, h = 12), range(16)))
+        self.assertIs(sys.stdout, stdout)
+        self.assertFalse(sys.stdout.closed)
+    
+    def testBatch(self):
+        ##
+        # Wide layout, one series is too short and should be reported without stopping the batch
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        for name in ["a", "b", "c"]:
+            data[name] = np.random.randint(100,40000,size=(len(date),1))
+        data.loc[:len(date)-10, "c"] = np.nan
+        stdout = sys.stdout
+        results = {name : (newDict, error) for name, newDict, error in lastBatch(data, m = 12, h = 12, executor = "thread", n_jobs = 2)}
+        self.assertIs(sys.stdout, stdout)
+        self.assertFalse(sys.stdout.closed)
+        self.assertEqual(sorted(results.keys()), ["a", "b", "c"])
+        self.assertIsNone(results["a"][1])
+        self.assertIsNone(results["b"][1])
+        self.assertIsNone(results["c"][0])
+        self.assertIsNotNone(results["c"][1])
+        myDict = results["a"][0]
+        self.assertAlmostEqual(myDict[1].yhat[0], sum(myDict[2].yhat[0:2]), delta = myDict[1].yhat[0])
+        ##
+        # Long layout gives the same forecasts
+        ##
+        longData = data.melt(id_vars = "day", value_vars = ["a", "b"], var_name = "series", value_name = "sessions")
+        for name, newDict, error in lastBatch(longData, m = 12, h = 12, idCol = "series", dateCol = "day", valueCol = "sessions", executor = "serial"):
+            self.assertIsNone(error)
+            for key in newDict.keys():
+                self.assertTrue(np.allclose(newDict[key].yhat, results[name][0][key].yhat))
+        ##
+        # The projection of one batch is not left behind for the next, eg. a different m and a comb list on the caller's pool
+        ##
+        quarters = pd.DataFrame(pd.date_range("2010-01-01", periods = 24, freq = "QS"), columns = ["day"])
+        quarters["a"] = np.random.randint(100,40000,size=(24,1))
+        with ThreadPoolExecutor(max_workers = 2) as pool:
+            for name, newDict, error in lastBatch(quarters, m = 4, h = 4, comb = ["OLS", "WLSS"], executor = pool):
+                self.assertIsNone(error)
+        self.assertIs(sys.stdout, stdout)
+        self.assertFalse(sys.stdout.closed)
+    
+    def testProjectionCache(self):
+        ##
+        # Projections that don't depend on the data are reused, WLSV is always rebuilt
+        ##
+        freqs = [1, 5, 73, 365]
+        clearProjectionCache()
+        self.assertIs(getProjection(freqs, "OLS"), getProjection(list(reversed(freqs)), "OLS"))
+        self.assertIsNot(getProjection(freqs, "WLSV", {1 : 1.0, 5 : 2.0, 73 : 3.0, 365 : 4.0}), \
+                         getProjection(freqs, "WLSV", {1 : 1.0, 5 : 2.0, 73 : 3.0, 365 : 4.0}))
+        ##
+        # Saved factorisations are loaded back from disk and give the same forecasts
+        ##
+        hatMat = np.random.rand(2, sum(freqs))
+        directory = tempfile.mkdtemp()
+        try:
+            setProjectionCache(maxsize = 1, directory = directory)
+            built = getProjection(freqs, "WLSS")
+            clearProjectionCache()
+            loaded = getProjection(freqs, "WLSS")
+            self.assertIsNot(built, loaded)
+            self.assertTrue(np.allclose(built.apply(hatMat), loaded.apply(hatMat)))
+            getProjection(freqs, "OLS")
+            self.assertIsNot(getProjection(freqs, "WLSS"), loaded)     # Pushed out by OLS
+        finally:
+            setProjectionCache()
+            clearProjectionCache()
+    
+    def testFrequencies(self):
+        ##
+        # Level frequencies are worked out from the base offset of the registered period
+        ##
+        self.assertEqual(levelFreq(8760, 8760), 'H')
+        self.assertEqual(levelFreq(8760, 2920), '3H')
+        self.assertEqual(levelFreq(8760, 365), 'D')
+        self.assertEqual(levelFreq(8760, 1, pd.Timestamp("2017-03-01")), 'AS-Mar')
+        self.assertEqual(levelFreq(252, 4, pd.Timestamp("2017-03-01")), '63B')
+        ##
+        # 15 minute data
+        ##
+        date = pd.date_range("2017-07-01", periods = 96*3, freq = "15T")
+        data = pd.DataFrame(date, columns = ["time"])
+        data["load"] = np.random.randint(100, 40000, size = (len(date), 1))
+        aggs = aggHier(data, m = 96)
+        self.assertEqual(len(aggs.keys()), 12)
+        self.assertEqual(aggs[96].columns[0], '15T')
+        self.assertEqual(aggs[24].columns[0], 'H')
+        self.assertEqual(aggs[1].columns[0], 'D')
+        self.assertEqual(aggs[1].iloc[0, 1], data.load.iloc[:96].sum())
+        ##
+        # A custom calendar, 10 minute data with a daily cycle
+        ##
+        date = pd.date_range("2017-07-01", periods = 144*3, freq = "10T")
+        data = pd.DataFrame(date, columns = ["time"])
+        data["load"] = np.random.randint(100, 40000, size = (len(date), 1))
+        with self.assertRaises(SystemExit):
+            aggHier(data, m = 144)
+        registerFrequency(144, "10T", aliases = {144 : "D"})
+        self.assertIn(144, registeredFrequencies())
+        aggs = aggHier(data, m = 144)
+        self.assertEqual(aggs[144].columns[0], '10T')
+        self.assertEqual(aggs[48].columns[0], '30T')
+        with self.assertRaises(SystemExit):
+            registerFrequency(144, "10T", levels = [1, 5, 144])
+    
+    def testForecaster(self):
+        ##
+        # Fit on the history, then add one month at a time
+        ##
+        date = pd.date_range("2013-01-01", "2017-12-31", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        forecaster = LastForecaster(m = 12, h = 12, comb = "OLS")
+        myDict = forecaster.fit(data.iloc[:-2])
+        self.assertEqual(forecaster.refit, [1, 2, 3, 4, 6, 12])
+        self.assertAlmostEqual(myDict[1].yhat.values[-1], sum(myDict[2].yhat.values[-2:]), delta = myDict[1].yhat.values[-1])
+        ##
+        # The first new month only completes a monthly bucket, the second completes a 2 month bucket as well
+        ##
+        myDict = forecaster.update(data.iloc[-2:-1])
+        self.assertEqual(forecaster.refit, [12])
+        myDict = forecaster.update(data.iloc[-1:])
+        self.assertEqual(forecaster.refit, [6, 12])
+        self.assertEqual(len(forecaster.data[12]), len(data) - forecaster.origin)
+        self.assertEqual(forecaster.data[6].y.values[-1], data.sessions.values[-2:].sum())
+        ##
+        # Every level forecasts to the end of the same cycle
+        ##
+        for key in myDict.keys():
+            self.assertEqual((forecaster.counts[key] + forecaster.periods[key])/key, 6)
+        self.assertAlmostEqual(myDict[1].yhat.values[-1], sum(myDict[12].yhat.values[-12:]), delta = myDict[1].yhat.values[-1])
+        with self.assertRaises(SystemExit):
+            forecaster.update(data.iloc[-1:])
+    
+    def testWarmStart(self):
+        ##
+        # The fitted parameters of every level come back in params and can start the fit at the next origin
+        ##
+        date = pd.date_range("2013-01-01", "2017-12-31", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        params = {}
+        myDict = lastF(data.iloc[:-1].copy(), m = 12, h = 12, comb = "OLS", params = params)
+        self.assertEqual(sorted(params.keys()), sorted(myDict.keys()))
+        for key in params.keys():
+            self.assertEqual(sorted(params[key].keys()), ['beta', 'delta', 'k', 'm', 'sigma_obs'])
+        warmParams = {}
+        myDict = lastF(data.copy(), m = 12, h = 12, comb = "OLS", init = params, params = warmParams)
+        self.assertEqual(sorted(warmParams.keys()), sorted(params.keys()))
+        self.assertAlmostEqual(myDict[1].yhat.values[-1], sum(myDict[2].yhat.values[-2:]), delta = myDict[1].yhat.values[-1])
+    
+    def testBacktest(self):
+        ##
+        # Every origin, comb and step ahead that has an observation gets a row
+        ##
+        date = pd.date_range("2012-01-01", "2017-12-31", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1)).astype(float)
+        errors = backtest(data, m = 12, h = 12, origins = [40, 50, 65], comb = ["OLS", "WLSV"], executor = "thread", n_jobs = 2)
+        self.assertFalse(sys.stdout.closed)
+        self.assertEqual(sorted(errors.comb.unique()), ["OLS", "WLSV", "base"])
+        self.assertEqual(list(errors.groupby("origin").size()), [36, 36, 21])
+        self.assertTrue(np.allclose(errors.error, errors.y - errors.yhat))
+        ##
+        # The reconciled forecasts at an origin are the same as lastF on the data up to it
+        ##
+        myDict = lastF(data.iloc[:50].copy(), m = 12, h = 12, comb = "OLS")
+        origin = errors[(errors.origin == 50) & (errors.comb == "OLS")]
+        self.assertTrue(np.allclose(origin.yhat.values, myDict[12].yhat.values[-12:]))
+        self.assertTrue(np.array_equal(origin.y.values, data.sessions.values[50:62]))
+        ##
+        # A horizon that isn't whole cycles is cut to them, every forecast is scored against the actual of its own date
+        ##
+        errors = backtest(data, m = 12, h = 18, origins = [40], comb = "OLS")
+        self.assertEqual(list(errors.step.unique()), list(range(1, 13)))
+        actualDates = data.day.values[40 + errors.step.values - 1]
+        self.assertTrue(np.array_equal(errors.ds.values, actualDates))
+        self.assertTrue(np.array_equal(errors.y.values, data.sessions.values[40 + errors.step.values - 1]))
+        ##
+        # Many origins fit in threads at once leave stdout as it was
+        ##
+        stdout = sys.stdout
+        backtest(data, m = 12, h = 12, origins = list(range(40, 50)), executor = "thread", n_jobs = 8)
+        self.assertIs(sys.stdout, stdout)
+        self.assertFalse(sys.stdout.closed)
+        with self.assertRaises(SystemExit):
+            backtest(data, m = 12, h = 12, origins = [10])
+    
+    def testCombList(self):
+        ##
+        # A list of combs is reconciled from one fit and matches running lastF once per comb
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        combs = ["BU", "OLS", "WLSS", "WLSV"]
+        allDicts = lastF(data.copy(), m = 12, h = 24, comb = combs)
+        self.assertEqual(list(allDicts.keys()), combs)
+        for comb in combs:
+            myDict = lastF(data.copy(), m = 12, h = 24, comb = comb)
+            for key in myDict.keys():
+                self.assertTrue(np.allclose(allDicts[comb][key].yhat, myDict[key].yhat))
+        self.assertTrue(np.allclose(allDicts["BU"][1].yhat.values[-2:], allDicts["BU"][12].yhat.values[-24:].reshape((2, 12)).sum(axis = 1)))
+        ##
+        # reconcile doesn't change the forecasts it is given
+        ##
+        forecastsDict = {key : pd.DataFrame({"yhat" : np.random.rand(3*key)}) for key in [1, 2, 3, 4, 6, 12]}
+        before = {key : forecastsDict[key].yhat.values.copy() for key in forecastsDict.keys()}
+        reconcile(forecastsDict, 12, None, None, "OLS")
+        for key in forecastsDict.keys():
+            self.assertTrue(np.array_equal(forecastsDict[key].yhat.values, before[key]))
+    
+    def testCopyOnWrite(self):
+        ##
+        # The levels share memory with the series but can't be used to change it, and lastF leaves its input alone
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date.strftime("%Y-%m-%d"), columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1)).astype(float)
+        before = data.copy()
+        aggs = aggHier(data, m = 12)
+        self.assertTrue(np.shares_memory(aggs[12].y.values, data.sessions.values))
+        with self.assertRaises(ValueError):
+            aggs[12].iloc[0, 1] = 0
+        lastF(data, m = 12, h = 12, comb = "OLS", transform = "BoxCox")
+        self.assertTrue(data.equals(before))
+    
+    def testTransform(self):
+        ##
+        # Lambdas are estimated per level, handed back, and reused without changing the forecasts
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        filters = list(warnings.filters)
+        lambdas = {}
+        myDict = lastF(data, m = 12, h = 12, comb = "OLS", transform = "BoxCox", lambdas = lambdas, executor = "thread", n_jobs = 2)
+        self.assertEqual(sorted(lambdas.keys()), [1, 2, 3, 4, 6, 12])
+        self.assertEqual(list(warnings.filters), filters)
+        cached = lastF(data, m = 12, h = 12, comb = "OLS", transform = "BoxCox", lambdas = dict(lambdas))
+        for key in myDict.keys():
+            self.assertTrue(np.allclose(myDict[key].yhat, cached[key].yhat, equal_nan = True))
+        ##
+        # The inverse transforms every component column and leaves the input alone
+        ##
+        frame = pd.DataFrame({"ds" : date[:5], "yhat" : np.arange(1.0, 6.0), "trend" : np.arange(2.0, 7.0), "other" : np.arange(5.0)})
+        inverted = inverseLevels({1 : frame}, [0.5])[1]
+        self.assertTrue(np.allclose(inverted.yhat, inv_boxcox(frame.yhat.values, 0.5)))
+        self.assertTrue(np.allclose(inverted.trend, inv_boxcox(frame.trend.values, 0.5)))
+        self.assertTrue(np.array_equal(inverted.other, frame.other))
+        self.assertTrue(np.array_equal(frame.yhat, np.arange(1.0, 6.0)))
+        
+    def testProfiler(self):
+        ##
+        # Every stage and every level is recorded, the callback sees each record as it is made
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        seen = []
+        profiler = Profiler(memory = True, callback = seen.append)
+        lastF(data, m = 12, h = 12, comb = ["BU", "OLS"], profiler = profiler)
+        report = profiler.report()
+        self.assertEqual(len(seen), len(report))
+        self.assertTrue({"aggregate", "fitProphet", "fit", "predict", "reconcile"} <= set(report.stage))
+        self.assertEqual(sorted(report[report.stage == "fit"].level), [1, 2, 3, 4, 6, 12])
+        self.assertEqual(list(report[report.stage == "reconcile"].comb), ["BU", "OLS"])
+        self.assertTrue((report.wall >= 0).all())
+        self.assertTrue((report.peak >= 0).all())
+        
+    def testFutureOnly(self):
+        ##
+        # Without include_history only the periods ahead are predicted, and they are the same forecasts
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        full = lastF(data, m = 12, h = 24, comb = ["OLS", "WLSV"])
+        future = lastF(data, m = 12, h = 24, comb = ["OLS", "WLSV"], include_history = False)
+        for method in ["OLS", "WLSV"]:
+            for key in full[method].keys():
+                self.assertEqual(len(future[method][key]), 2*key)
+                self.assertTrue(np.allclose(future[method][key].yhat.values, full[method][key].yhat.values[-2*key:]))
+        ##
+        # mse and resids are only worked out when asked for
+        ##
+        aggs = aggHier(data, 12)
+        args = (False, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+        fcst, mse, resids = fitProphet(aggs, 12, *args, residuals = False)
+        self.assertTrue(all(mse[key] is None and resids[key] is None for key in aggs.keys()))
+        fcst, mse, resids = fitProphet(aggs, 12, *args)
+        self.assertTrue(all(len(resids[key]) == len(aggs[key]) for key in aggs.keys()))
+        with self.assertRaises(SystemExit):
+            reconcile(fcst, 12, {key : None for key in aggs.keys()}, None, "WLSV")
+        
+    def testCompact(self):
+        ##
+        # The compact result keeps the same forecasts as arrays, and survives a round trip through .npz
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        full = lastF(data, m = 12, h = 12, comb = "OLS")
+        compact = lastF(data, m = 12, h = 12, comb = "OLS", compact = ["yhat_lower", "trend", "missing"])
+        self.assertIsInstance(compact, LastResult)
+        self.assertEqual(sorted(compact.keys()), sorted(full.keys()))
+        for key in full.keys():
+            self.assertEqual(compact[key].columns, ["ds", "yhat", "yhat_lower", "trend"])
+            self.assertTrue(np.allclose(compact[key].yhat, full[key].yhat.values))
+            self.assertTrue(np.array_equal(compact[key]["ds"], full[key].ds.values))
+            self.assertTrue(compact[key].yhat.flags["C_CONTIGUOUS"])
+        frames = compact.toFrames()
+        self.assertTrue(np.allclose(frames[12].trend.values, full[12].trend.values))
+        self.assertTrue(compact.nbytes < sum(frame.memory_usage().sum() for frame in full.values()))
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + "/result.npz"
+            compact.toNpz(path)
+            loaded = LastResult.fromNpz(path)
+        self.assertEqual(sorted(loaded.keys()), sorted(compact.keys()))
+        for key in compact.keys():
+            self.assertEqual(loaded[key].columns, compact[key].columns)
+            self.assertTrue(np.array_equal(loaded[key].yhat, compact[key].yhat))
+            self.assertTrue(np.array_equal(loaded[key].ds, compact[key].ds))
+        long = compact.toFrame()
+        self.assertEqual(len(long), sum(len(level) for level in compact.values()))
+        self.assertTrue(np.array_equal(LastResult.fromFrame(long)[4].yhat, compact[4].yhat))
+        
+    def testPersist(self):
+        ##
+        # A saved forecaster loads back and predicts any horizon without refitting
+        ##
+        date = pd.date_range("2013-01-01", "2017-12-31", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        forecaster = LastForecaster(m = 12, h = 12, comb = "WLSS", transform = "BoxCox")
+        myDict = forecaster.fit(data.iloc[:-1])
+        self.assertEqual(sorted(forecaster.lambdas.keys()), [1, 2, 3, 4, 6, 12])
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + "/forecaster.pkl"
+            forecaster.save(path)
+            loaded = LastForecaster.load(path)
+        for key in myDict.keys():
+            self.assertTrue(np.allclose(loaded.predict(12)[key].yhat.values, myDict[key].yhat.values, equal_nan = True))
+        longer = loaded.predict(36)
+        for key in longer.keys():
+            self.assertEqual(len(longer[key]) - len(myDict[key]), 2*key)
+        self.assertEqual(loaded.refit, [1, 2, 3, 4, 6, 12])
+        ##
+        # New observations are transformed with the lambdas found by fit
+        ##
+        loaded.update(data.iloc[-1:])
+        self.assertEqual(loaded.refit, [12])
+        self.assertAlmostEqual(loaded.data[12].y.values[-1], boxcox(data.sessions.values[-1:].astype(float), loaded.lambdas[12])[0])
+        
+    def testAsync(self):
+        ##
+        # The same forecasts as lastF, overlapping identical requests share one computation, and levels can time out
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        myDict = lastF(data, m = 12, h = 12, comb = "WLSS")
+        async def run():
+            async with AsyncLast("thread", n_jobs = 2, max_fits = 2) as service:
+                first, second = await asyncio.gather(service.lastF(data, m = 12, h = 12, comb = "WLSS"), \
+                                                     service.lastF(data, m = 12, h = 12, comb = "WLSS"))
+                self.assertIs(first, second)
+                self.assertEqual(service.inflight, {})
+                for key in myDict.keys():
+                    self.assertTrue(np.allclose(first[key].yhat.values, myDict[key].yhat.values))
+                params = {}
+                await service.lastF(data, m = 12, h = 12, comb = ["OLS", "WLSV"], params = params)
+                self.assertEqual(sorted(params.keys()), [1, 2, 3, 4, 6, 12])
+                with self.assertRaises(asyncio.TimeoutError):
+                    await service.lastF(data, m = 12, h = 12, level_timeout = 0)
+                ##
+                # Bad inputs raise ValueError in the request that made them, the others carry on
+                ##
+                with self.assertRaises(ValueError):
+                    await service.lastF(data, m = 1, h = 12)
+                outcomes = await asyncio.gather(service.lastF(data, m = 12, h = 6), service.lastF(data, m = 13, h = 13), \
+                                                service.lastF(data, m = 12, h = 12, backend = "missing"), \
+                                                service.lastF(data, m = 12, h = 12, comb = "WLSS"), return_exceptions = True)
+                self.assertTrue(all(isinstance(outcome, ValueError) for outcome in outcomes[:3]))
+                self.assertIsInstance(outcomes[3], dict)
+            return await lastFAsync(data, m = 12, h = 12, comb = "WLSS")
+        shared = asyncio.run(run())
+        for key in myDict.keys():
+            self.assertTrue(np.allclose(shared[key].yhat.values, myDict[key].yhat.values))
+        
+    def testBackends(self):
+        ##
+        # The NumPy backends keep fitProphet's contract, and can be mixed with Prophet level by level
+        ##
+        date = pd.date_range("2013-01-01", "2017-12-31", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        t = np.arange(len(date))
+        data["sessions"] = 1000 + 5*t + 100*np.sin(2*np.pi*t/12)
+        aggs = aggHier(data, 12)
+        args = (True, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+        fcst, mse, resids = fitProphet(aggs, 12, *args, backend = "naive")
+        self.assertTrue(np.array_equal(fcst[12].yhat.values[-12:], aggs[12].iloc[-12:, 1].values))
+        self.assertEqual(len(fcst[12]), len(aggs[12]) + 12)
+        self.assertEqual(len(resids[4]), len(aggs[4]))
+        fcst, mse, resids = fitProphet(aggs, 12, *args, backend = "fourier")
+        self.assertTrue(np.allclose(fcst[12].yhat.values[-12:], 1000 + 5*(t[-1] + 1 + np.arange(12)) + 100*np.sin(2*np.pi*np.arange(12)/12)))
+        self.assertTrue(mse[12] < 1e-12)
+        params = {}
+        mixed = {1 : "prophet", 12 : "prophet", 4 : lambda *level: fourierBackend(*level), "default" : "naive"}
+        myDict = lastF(data, m = 12, h = 12, comb = "WLSV", backend = mixed, params = params)
+        self.assertEqual(sorted(myDict.keys()), [1, 2, 3, 4, 6, 12])
+        self.assertIn("k", params[12])
+        self.assertIn("coef", params[4])
+        self.assertEqual(params[6], {})
+        registerBackend("drift", fourierBackend)
+        self.assertIn("drift", registeredBackends())
+        with self.assertRaises(SystemExit):
+            lastF(data, m = 12, h = 12, backend = "missing")
+        
+    def testMapEngine(self):
+        ##
+        # The NumPy MAP engine matches Prophet's fit, solves the levels in one batch the same as one at a time, and its
+        # params have Prophet's shape
+        ##
+        date = pd.date_range("2008-01-01", "2017-12-31", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        t = np.arange(len(date))
+        data["sessions"] = 1000 + 5*t + 100*np.sin(2*np.pi*t/12) + 10*np.random.RandomState(1).randn(len(t))
+        aggs = aggHier(data, 12)
+        args = (True, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+        prophetParams = {}
+        mapParams = {}
+        prophetFcst = fitProphet(aggs, 12, *args, params = prophetParams)[0]
+        mapFcst, mse, resids = fitProphet(aggs, 12, *args, params = mapParams, backend = "map")
+        for key in aggs.keys():
+            scale = aggs[key].iloc[:, 1].abs().max()
+            n = len(aggs[key])
+            self.assertTrue(np.max(np.abs(mapFcst[key].yhat.values[:n] - prophetFcst[key].yhat.values[:n])) < 1e-3*scale)
+            if key > 2:     # the yearly and half yearly levels have too few years to pin down the trend out of sample
+                self.assertTrue(np.max(np.abs(mapFcst[key].yhat.values - prophetFcst[key].yhat.values)) < 1e-3*scale)
+            self.assertEqual(sorted(mapParams[key].keys()), sorted(prophetParams[key].keys()))
+            for name in ["delta", "beta"]:
+                self.assertEqual(len(mapParams[key][name]), len(prophetParams[key][name]))
+        self.assertTrue(np.allclose(mapFcst[12].trend + mapFcst[12].seasonal, mapFcst[12].yhat))
+        single = fitProphet(aggs, 12, *args, backend = {"default" : "map"})[0]
+        warm = fitProphet(aggs, 12, *args, init = mapParams, backend = "map")[0]
+        for key in aggs.keys():
+            self.assertTrue(np.allclose(single[key].yhat, mapFcst[key].yhat))
+            self.assertTrue(np.allclose(warm[key].yhat, mapFcst[key].yhat))
+        myDict = lastF(data, m = 12, h = 12, comb = "WLSV", backend = "map")
+        self.assertEqual(sorted(myDict.keys()), [1, 2, 3, 4, 6, 12])
+        
+    def testWorkers(self):
+        ##
+        # A warm WorkerPool gives the same forecasts as a serial run, for the levels of one series and for a batch
+        ##
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["a"] = np.random.randint(100,40000,size=(len(date),1))
+        data["b"] = np.random.randint(100,40000,size=(len(date),1))
+        message = packFrame(data[["day", "a"]])
+        unpacked = unpackFrame(message)
+        self.assertEqual(list(unpacked.columns), ["day", "a"])
+        self.assertTrue(unpacked.day.equals(data.day) and np.array_equal(unpacked.a, data.a))
+        serial = lastF(data[["day", "a"]], m = 12, h = 12, comb = "WLSV")
+        with WorkerPool(n_jobs = 2) as pool:
+            profiler = Profiler()
+            pooled = lastF(data[["day", "a"]], m = 12, h = 12, comb = "WLSV", executor = pool, profiler = profiler)
+            batch = {name : newDict for name, newDict, error in lastBatch(data, m = 12, h = 12, comb = "WLSV", executor = pool)}
+        self.assertEqual(sorted(pooled.keys()), sorted(serial.keys()))
+        for key in serial.keys():
+            self.assertEqual(list(pooled[key].columns), list(serial[key].columns))
+            self.assertTrue(np.allclose(pooled[key].yhat, serial[key].yhat))
+            self.assertTrue(np.allclose(batch["a"][key].yhat, serial[key].yhat))
+        self.assertEqual(len([record for record in profiler.records if record["stage"] == "fit"]), len(serial))
+        
+    def testScheduler(self):
+        ##
+        # Big tasks go first on their own, small ones are packed together, and the levels come back in the order of aggs
+        ##
+        chunks = packChunks([1, 100, 2, 50, 1, 1], 2)
+        self.assertEqual(chunks[0], [1])
+        self.assertEqual(chunks[1], [3])
+        self.assertEqual(sorted(sum(chunks, [])), list(range(6)))
+        self.assertEqual(len(chunks), 3)
+        date = pd.date_range("2013-04-02", "2017-07-17", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        aggs = aggHier(data, 12)
+        args = (True, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+        costs = {}
+        serial = fitProphet(aggs, 12, *args)[0]
+        pooled = fitProphet(aggs, 12, *args, executor = "thread", n_jobs = 2, costs = costs)[0]
+        self.assertEqual(list(pooled.keys()), list(aggs.keys()))
+        for key in aggs.keys():
+            self.assertTrue(np.allclose(pooled[key].yhat, serial[key].yhat))
+        self.assertEqual(sorted(costs.keys()), sorted(aggs.keys()))
+        self.assertTrue(costs[12]["predicted"] > costs[1]["predicted"])
+        secondsPerUnit, ratios = calibrate(costs)
+        self.assertTrue(secondsPerUnit > 0)
+        self.assertEqual(sorted(ratios.keys()), sorted(aggs.keys()))
+        ##
+        # The levels solved together by the MAP engine are timed too
+        ##
+        costs = {}
+        fitProphet(aggs, 12, *args, backend = "map", costs = costs)
+        self.assertEqual(sorted(costs.keys()), sorted(aggs.keys()))
+        self.assertTrue(all(cost["actual"] > 0 for cost in costs.values()))
+        timed = {1 : {"predicted" : 10.0, "actual" : 2.0}, 2 : {"predicted" : 10.0, "actual" : 6.0}}
+        self.assertTrue(np.allclose(learnedCosts([1, 2, 3], [10.0, 10.0, 7.0], timed), [5.0, 15.0, 7.0]))
+        
+    def testBudget(self):
+        ##
+        # A level that runs out of time is forecast with seasonal naive, listed in fallbacks, and still reconciled
+        ##
+        date = pd.date_range("2013-01-01", "2017-12-31", freq = "M")
+        data = pd.DataFrame(date, columns = ["day"])
+        data["sessions"] = np.random.randint(100,40000,size=(len(date),1))
+        def slowBackend(*args):
+            time.sleep(1)
+            return fourierBackend(*args)
+        backend = {1 : slowBackend, "default" : "fourier"}
+        fallbacks = {}
+        forecast = lastF(data, m = 12, h = 12, backend = backend, level_budget = 0.2, fallbacks = fallbacks)
+        self.assertEqual(fallbacks, {1 : "level_budget"})
+        self.assertEqual(len(forecast), 6)
+        self.assertFalse(forecast[12].yhat[-12:].isnull().any() or np.isnan(forecast[1].yhat.values[-1]))
+        aggs = aggHier(data, 12)
+        args = (True, None, None, None, 25, True, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+        naive = fitProphet(aggs, 12, *args, backend = "naive")[0]
+        for executor in ["serial", "thread"]:
+            fallbacks = {}
+            budgeted = fitProphet(aggs, 12, *args, executor = executor, n_jobs = 2, backend = backend, level_budget = {1 : 0.2}, \
+                                  fallbacks = fallbacks)[0]
+            self.assertEqual(list(budgeted.keys()), list(aggs.keys()))
+            self.assertEqual(fallbacks, {1 : "level_budget"})
+            self.assertTrue(np.allclose(budgeted[1].yhat, naive[1].yhat, equal_nan = True))
+        fallbacks = {}
+        budgeted = fitProphet(aggs, 12, *args, backend = backend, time_budget = 0, fallbacks = fallbacks)[0]
+        self.assertEqual(fallbacks, {key : "time_budget" for key in aggs.keys()})
+        for key in aggs.keys():
+            self.assertTrue(np.allclose(budgeted[key].yhat, naive[key].yhat, equal_nan = True))
+        ##
+        # The MAP engine keeps to a budget too, its levels are then solved one at a time
+        ##
+        fallbacks = {}
+        batched = fitProphet(aggs, 12, *args, backend = "map")[0]
+        budgeted = fitProphet(aggs, 12, *args, backend = "map", level_budget = 60, fallbacks = fallbacks)[0]
+        self.assertEqual(fallbacks, {})
+        for key in aggs.keys():
+            self.assertTrue(np.allclose(budgeted[key].yhat, batched[key].yhat, rtol = 1e-4))
+        fitProphet(aggs, 12, *args, backend = "map", time_budget = 0, fallbacks = fallbacks)
+        self.assertEqual(fallbacks, {key : "time_budget" for key in aggs.keys()})
+        ##
+        # Budgeted levels run in threads, so they are only timed rather than having Stan's output caught at the file descriptor
+        ##
+        profiler = Profiler()
+        fitProphet(aggs, 12, *args, profiler = profiler, level_budget = 60)
+        fits = profiler.report()
+        self.assertEqual(len(fits[fits.stage == "fit"]), len(aggs))
+        self.assertNotIn("iterations", fits.columns)
         
         
 if __name__ == '__main__':
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds the BoxCox transform stage of lastF and its inverse, which reconcile applies to the base forecasts.
+
+Each aggregation level gets its own lambda.  The levels are independent, so their lambdas are estimated in parallel,
+and a level that scipy's boxcox can't deal with falls back to a natural log transform on its own.  Lambdas can be
+handed back in from an earlier run, in which case the maximum likelihood estimation is skipped for those levels.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import numpy as np
+from scipy.stats import boxcox
+from scipy.special import inv_boxcox
+from lastprophet.aggHier import readOnly
+from lastprophet.parallel import mapTasks
+
+##
+# The columns of Prophet's forecast that are on the scale of y, and so are transformed back
+##
+COMPONENTS = ["yhat", "yhat_lower", "yhat_upper", "trend", "trend_lower", "trend_upper", "seasonal", "weekly", "yearly", "holidays"]
+
+def boxcoxLevel(key, values, lmbda = None):
+    """
+    Parameters
+    ----------
+
+    key - (int) the aggregation level
+
+    values - (numpy array) the values of the level, they must be positive
+
+    lmbda - (float or None) the lambda to use, if None it is estimated by maximum likelihood
+
+    Returns
+    ----------
+
+    key - (int) the aggregation level, so results can be matched up
+
+    transformed - (numpy array) the transformed values
+
+    lmbda - (float) the lambda that was used, 0 if scipy's boxcox couldn't deal and a natural log transform was used instead
+
+    fellBack - (Boolean) True if the natural log transform was used because the estimation failed
+    """
+    ##
+    # Floating point problems (overflow in the likelihood for example) are errors in here instead of warnings.  numpy's
+    # error state is per thread, so unlike the warnings filters it can be changed while other levels are transformed
+    ##
+    try:
+        with np.errstate(over = 'raise', divide = 'raise', invalid = 'raise'):
+            if lmbda is None:
+                transformed, lmbda = boxcox(values)
+            else:
+                transformed = boxcox(values, lmbda = lmbda)
+        if np.isfinite(lmbda) and np.all(np.isfinite(transformed)):
+            return key, transformed, lmbda, False
+    except FloatingPointError:
+        pass
+
+    return key, boxcox(values, lmbda = 0), 0, True
+
+def transformLevels(levels, lambdas = None, executor = "serial", n_jobs = None):
+    """
+    Parameters
+    ----------
+
+    levels - (dict of Levels) the aggregated data, see aggHier.aggArrays
+
+    lambdas - (dict or None) aggregation level : lambda from an earlier run.  Those levels reuse their lambda, the rest
+               are estimated
+
+    executor, n_jobs - how the levels are transformed, see parallel.getExecutor
+
+    Returns
+    ----------
+
+    levels - (dict of Levels) new Levels with the transformed values, the input is left alone
+
+    lambdas - (dict) aggregation level : the lambda used for every level
+
+    fellBack - (list) the levels that were log transformed because scipy's boxcox couldn't deal with them
+    """
+    if lambdas is None:
+        lambdas = {}
+    tasks = [(key, levels[key].y, lambdas.get(key)) for key in levels.keys()]
+    newLevels = {}
+    newLambdas = {}
+    fellBack = []
+    for key, transformed, lmbda, failed in mapTasks(boxcoxLevel, tasks, executor, n_jobs):
+        newLevels[key] = levels[key]._replace(y = readOnly(transformed))
+        newLambdas[key] = lmbda
+        if failed:
+            fellBack.append(key)
+
+    return newLevels, newLambdas, fellBack
+
+def inverseLevels(forecastsDict, lambdas):
+    """
+    Parameters
+    ----------
+
+    forecastsDict - (dict of DataFrames) forecasts on the transformed scale, see fitProphet
+
+    lambdas - (dict or list) aggregation level : lambda, or a list of lambdas in ascending order of the levels
+
+    Returns
+    ----------
+
+    forecastsDict - (dict of DataFrames) the forecasts on the original scale.  Every component column of a level is
+                     transformed back in one pass, and only those columns are replaced, so the rest are still shared with the input
+    """
+    if not isinstance(lambdas, dict):
+        lambdas = dict(zip(sorted(forecastsDict.keys()), lambdas))
+    newDict = {}
+    for key in forecastsDict.keys():
+        frame = forecastsDict[key].copy(deep = False)
+        columns = [column for column in COMPONENTS if column in frame.columns]
+        inverted = inv_boxcox(np.asarray(frame[columns].values, dtype = float), lambdas[key])
+        for i, column in enumerate(columns):
+            frame[column] = inverted[:, i]
+        newDict[key] = frame
+
+    return newDict
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+This file holds a pool of long-lived worker processes for programs that call lastF (or lastBatch) many times.
+
+executor = "process" starts a new pool for every call, and every new process has to import pandas, fbprophet and
+Stan and load the compiled Stan model before its first fit.  A WorkerPool is started once and warmed up (each worker
+makes one small fit as it starts), then handed to every call as the executor:
+
+    with WorkerPool(n_jobs = 4) as pool:
+        for y in series:
+            forecast = lastF(y, m = 12, h = 24, executor = pool)
+
+Levels are sent to the workers (longest first, see scheduler.py) as plain arrays (the int64 time stamps and float64 values of the level, see packFrame)
+rather than pickled DataFrames, and the forecasts come back as results.LevelResult arrays, so each message is only the
+numbers plus a few names.  Any other work (lastBatch series, BoxCox) is run in the same warm workers like in any
+concurrent.futures Executor.
+
+Credit to Rob J. Hyndman and research partners as much of the code was developed with the help of their work
+https://www.otexts.org/fpp
+https://robjhyndman.com/publications/
+Credit to Facebook and their fbprophet package
+https://facebookincubator.github.io/prophet/
+It was my intention to make some of the code look similar to certain sections in the Prophet and (Hyndman's) hts packages
+
+"""
+import os
+import contextlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import Executor, ProcessPoolExecutor
+from lastprophet.results import LevelResult, LastResult
+from lastprophet.scheduler import taskCost, scheduleTasks
+
+def packFrame(frame):
+    """
+    Parameters
+    ----------
+
+    frame - (DataFrame) two columns, time instances then values, eg. an aggregation level (see aggHier) or a series
+
+    Returns
+    ----------
+
+    message - (tuple) the column names, the time instances as int64 nanoseconds and the values as float64
+    """
+    ds = np.asarray(pd.DatetimeIndex(frame.iloc[:, 0]).asi8)
+    return (frame.columns[0], frame.columns[1]), ds, np.asarray(frame.iloc[:, 1].values, dtype = float)
+
+def unpackFrame(message):
+    """
+    Parameters
+    ----------
+
+    message - (tuple) see packFrame
+
+    Returns
+    ----------
+
+    frame - (DataFrame) the frame that was packed
+    """
+    (dateCol, valueCol), ds, values = message
+    return pd.DataFrame({dateCol : ds.view('datetime64[ns]'), valueCol : values})
+
+def warmWorker():
+    """
+    Run once as each worker starts.  A small fit imports fbprophet and loads the compiled Stan model (and whatever Stan
+    and numpy set up on their first call), so the fits sent to the worker don't pay for it
+    """
+    from lastprophet.fitProphet import fitModel
+    t = np.arange(60)
+    data = pd.DataFrame({"ds" : pd.date_range("2000-01-01", periods = len(t), freq = "D"), "y" : 10 + np.sin(2*np.pi*t/7)})
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        fitModel(data, "D", None, None, None, 25, False, 'auto', None, 10.0, 10.0, 0.05, 0, 0.80, 0)
+
+def fitPacked(key, message, task):
+    """
+    Parameters
+    ----------
+
+    key - (int) the aggregation level
+
+    message - (tuple) the level, see packFrame
+
+    task - (tuple) every other argument of fitProphet.fitLevel, in order
+
+    Returns
+    ----------
+
+    key, fcst, mse, resids, params, records - see fitProphet.fitLevel, with fcst a LevelResult holding every column of the forecast
+    """
+    from lastprophet.fitProphet import fitLevel
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        key, fcst, mse, resids, params, records = fitLevel(key, unpackFrame(message), *task)
+    return key, packForecasts({key : fcst})[key], mse, resids, params, records
+
+def packForecasts(forecastsDict):
+    """
+    The forecasts of every level (see lastF) as a results.LastResult with all their columns, or as they are if they
+    aren't a plain dict of DataFrames (eg. a LastResult already, or one dict per comb)
+    """
+    if type(forecastsDict) is not dict or not all(isinstance(fcst, pd.DataFrame) for fcst in forecastsDict.values()):
+        return forecastsDict
+    return LastResult((key, LevelResult(key, fcst.ds.values, {column : fcst[column].values for column in fcst.columns if column != "ds"})) \
+                      for key, fcst in forecastsDict.items())
+
+def forecastPacked(name, message, m, h, comb, aggList, kwargs, projection = None):
+    """
+    batch.forecastSeries for a series sent as arrays (see packFrame).  The forecasts go back packed, see packForecasts
+    """
+    from lastprophet.batch import forecastSeries
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        name, newDict, error = forecastSeries(name, unpackFrame(message), m, h, comb, aggList, kwargs, projection)
+    return name, packForecasts(newDict), error
+
+def unpackSeries(result, kwargs):
+    """
+    The output of forecastPacked back in the form batch.forecastSeries gives, DataFrames unless kwargs asked for compact
+    """
+    name, newDict, error = result
+    if isinstance(newDict, LastResult) and not kwargs.get("compact", False):
+        newDict = newDict.toFrames()
+    return name, newDict, error
+
+class WorkerPool(Executor):
+    """
+    Parameters
+    ----------
+
+    n_jobs - (int or None) the number of worker processes, None uses the number of processors
+
+    warm - (Boolean) make one small fit in every worker as it starts (Default), see warmWorker
+
+    """
+    def __init__(self, n_jobs = None, warm = True):
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers = self.n_jobs, initializer = warmWorker if warm else None)
+        if warm:
+            ##
+            # Start every worker now rather than when the first fits arrive
+            ##
+            for future in [self.pool.submit(os.getpid) for i in range(self.n_jobs)]:
+                future.result()
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait = True, **kwargs):
+        self.pool.shutdown(wait = wait, **kwargs)
+
+    def fitLevels(self, tasks, costs = None, report = None):
+        """
+        Parameters
+        ----------
+
+        tasks - (list of tuples) the arguments of fitProphet.fitLevel for every level, see fitProphet.levelTasks
+
+        costs - (list or None) the predicted cost of every task, None works them out, see scheduler.taskCost
+
+        report - (list or None) see scheduler.scheduleTasks
+
+        Returns
+        ----------
+
+        results - (list) what fitLevel returns for every task, in the same order
+        """
+        if costs is None:
+            costs = [taskCost(task) for task in tasks]
+        packed = [(task[0], packFrame(task[1]), task[2:]) for task in tasks]
+        results = []
+        for key, fcst, mse, resids, params, records in scheduleTasks(fitPacked, packed, costs, self, report = report):
+            results.append((key, fcst.toFrame(), mse, resids, params, records))
+        return results
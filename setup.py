@@ -16,5 +16,6 @@ setup(name = 'lastprophet',
               'matplotlib',
               'pandas>=0.18.1',
               'numpy',
+              'scipy',
               'fbprophet'],
        )
\ No newline at end of file